@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import cv2
+import numpy as np
+from cache import DTM_CACHE, DTM_CACHE_BYTES, FileCache, file_digest
+from dtm import PARSER_VERSION, DTMSource
+from frame_map import FrameMap, read_lag_file
+from seek_index import SeekIndex
+from util import log, err
+from video_source import dump_parts, open_video, split_frames
+
+#############
+# Alignment #
+#############
+# lines a frame dump up with its movie. dumps often start a few frames before or after the
+# movie does, and lag shows up in them as the same frame twice in a row.
+#
+# every frame is shrunk to a tiny grayscale thumbnail and compared with the one before it,
+# split into ranges that are decoded by a pool of processes. a frame that barely differs
+# from the last is a duplicate. the offset is then found by cross-correlating (with an fft,
+# so every offset is tried at once) what the video does with what the movie does:
+#   - how much the picture changes against when the inputs change, a few frames later
+#   - the duplicate frames against the movie's lag frames, when a .dtm.lag file says where
+#     they are
+# and the duplicates are used as the movie's lag frames when there are about as many of
+# them as the header says. the result is saved next to the video as <video>.sync.json and
+# picked up by the player and render_video.
+#
+#   python align.py framedump0.avi movie.dtm [--jobs 4]
+
+SYNC_VERSION = 1
+THUMB_SIZE = (32, 18)       # width, height of the thumbnails frames are compared at
+DUPLICATE_THRESHOLD = 1.0   # mean difference (out of 255) under which a frame is a duplicate
+MAX_OFFSET = 600            # furthest the video can be from the movie, in frames either way
+INPUT_LATENCY = 2           # frames between an input changing and the picture reacting
+# the duplicates only count as lag if there are about as many as the header has lag frames
+LAG_TOLERANCE = 0.25
+
+def sync_path(video) -> Path:
+    return Path(f"{video}.sync.json")
+
+def thumbnail(frame: np.ndarray) -> np.ndarray:
+    # skipping pixels down to about 4 per thumbnail pixel first makes the resize ~5x cheaper
+    # and still averages out compression noise
+    w, h = THUMB_SIZE
+    step = max(1, min(frame.shape[0] // (h * 4), frame.shape[1] // (w * 4)))
+    small = cv2.resize(frame[::step, ::step], THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+def dtm_key(source: DTMSource) -> str:
+    # the cache key already has the movie's digest, only hash it again without a cache
+    return source.key or f"{file_digest(source.path)}-v{PARSER_VERSION}"
+
+def frame_differences(video: str, start: int, end: int, keyframe: int = None) -> np.ndarray:
+    """
+    mean difference of each frame in [start, end) from the frame before it, the first
+    frame of the video has none so it's inf. keyframe is a keyframe at or before the frame
+    before start to seek to, like render_part. runs in a worker process
+    """
+    cap = open_video(video)
+    differences = np.full(end - start, np.inf, dtype=np.float32)
+    try:
+        # the frame before the range, to compare the first one with
+        first = max(0, start - 1)
+        position = first if keyframe is None else keyframe
+        if position > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        while position < first and cap.grab():
+            position += 1
+        previous = None
+        frame = None
+        for index in range(first, end):
+            ret, frame = cap.read(frame)
+            if not ret:
+                break
+            current = thumbnail(frame)
+            if previous is not None and index >= start:
+                differences[index - start] = np.abs(current - previous).mean()
+            previous = current
+    finally:
+        cap.release()
+    return differences
+
+def video_differences(video: str, jobs: int = 0) -> tuple[np.ndarray, float]:
+    """
+    frame_differences for the whole video, and its fps
+    """
+    cap = open_video(video)
+    if not cap.isOpened():
+        raise RuntimeError(f"Unable to open video: {video}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    if total <= 0:
+        return np.zeros(0, dtype=np.float32), fps
+    jobs = jobs or os.cpu_count() or 1
+    # a few ranges per process so one slow range doesn't leave the others idle at the end
+    ranges = split_frames(total, jobs * 4)
+    # split dumps seek within whichever part the frame is in already
+    index = SeekIndex.for_video(video) if len(dump_parts(video)) == 1 else None
+    keyframes = [None if index is None else index.keyframe_before(max(0, start - 1)) for start, _ in ranges]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parts = pool.map(frame_differences, [video] * len(ranges), *zip(*ranges), keyframes)
+        return np.concatenate(list(parts)), fps
+
+def input_changes(port_inputs: list[np.ndarray], frame_polls: np.ndarray) -> np.ndarray:
+    """
+    whether any poll on each movie frame differs from the one before it, on any port
+    """
+    polls = min(len(inputs) for inputs in port_inputs) if port_inputs else 0
+    changed = np.zeros(polls, dtype=bool)
+    for inputs in port_inputs:
+        words = inputs[:polls].view("<u8")
+        changed[1:] |= words[1:] != words[:-1]
+    starts = np.asarray(frame_polls, dtype=np.intp)
+    covered = int(np.searchsorted(starts, polls))
+    changes = np.zeros(len(starts), dtype=bool)
+    if covered > 0:
+        changes[:covered] = np.logical_or.reduceat(changed, starts[:covered])
+    return changes
+
+def lag_frames(frame_polls: np.ndarray) -> np.ndarray:
+    """
+    movie frames that show the same poll as the frame before them
+    """
+    lag = np.zeros(len(frame_polls), dtype=bool)
+    lag[1:] = frame_polls[1:] == frame_polls[:-1]
+    return lag
+
+def correlate(video: np.ndarray, movie: np.ndarray, max_offset: int) -> np.ndarray:
+    """
+    the normalised correlation of two signals at every offset in [-max_offset, max_offset],
+    where offset is the video frame the movie's first frame is on. 0 where either is flat
+    """
+    video = video.astype(np.float64)
+    movie = movie.astype(np.float64)
+    offsets = np.arange(-max_offset, max_offset + 1)
+    if len(video) < 2 or len(movie) < 2 or video.std() == 0 or movie.std() == 0:
+        return np.zeros(len(offsets))
+    video = (video - video.mean()) / video.std()
+    movie = (movie - movie.mean()) / movie.std()
+    n = 1 << int(len(video) + len(movie)).bit_length()
+    # sums of video[g + offset] * movie[g] for every offset, negative ones wrap to the end
+    sums = np.fft.irfft(np.fft.rfft(video, n) * np.conj(np.fft.rfft(movie, n)), n)[offsets % n]
+    overlap = np.minimum(len(movie), len(video) - offsets) - np.maximum(0, -offsets)
+    return np.where(overlap > 0, sums / np.maximum(overlap, 1), 0.0)
+
+class SyncMap():
+    """
+    how a video lines up with a movie: the video frame the movie's first frame is on, and
+    which video frames are duplicates of the one before
+    """
+    def __init__(self, offset: int = 0, duplicates = None, dtm_digest: str = "",
+                 video_frames: int = 0, fps: float = 0.0, score: float = 0.0):
+        self.offset = offset
+        self.duplicates = np.asarray(duplicates if duplicates is not None else [], dtype=np.int64)
+        self.dtm_digest = dtm_digest    # dtm_key of the movie it was aligned with
+        self.video_frames = video_frames
+        self.fps = fps
+        self.score = score              # peak correlation, 0 if nothing lined up
+
+    @classmethod
+    def load(cls, video):
+        """
+        the sync map saved for a video, or None if there isn't one (or it's unreadable)
+        """
+        path = sync_path(video)
+        if not path.is_file():
+            return None
+        try:
+            data = json.loads(path.read_text())
+            if data.get("version") != SYNC_VERSION:
+                log(f"Ignoring sync map from an older version: {path.name}")
+                return None
+            return cls(
+                int(data["offset"]), data["duplicates"], data["dtm"],
+                int(data["video_frames"]), float(data["fps"]), float(data["score"])
+            )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            err(f"Failed to read sync map {path.name}: {e}")
+            return None
+
+    def save(self, video):
+        path = sync_path(video)
+        path.write_text(json.dumps({
+            "version": SYNC_VERSION,
+            "dtm": self.dtm_digest,
+            "offset": self.offset,
+            "video_frames": self.video_frames,
+            "fps": self.fps,
+            "score": round(self.score, 4),
+            "duplicates": self.duplicates.tolist(),
+        }))
+        log(f"Saved sync map to: {path}")
+
+    def lag_vis(self, header, fps: float) -> np.ndarray:
+        """
+        the VIs of the movie frames the duplicates are on, for FrameMap
+        """
+        frames = self.duplicates - self.offset
+        frames = frames[frames >= 0]
+        vis_per_frame = header.vi_rate / fps
+        firsts = np.floor(frames * vis_per_frame + 1e-9).astype(np.int64)
+        lasts = np.floor((frames + 1) * vis_per_frame + 1e-9).astype(np.int64)
+        # every VI from each frame's first up to the next frame's
+        counts = lasts - firsts
+        vis = np.repeat(firsts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.unique(vis[vis < header.vi_count])
+
+def align(video: str, source: DTMSource, jobs: int = 0, max_offset: int = MAX_OFFSET) -> SyncMap:
+    """
+    works out how the video lines up with the movie in source
+    """
+    start_time = time.perf_counter()
+    differences, fps = video_differences(video, jobs)
+    log(f"Compared {len(differences)} frames in {time.perf_counter() - start_time:.1f}s")
+    duplicates = np.flatnonzero(differences < DUPLICATE_THRESHOLD)
+
+    # where the lag is doesn't matter for input changes, so the even spread is good enough
+    lag_vis = read_lag_file(source.path)
+    frame_map = FrameMap.for_source(source, fps, lag_vis=lag_vis)
+    # the picture only reacts a few frames after the inputs do
+    changes = np.concatenate((np.zeros(INPUT_LATENCY, dtype=bool), input_changes(source.port_inputs, frame_map.frame_polls)))
+    motion = np.log1p(np.where(np.isfinite(differences), differences, 0))
+    scores = correlate(motion, changes, max_offset)
+    if lag_vis is not None:
+        scores += correlate(differences < DUPLICATE_THRESHOLD, lag_frames(frame_map.frame_polls), max_offset)
+    best = int(np.argmax(scores))
+    offset = best - max_offset
+    log(f"Best offset is {offset} frames (score {scores[best]:.3f}), {len(duplicates)} duplicate frames")
+
+    # the duplicates are only the movie's lag if there are about as many as it has
+    header = source.header
+    lag_frame_count = header.lag_count * fps / header.vi_rate
+    if header.lag_count == 0 or abs(len(duplicates) - lag_frame_count) > LAG_TOLERANCE * lag_frame_count:
+        log(f"Not using duplicate frames as lag, the movie has {lag_frame_count:.0f} lag frames")
+        duplicates = duplicates[:0]
+    return SyncMap(
+        offset, duplicates, dtm_key(source), len(differences), fps, float(scores[best])
+    )
+
+def synced_frame_map(source: DTMSource, video, fps: float, frames: int = None, cache = None) -> FrameMap:
+    """
+    the frame map for a movie in a video, using the video's sync map if it was aligned with
+    this movie. a .dtm.lag file still wins over the duplicates it found
+    """
+    sync = SyncMap.load(video) if video else None
+    if sync is not None and sync.dtm_digest != dtm_key(source):
+        log("Ignoring sync map, it was made for a different DTM")
+        sync = None
+    if sync is None:
+        return FrameMap.for_source(source, fps, frames, cache)
+    lag_vis = read_lag_file(source.path)
+    if lag_vis is None and len(sync.duplicates):
+        lag_vis = sync.lag_vis(source.header, fps)
+    log(f"Using sync map, the movie starts on frame {sync.offset}")
+    return FrameMap.for_source(source, fps, frames, cache, lag_vis, sync.offset)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Line a frame dump up with its DTM")
+    parser.add_argument("video")
+    parser.add_argument("dtm")
+    parser.add_argument("--jobs", type=int, default=0, help="worker processes, defaults to the CPU count")
+    parser.add_argument("--max-offset", type=int, default=MAX_OFFSET, help="furthest offset to try, in frames")
+    args = parser.parse_args()
+    try:
+        source = DTMSource(args.dtm, FileCache(DTM_CACHE, DTM_CACHE_BYTES))
+    except (OSError, ValueError) as e:
+        err(f"Failed to read DTM file: {e}")
+        raise SystemExit(1)
+    try:
+        sync = align(args.video, source, args.jobs, args.max_offset)
+    except RuntimeError as e:
+        err(f"Alignment failed: {e}")
+        raise SystemExit(1)
+    finally:
+        source.close()
+    sync.save(args.video)
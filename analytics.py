@@ -0,0 +1,241 @@
+import argparse
+import json
+import time
+import numpy as np
+from pathlib import Path
+from dtm import BUTTONS, DTMSource
+from util import log, err
+
+#############
+# Analytics #
+#############
+# stats over a whole movie's inputs. everything works on the columns of the inputs array
+# (one numpy op per stat rather than a loop over polls), and the sticks go through lookup
+# tables indexed by the raw (x, y) bytes so there's no trig per poll. multiplayer movies
+# get the stats for each port.
+#
+#   python analytics.py movie.dtm [stats.json] [--port N]
+
+STICK_DEADZONE = 16     # how far from centre a stick has to be to count as moved
+TRIGGER_THRESHOLD = 32  # how far a trigger has to be pressed to count as pressed
+ANGLE_BINS = 16         # stick direction sectors, the first is centred on right
+TRIGGER_BINS = 16
+IDLE_STRETCHES = 5      # how many of the longest idle stretches to keep
+# the bits of the buttons field that are buttons, the ones above are always set in some movies
+BUTTON_MASK = (1 << len(BUTTONS)) - 1
+
+def _stick_luts():
+    # sector and whether it's outside the deadzone for every stick word (y << 8 | x)
+    y, x = np.meshgrid(np.arange(256) - 128, np.arange(256) - 128, indexing="ij")
+    moved = (np.abs(x) > STICK_DEADZONE) | (np.abs(y) > STICK_DEADZONE)
+    angle = np.arctan2(y, x) % (2 * np.pi)
+    sector = np.round(angle / (2 * np.pi / ANGLE_BINS)).astype(np.intp) % ANGLE_BINS
+    return moved.ravel(), sector.ravel()
+
+STICK_MOVED, STICK_SECTOR = _stick_luts()
+# trigger words are r << 8 | l
+TRIGGER_LEVELS = np.arange(1 << 16)
+TRIGGER_PRESSED = ((TRIGGER_LEVELS & 0xFF) > TRIGGER_THRESHOLD) | ((TRIGGER_LEVELS >> 8) > TRIGGER_THRESHOLD)
+
+def columns(inputs: np.ndarray):
+    """
+    the records as four little-endian words: buttons, triggers (r << 8 | l), main stick
+    and c stick (y << 8 | x). each pair of analog bytes is one word, so a whole stick or
+    both triggers can be looked up in a 65536 entry table in one go
+    """
+    words = inputs.view(np.dtype("<u2")).reshape(-1, 4)
+    return words[:, 0], words[:, 1], words[:, 2], words[:, 3]
+
+def button_presses(buttons: np.ndarray) -> np.ndarray:
+    """
+    the bits of the buttons that went down on each poll
+    """
+    previous = np.empty_like(buttons)
+    previous[0] = 0
+    previous[1:] = buttons[:-1]
+    return buttons & ~previous
+
+def peak_rate(polls: np.ndarray, window: int) -> int:
+    """
+    the most of the sorted poll numbers that fit in any window of polls
+    """
+    if len(polls) == 0:
+        return 0
+    return int((np.searchsorted(polls, polls + window) - np.arange(len(polls))).max())
+
+def runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (starts, lengths) of every run of True in mask
+    """
+    if len(mask) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # the polls where mask changes, the runs start and end on alternate ones
+    changes = np.flatnonzero(mask[1:] != mask[:-1]) + 1
+    edges = np.concatenate(([0] if mask[0] else [], changes, [len(mask)] if mask[-1] else []))
+    starts = edges[0::2].astype(np.int64)
+    return starts, edges[1::2].astype(np.int64) - starts
+
+def stick_stats(counts: np.ndarray) -> dict:
+    """
+    stats from how many polls the stick was at each position
+    """
+    moved = np.where(STICK_MOVED, counts, 0)
+    sectors = np.bincount(STICK_SECTOR, weights=moved, minlength=ANGLE_BINS).astype(np.int64)
+    return {
+        "moved_polls": int(moved.sum()),
+        # degrees anticlockwise from right at the centre of each sector
+        "angle_bins": [round(i * 360 / ANGLE_BINS, 2) for i in range(ANGLE_BINS)],
+        "angle_counts": sectors.tolist(),
+    }
+
+def trigger_stats(counts: np.ndarray) -> dict:
+    """
+    stats from how many polls the trigger was at each of its 256 levels
+    """
+    pressed = counts[TRIGGER_THRESHOLD + 1:]
+    pressed_polls = int(pressed.sum())
+    levels = np.arange(TRIGGER_THRESHOLD + 1, 256)
+    return {
+        "pressed_polls": pressed_polls,
+        "mean_when_pressed": round(float((pressed * levels).sum() / pressed_polls), 2) if pressed_polls else 0.0,
+        # counts of values in [bin_starts[i], bin_starts[i] + 256 / TRIGGER_BINS)
+        "bin_starts": list(range(0, 256, 256 // TRIGGER_BINS)),
+        "counts": counts.reshape(TRIGGER_BINS, -1).sum(axis=1).tolist(),
+    }
+
+def compute(inputs: np.ndarray, polls_per_second: float, port: int = 0) -> dict:
+    """
+    all the stats for an inputs array from a GC port (0 is port 1), as plain values ready
+    for json
+    """
+    n = len(inputs)
+    stats = {
+        "port": port + 1,
+        "polls": n,
+        "seconds": round(n / polls_per_second, 3) if polls_per_second else 0.0,
+        "polls_per_second": round(polls_per_second, 3),
+        "buttons": dict(),
+    }
+    if n == 0:
+        return stats
+    buttons, triggers, main, c = columns(inputs)
+    buttons = buttons & BUTTON_MASK
+    presses = button_presses(buttons)
+    # presses are sparse, so only the polls with any press are looked at per button
+    press_polls = np.flatnonzero(presses)
+    press_bits = presses[press_polls]
+    # how many polls have each combination of buttons held, so held counts per button are
+    # sums over the 4096 combinations rather than passes over every poll
+    combination_counts = np.bincount(buttons, minlength=BUTTON_MASK + 1)
+    combinations = np.arange(BUTTON_MASK + 1)
+    window = max(1, round(polls_per_second))
+    for bit, name in enumerate(BUTTONS):
+        polls = press_polls[(press_bits & (1 << bit)) != 0]
+        count = len(polls)
+        stats["buttons"][name] = {
+            "presses": count,
+            "held_polls": int(combination_counts[(combinations & (1 << bit)) != 0].sum()),
+            "presses_per_second": round(count / stats["seconds"], 3) if stats["seconds"] else 0.0,
+            # the fastest mashing, most presses in any one second
+            "peak_presses_per_second": peak_rate(polls, window),
+        }
+
+    # the analog stats all come from how many polls had each word, one pass per column
+    main_counts = np.bincount(main, minlength=1 << 16)
+    c_counts = np.bincount(c, minlength=1 << 16)
+    trigger_counts = np.bincount(triggers, minlength=1 << 16).reshape(256, 256)
+    stats["main_stick"] = stick_stats(main_counts)
+    stats["c_stick"] = stick_stats(c_counts)
+    stats["l_trigger"] = trigger_stats(trigger_counts.sum(axis=0))
+    stats["r_trigger"] = trigger_stats(trigger_counts.sum(axis=1))
+
+    # idle is nothing pressed, both sticks centred and both triggers up
+    idle = (buttons == 0) & ~STICK_MOVED[main] & ~STICK_MOVED[c] & ~TRIGGER_PRESSED[triggers]
+    starts, lengths = runs(idle)
+    longest = np.argsort(lengths)[::-1][:IDLE_STRETCHES]
+    stats["idle_polls"] = int(np.count_nonzero(idle))
+    stats["longest_idle"] = [
+        {
+            "start_poll": int(starts[i]),
+            "polls": int(lengths[i]),
+            "seconds": round(int(lengths[i]) / polls_per_second, 3) if polls_per_second else 0.0,
+        }
+        for i in longest
+    ]
+    return stats
+
+def compute_ports(port_inputs: list[np.ndarray], ports: list[int], polls_per_second: float) -> list[dict]:
+    """
+    compute for every port, in port order
+    """
+    return [compute(inputs, polls_per_second, port) for port, inputs in zip(ports, port_inputs)]
+
+def export_json(stats, path):
+    # a list of stats from compute_ports is one object for a single port, so single player
+    # exports look the same as ever, and a list under "ports" for more
+    if isinstance(stats, list):
+        stats = stats[0] if len(stats) == 1 else {"ports": stats}
+    Path(path).write_text(json.dumps(stats, indent=2))
+    log(f"Exported input stats to: {path}")
+
+def summary(stats: dict) -> str:
+    """
+    the stats as short lines of text for the stats panel
+    """
+    lines = [f"port {stats['port']}: {stats['polls']} polls, {stats['seconds']:.1f}s"]
+    if stats["polls"] == 0:
+        return lines[0]
+    lines.append(f"idle {100 * stats['idle_polls'] / stats['polls']:.0f}%")
+    lines.append("")
+    lines.append("button  presses  /s  peak/s")
+    for name, button in stats["buttons"].items():
+        if button["presses"]:
+            lines.append(
+                f"{name:<7} {button['presses']:>7} {button['presses_per_second']:>4.1f} "
+                f"{button['peak_presses_per_second']:>6}"
+            )
+    for name in ("main_stick", "c_stick"):
+        stick = stats[name]
+        counts = stick["angle_counts"]
+        top = int(np.argmax(counts)) if stick["moved_polls"] else None
+        direction = f", mostly {stick['angle_bins'][top]:g}°" if top is not None else ""
+        lines.append(f"{name.replace('_', ' ')}: moved {stick['moved_polls']} polls{direction}")
+    for name in ("l_trigger", "r_trigger"):
+        trigger = stats[name]
+        lines.append(
+            f"{name.replace('_', ' ')}: pressed {trigger['pressed_polls']} polls, "
+            f"mean {trigger['mean_when_pressed']:g}"
+        )
+    lines.append("")
+    lines.append("longest idle")
+    for stretch in stats["longest_idle"]:
+        lines.append(f"  poll {stretch['start_poll']}: {stretch['seconds']:.2f}s")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work out input stats for a DTM")
+    parser.add_argument("dtm")
+    parser.add_argument("output", nargs="?", help="json file to write, prints a summary if not given")
+    parser.add_argument("--port", type=int, choices=range(1, 5), help="only this GC port, defaults to every port")
+    # intermixed so the output can come after --port too
+    args = parser.parse_intermixed_args()
+    try:
+        source = DTMSource(args.dtm)
+    except (OSError, ValueError) as e:
+        err(f"Failed to read DTM file: {e}")
+        raise SystemExit(1)
+    start = time.perf_counter()
+    ports, port_inputs = source.ports, source.port_inputs
+    if args.port is not None:
+        if args.port - 1 not in ports:
+            err(f"Port {args.port} has no controller in this movie")
+            raise SystemExit(1)
+        port_inputs = [port_inputs[ports.index(args.port - 1)]]
+        ports = [args.port - 1]
+    stats = compute_ports(port_inputs, ports, source.header.polls_per_second)
+    log(f"Worked out stats for {len(source.inputs)} polls on {len(ports)} port(s) in {(time.perf_counter() - start) * 1000:.1f}ms")
+    if args.output:
+        export_json(stats, args.output)
+    else:
+        print("\n\n".join(summary(port_stats) for port_stats in stats))
+    source.close()
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from util import log, err
+
+#########
+# Cache #
+#########
+# small on-disk cache for anything we derive from a file (parsed inputs, indexes, ...)
+# entries are keyed by a hash of the source file's contents, so the same movie opened
+# from two folders shares an entry and two movies with the same name never collide.
+# when the cache grows past its size budget the least recently used entries are removed
+
+# where the command line tools (render_video, align, ...) keep parsed DTMs, the app uses
+# the same folder with the size from its settings
+DTM_CACHE = Path(__file__).resolve().parent / "cache" / "dtm"
+DTM_CACHE_BYTES = 512 * 1024 * 1024
+
+def file_digest(filename, chunk_size: int = 1 << 20) -> str:
+    """
+    hashes the full contents of a file
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def sampled_digest(filename, samples: int = 16, chunk_size: int = 1 << 20) -> str:
+    """
+    hashes the size and a handful of chunks spread through a file, for files like frame
+    dumps that are too big to read in full just to look something up
+    """
+    size = os.path.getsize(filename)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, "little"))
+    with open(filename, "rb") as f:
+        if size <= samples * chunk_size:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+        else:
+            for i in range(samples):
+                f.seek((size - chunk_size) * i // (samples - 1))
+                h.update(f.read(chunk_size))
+    return h.hexdigest()
+
+class FileCache():
+    def __init__(self, directory, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def path(self, key: str, suffix: str) -> Path:
+        return self.directory / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str):
+        """
+        returns the path to a cached entry, or None if it isn't cached
+        """
+        path = self.path(key, suffix)
+        if not path.is_file():
+            return None
+        # bump the modified time, which is what eviction sorts by
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def put(self, key: str, suffix: str, write) -> Path:
+        """
+        calls write(file) with a temporary binary file then atomically moves it into place,
+        so other processes sharing the cache never see a half-written entry
+        """
+        def write_path(tmp: Path):
+            with open(tmp, "wb") as f:
+                write(f)
+        return self.put_path(key, suffix, write_path)
+
+    def put_path(self, key: str, suffix: str, make) -> Path:
+        """
+        same as put, but make(path) creates the entry at a temporary path itself, for
+        entries written by other programs. the path ends with suffix
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key, suffix)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=suffix)
+        os.close(fd)
+        try:
+            make(Path(tmp))
+            os.replace(tmp, path)
+        except Exception:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep = None):
+        entries = []
+        for path in self.directory.glob("*"):
+            if path.name.startswith(".tmp-") or not path.is_file():
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+                total -= size
+                log(f"Evicted cache entry: {path.name}")
+            except OSError as e:
+                # most likely still open/mapped by someone
+                err(f"Failed to evict cache entry {path.name}: {e}")
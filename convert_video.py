@@ -1,6 +1,15 @@
+import os
+import queue
+import shutil
 import subprocess
 import threading
-from util import log, err, err_popup
+import time
+from collections import deque
+from math import ceil
+from pathlib import Path
+import cv2
+from seek_index import SeekIndex
+from util import log, err
 
 #############
 # IMPORTANT #
@@ -8,61 +17,289 @@ from util import log, err, err_popup
 # This module is used if the user has ffmpeg
 # and wants to reduce filesize of the avi
 
-# basic command to convert input to 480p30 with high compression for minimal filesize
-command = [
-    "ffmpeg",
-    "-i", "input.avi",
-    "-vf", "scale=-2:480,fps=_FPS_",
-    "-c:v", "libx264",
-    "-preset", "slow",
-    "-crf", "25",
-    "-c:a", "aac",
-    "-b:a", "96k",
-    "output.mp4",
-    "-y"
-]
-
-def read_output(pipe, is_stderr=False):
-    try:
-        for line in iter(pipe.readline, b''):
-            # Decode byte to string and strip newline
-            if is_stderr:
-                err(line, end='')
-            else: print(line, end='')  # Print output in real-time
-        pipe.close()
-    except ValueError as e:
-        exit()
-
-def ffmpeg(input: str, output: str, fps: str) -> bool:
-    command[2] = input
-    command[-2] = output
-    command[4] = command[4].replace("_FPS_", fps)
+# encodes run one at a time on a background thread so the window stays responsive.
+# ffmpeg reports its progress on stdout with -progress, which is parsed into a
+# fraction done and an ETA that the UI polls for.
+# long videos can be split into segments at keyframes that are encoded by separate
+# ffmpeg processes at the same time, then joined with the concat demuxer
+
+SCALE_HEIGHT = 480
+CRF = "25"
+MIN_SEGMENT_SECONDS = 10    # shorter segments aren't worth starting another ffmpeg for
+
+def ffmpeg_command(input: str, output: str, fps: str, start_frame: int = 0, frames: int = 0,
+                   audio: bool = True) -> list[str]:
+    """
+    command to convert input to 480p at fps with high compression for minimal filesize.
+    for a segment, start_frame and frames are counted at the output fps
+    """
+    command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-nostats",
+        "-progress", "pipe:1"
+    ]
+    filters = f"scale=-2:{SCALE_HEIGHT},fps={fps}"
+    if start_frame > 0:
+        # seeking before -i decodes from the keyframe before and drops every frame before
+        # the exact time. -copyts keeps the original timestamps so fps picks the same
+        # frames a single pass would, but the input frame closest to start_frame can be
+        # just before its time, so seek one output frame early and trim back to it
+        fps_value = int(fps)
+        command += ["-ss", f"{(start_frame - 1) / fps_value:.6f}", "-copyts"]
+        filters += f",trim=start={(start_frame - 0.5) / fps_value:.6f},setpts=PTS-STARTPTS"
+    command += [
+        "-i", input,
+        "-vf", filters,
+        "-c:v", "libx264",
+        "-preset", "slow",
+        "-crf", CRF
+    ]
+    if start_frame > 0:
+        # trim and setpts drop the frame rate fps set, without it being set again the
+        # output gets timed at the input's rate and frames are dropped or duplicated
+        command += ["-r", fps]
+    if frames > 0:
+        command += ["-frames:v", str(frames)]
+    command += ["-c:a", "aac", "-b:a", "96k"] if audio else ["-an"]
+    return command + [output, "-y"]
+
+def concat_command(list_file: str, input: str, output: str) -> list[str]:
+    """
+    joins encoded segments without re-encoding them, with the audio from the original
+    """
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_file,
+        "-i", input,
+        "-map", "0:v", "-map", "1:a?",
+        "-c:v", "copy",
+        "-c:a", "aac", "-b:a", "96k",
+        output,
+        "-y"
+    ]
+
+def segment_starts(input: str, duration: float, fps: int, segments: int) -> list[int]:
+    """
+    first output frame of each segment. segments start on the first output frame at or
+    after a keyframe, so each ffmpeg only decodes what it encodes, and on whole output
+    frames, so the segments add up to exactly the frames a single pass would make
+    """
+    segments = max(1, min(segments, int(duration // MIN_SEGMENT_SECONDS)))
+    if segments == 1:
+        return [0]
+    index = SeekIndex.for_video(input)
+    starts = [0]
+    for i in range(1, segments):
+        t = duration * i / segments
+        if index is not None:
+            # nearest keyframe to an even split
+            keyframe_times = index.timestamps[index.keyframes]
+            t = float(keyframe_times[abs(keyframe_times - t).argmin()])
+        start = ceil(t * fps - 1e-6)
+        if start > starts[-1]:
+            starts.append(start)
+    return starts
+
+def default_segments() -> int:
+    return os.cpu_count() or 1
+
+def video_duration(filename: str) -> float:
+    """
+    length of a video in seconds, 0 if it can't be worked out
+    """
+    cap = cv2.VideoCapture(filename)
     try:
-        proc = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        # Create separate threads for stdout and stderr
-        stdout_thread = threading.Thread(target=read_output, args=(proc.stdout,))
-        stderr_thread = threading.Thread(target=read_output, args=(proc.stderr,))
-
-        # Start the threads
-        stdout_thread.start()
-        stderr_thread.start()
-
-        # Wait for the proc to finish
-        proc.wait()
-        
-        # Close the process
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frames / fps if fps > 0 and frames > 0 else 0.0
+    finally:
+        cap.release()
+
+class EncodeJob():
+    def __init__(self, input: str, output: str, fps: str, segments: int = 1):
+        self.input    = input
+        self.output   = output
+        self.fps      = fps
+        self.segments = segments    # how many ffmpeg processes to split the encode between
+        self.status   = "queued"    # queued, running, done, failed or cancelled
+        self.progress = 0.0         # 0 to 1
+        self.eta      = None        # seconds left, None until ffmpeg has reported some progress
+        self.error    = ""
+        self.procs    = []
+        self._cancelled = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def cancel(self):
+        self._cancelled.set()
+        self._terminate_all()
+
+    def run(self):
+        """
+        runs the encode on the calling thread, blocking until ffmpeg exits
+        """
+        if self._cancelled.is_set():
+            self.status = "cancelled"
+            return
+        self.status = "running"
+        duration = video_duration(self.input)
+        fps = int(self.fps)
+        starts = segment_starts(self.input, duration, fps, self.segments)
+        parts_dir = Path(f"{self.output}.parts")
+        if len(starts) == 1:
+            commands = [ffmpeg_command(self.input, self.output, self.fps)]
+        else:
+            log(f"Compressing in {len(starts)} segments")
+            parts_dir.mkdir(exist_ok=True)
+            parts = [parts_dir / f"part{i:04}.mp4" for i in range(len(starts))]
+            ends = starts[1:] + [0]
+            commands = [
+                # the last segment has no end, it runs to the end of the video
+                ffmpeg_command(self.input, str(part), self.fps, start, end - start if end else 0, audio=False)
+                for part, start, end in zip(parts, starts, ends)
+            ]
+
+        try:
+            ok = self._run_commands(commands, duration)
+            if ok and len(starts) > 1:
+                list_file = parts_dir / "parts.txt"
+                list_file.write_text("".join(f"file '{part.as_posix()}'\n" for part in parts))
+                ok = self._run_commands([concat_command(str(list_file), self.input, self.output)], 0)
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+        if self._cancelled.is_set():
+            self.status = "cancelled"
+            Path(self.output).unlink(missing_ok=True)
+        elif not ok:
+            self.status = "failed"
+            Path(self.output).unlink(missing_ok=True)
+        else:
+            self.progress = 1.0
+            self.eta = 0
+            self.status = "done"
+
+    def _run_commands(self, commands: list[list[str]], duration: float) -> bool:
+        """
+        runs ffmpeg commands at the same time and waits for all of them, progress is
+        how much of duration they've got through between them
+        """
+        self.procs = []
+        threads = []
+        stderr_tail = deque(maxlen=20)
+        done = [0.0] * len(commands)
+        start = time.perf_counter()
+        for i, command in enumerate(commands):
+            if self._cancelled.is_set():
+                break
+            try:
+                proc = subprocess.Popen(
+                    command,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
+            except OSError as e:
+                self.error = f"Unable to start FFmpeg: {e}"
+                self._terminate_all()
+                break
+            self.procs.append(proc)
+            # stderr has to be drained too or ffmpeg blocks once the pipe fills up
+            threads.append(threading.Thread(target=self._read_stderr, args=(proc, stderr_tail), daemon=True))
+            threads.append(threading.Thread(
+                target=self._read_progress, args=(proc, done, i, duration, start), daemon=True
+            ))
+            threads[-2].start()
+            threads[-1].start()
+        # cancelled while ffmpeg was starting
+        if self._cancelled.is_set():
+            self._terminate_all()
+
+        failed = False
+        for proc in self.procs:
+            proc.wait()
+            if proc.returncode != 0 and not failed:
+                failed = True
+                self.error = self.error or "".join(stderr_tail).strip() or \
+                    f"FFmpeg exited with code {proc.returncode}"
+                # no point finishing the other segments
+                self._terminate_all()
+        for thread in threads:
+            thread.join()
+        return len(self.procs) == len(commands) and not failed
+
+    def _terminate_all(self):
+        for proc in list(self.procs):
+            if proc.poll() is None:
+                proc.terminate()
+
+    def _read_progress(self, proc, done: list[float], i: int, duration: float, start: float):
+        # blocks of key=value lines, each ending with progress=continue or progress=end
+        for line in proc.stdout:
+            key, _, value = line.strip().partition("=")
+            # out_time_ms is actually in microseconds, same as out_time_us
+            if key in ("out_time_us", "out_time_ms") and value.isdigit() and duration > 0:
+                done[i] = int(value) / 1_000_000
+                total = sum(done)
+                self.progress = min(1.0, total / duration)
+                elapsed = time.perf_counter() - start
+                if total > 0:
+                    self.eta = max(0.0, (duration - total) * elapsed / total)
         proc.stdout.close()
+
+    def _read_stderr(self, proc, tail: deque):
+        for line in proc.stderr:
+            tail.append(line)
+            err(line.rstrip())
         proc.stderr.close()
-        
-        log("Video compression completed")
+
+class JobManager():
+    """
+    runs encode jobs one at a time on a worker thread. the queue is bounded so you
+    can't pile up more encodes than you'd reasonably wait for
+    """
+    def __init__(self, max_queued: int = 4):
+        self.jobs = queue.Queue(maxsize=max_queued)
+        self.current = None
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, job: EncodeJob) -> bool:
+        """
+        queues a job, returns False if the queue is full
+        """
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            return False
+        log(f"Queued video compression: {job.input}")
         return True
-    
-    except subprocess.CalledProcessError as e:
-        err_popup(f"FFmpeg failed with error:\n\n{e.stderr}")
-        return False
+
+    def pending(self) -> int:
+        return self.jobs.qsize()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            self.current = job
+            log(f"Compressing video: {job.input}")
+            try:
+                job.run()
+            except Exception as e:
+                # the worker has to outlive a broken job or the ones after it never start
+                job.error = job.error or str(e)
+                job.status = "failed"
+            if job.status == "done":
+                log(f"Video compression completed: {job.output}")
+            elif job.status == "cancelled":
+                log(f"Video compression cancelled: {job.input}")
+            else:
+                err(f"Video compression failed: {job.error}")
+            self.current = None
@@ -0,0 +1,168 @@
+import mmap
+import struct
+from pathlib import Path
+import numpy as np
+from cache import file_digest
+from util import log, err
+
+#############
+# DTM files #
+#############
+# Dolphin Test Movie files are a 256 byte header followed by one 8 byte record
+# for every controller poll. this module reads them straight into numpy so we
+# don't need to round-trip through dtm2text and a text file.
+# with more than one controller plugged in, each round of polls has a record for every
+# active port in port order, so they're split into an array per port when opened
+
+# bump this whenever the way inputs are decoded changes, so old cache entries are ignored
+PARSER_VERSION = 1
+
+HEADER_SIZE = 256
+SIGNATURE = b"DTM\x1a"
+
+# layout of a single GameCube controller poll, matching the file byte-for-byte
+# so the records can be read without any per-poll decoding
+INPUT_DTYPE = np.dtype([
+    ("buttons", "<u2"), # bitfield, see BUTTONS below
+    ("l",       "u1"),  # analog L trigger
+    ("r",       "u1"),  # analog R trigger
+    ("main_x",  "u1"),  # main stick, 128 is centred
+    ("main_y",  "u1"),
+    ("c_x",     "u1"),  # c stick, 128 is centred
+    ("c_y",     "u1"),
+])
+
+# bit positions in the buttons field, in the same order dtm2text writes them
+BUTTONS = ["start", "a", "b", "x", "y", "z", "up", "down", "left", "right", "l", "r"]
+
+# VIs (vertical blanks) a second, PAL games run at 50 unless they're switched to 60
+NTSC_VI_RATE = 60
+PAL_VI_RATE = 50
+# regions in the 4th character of a game id that are PAL
+PAL_REGIONS = "DFHIPSUXY"
+
+GC_PORTS = 4
+
+# an idle poll, used when nothing is loaded
+NEUTRAL_INPUT = np.array((0, 0, 0, 128, 128, 128, 128), dtype=INPUT_DTYPE)
+# an empty input log
+NO_INPUTS = np.zeros(0, dtype=INPUT_DTYPE)
+
+class DTMHeader():
+    def __init__(self, data: bytes):
+        if len(data) < HEADER_SIZE or data[:4] != SIGNATURE:
+            raise ValueError("Not a valid DTM file (bad signature)")
+        self.game_id        = data[0x04:0x0A].decode("ascii", errors="replace")
+        self.is_wii         = bool(data[0x0A])
+        self.controllers    = data[0x0B]    # bits 0-3 are GC ports 1-4, bits 4-7 are wiimotes
+        self.from_savestate = bool(data[0x0C])
+        self.vi_count, self.input_count, self.lag_count = struct.unpack_from("<QQQ", data, 0x0D)
+        self.rerecords      = struct.unpack_from("<I", data, 0x2D)[0]
+        self.author         = data[0x31:0x51].split(b"\0")[0].decode("utf-8", errors="replace")
+        self.pal60          = bool(data[0x9C])  # a PAL game switched to 60Hz in its settings
+        self.tick_count     = struct.unpack_from("<Q", data, 0xED)[0]
+
+    @property
+    def vi_rate(self) -> int:
+        # VIs a second, the 4th character of the game id is its region
+        pal = len(self.game_id) >= 4 and self.game_id[3] in PAL_REGIONS
+        return PAL_VI_RATE if pal and not self.pal60 else NTSC_VI_RATE
+
+    @property
+    def ports(self) -> list[int]:
+        # the GC ports with a controller, 0 is port 1. movies without any are single player
+        return [port for port in range(GC_PORTS) if self.controllers >> port & 1] or [0]
+
+    @property
+    def polls_per_second(self) -> float:
+        # the poll count over the VI count, at the region's VI rate. the input count has
+        # every port's polls in it
+        if not self.vi_count:
+            return 2 * self.vi_rate
+        return self.vi_rate * self.input_count / self.vi_count / len(self.ports)
+
+class DTMSource():
+    """
+    memory-mapped DTM file. records is a zero-copy structured array over the mapping,
+    so opening is O(1), any poll can be read in O(1) and only the pages that are
+    actually touched get read from disk, no matter how long the movie is.
+    if a FileCache is given, the decoded records are stored in it as a .npy keyed by
+    the file's contents and reopening the same movie maps that instead. finding the
+    entry hashes the whole file, so opening with a cache is O(n) in the file's size.
+    port_inputs has each active port's polls, and inputs is the first port's. with one
+    controller they're all the same array, so single player movies stay zero-copy
+    """
+    def __init__(self, filename, cache = None):
+        self.path = Path(filename)
+        self.cache = cache
+        self.key = None
+        self._mmap = None
+        with open(self.path, "rb") as f:
+            self.header = DTMHeader(f.read(HEADER_SIZE))
+            if cache is not None:
+                self.key = f"{file_digest(self.path)}-v{PARSER_VERSION}"
+                cached = cache.get(self.key, ".inputs.npy")
+                if cached:
+                    self.records = np.load(cached, mmap_mode="r")
+                    log(f"Loaded DTM inputs from cache: {cached.name}")
+                    self._split_ports()
+                    return
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        count = (len(self._mmap) - HEADER_SIZE) // INPUT_DTYPE.itemsize
+        self.records = np.frombuffer(self._mmap, dtype=INPUT_DTYPE, count=count, offset=HEADER_SIZE)
+        if cache is not None:
+            try:
+                cache.put(self.key, ".inputs.npy", lambda out: np.save(out, self.records))
+            except OSError as e:
+                err(f"Failed to cache DTM inputs: {e}")
+        self._split_ports()
+
+    def _split_ports(self):
+        self.ports = self.header.ports
+        self.port_inputs = split_ports(self.records, len(self.ports))
+        self.inputs = self.port_inputs[0]
+        if len(self.ports) > 1:
+            log(f"Split DTM inputs between ports {', '.join(str(port + 1) for port in self.ports)}")
+    
+    def __len__(self):
+        return len(self.inputs)
+    
+    def __getitem__(self, index):
+        return self.inputs[index]
+    
+    def close(self):
+        self.records = self.inputs = NO_INPUTS
+        self.port_inputs = [NO_INPUTS]
+        if self._mmap is None:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # something still holds a view of the inputs, the mapping is freed with it
+            pass
+
+def split_ports(records: np.ndarray, ports: int) -> list[np.ndarray]:
+    """
+    every port's polls as its own contiguous array, so each can be read as columns. the
+    records are round after round of one poll per port, a partial round at the end is dropped
+    """
+    if ports <= 1:
+        return [records]
+    rounds = len(records) // ports
+    return [np.ascontiguousarray(records[port:rounds * ports:ports]) for port in range(ports)]
+
+def read_dtm(filename) -> tuple[DTMHeader, np.ndarray]:
+    """
+    reads a whole DTM file into memory and returns its header and inputs as a structured array
+    """
+    with open(filename, "rb") as f:
+        header = DTMHeader(f.read(HEADER_SIZE))
+        inputs = np.fromfile(f, dtype=INPUT_DTYPE)
+    return header, inputs
+
+def button_states(poll) -> list[int]:
+    """
+    unpacks the buttons bitfield of a single poll into a list of 0/1 in BUTTONS order
+    """
+    buttons = int(poll["buttons"])
+    return [buttons >> i & 1 for i in range(len(BUTTONS))]
@@ -0,0 +1,235 @@
+import argparse
+import json
+import time
+import numpy as np
+from analytics import runs
+from dtm import BUTTONS, INPUT_DTYPE, NO_INPUTS, DTMSource
+from util import log, err
+
+############
+# DTM diff #
+############
+# compares two movies poll by poll to find where they diverge. each 8 byte record is read
+# as a single little-endian uint64, so the whole comparison is one != over the two arrays,
+# and the fields that differ in a run come from or-ing the xor of its records together.
+# multiplayer movies are compared port by port, a port only one of them uses is all one run.
+#
+#   python dtm_diff.py a.dtm b.dtm [--json]
+
+# bits of a record read as a little-endian uint64 that belong to each field
+FIELD_MASKS = dict()
+for _name in INPUT_DTYPE.names:
+    _offset, _size = INPUT_DTYPE.fields[_name][1], INPUT_DTYPE.fields[_name][0].itemsize
+    FIELD_MASKS[_name] = ((1 << (8 * _size)) - 1) << (8 * _offset)
+
+def changed_fields(xor: int) -> list[str]:
+    """
+    names of the fields a record xor covers, with the buttons split into each button
+    """
+    fields = []
+    for name, mask in FIELD_MASKS.items():
+        if not xor & mask:
+            continue
+        if name == "buttons":
+            # the bits above the buttons aren't buttons, but still count as a difference
+            fields += [button for bit, button in enumerate(BUTTONS) if xor & (1 << bit)] or ["buttons"]
+        else:
+            fields.append(name)
+    return fields
+
+def format_poll(poll) -> str:
+    """
+    one poll as short text, e.g. "A B main(128,255) c(128,128) L0 R0"
+    """
+    if poll is None:
+        return "(no poll)"
+    held = [name.upper() for bit, name in enumerate(BUTTONS) if int(poll["buttons"]) >> bit & 1]
+    return " ".join(held + [
+        f"main({poll['main_x']},{poll['main_y']})",
+        f"c({poll['c_x']},{poll['c_y']})",
+        f"L{poll['l']}",
+        f"R{poll['r']}",
+    ])
+
+class DTMDiff():
+    """
+    where two input arrays differ, as runs of differing polls. a run is (start poll, length,
+    changed fields), polls that only one of them has count as a differing run at the end.
+    runs are kept as arrays and only turned into tuples when they're asked for, so a diff
+    of two movies that desynced early costs the same as one that barely differs
+    """
+    def __init__(self, a: np.ndarray, b: np.ndarray, port: int = 0):
+        self.a = a
+        self.b = b
+        self.port = port    # the GC port the inputs are from, 0 is port 1
+        n = min(len(a), len(b))
+        words_a = a[:n].view("<u8")
+        words_b = b[:n].view("<u8")
+        differ = words_a != words_b
+        starts, lengths = runs(differ)
+        # or of the xors over each run, only the differing polls are looked at and they're
+        # in run order, so each run starts where the lengths before it add up to
+        polls = np.flatnonzero(differ)
+        xor = words_a[polls] ^ words_b[polls]
+        offsets = np.concatenate(([0], np.cumsum(lengths[:-1]))).astype(np.intp)
+        field_bits = np.bitwise_or.reduceat(xor, offsets) if len(starts) else np.zeros(0, dtype=np.uint64)
+        if len(a) != len(b):
+            starts = np.append(starts, n)
+            lengths = np.append(lengths, abs(len(a) - len(b)))
+            field_bits = np.append(field_bits, np.uint64(0))
+        self.starts = starts
+        self.lengths = lengths
+        self.field_bits = field_bits
+        self.first = int(starts[0]) if len(starts) else None
+        self.differing_polls = int(lengths.sum())
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def identical(self) -> bool:
+        return self.first is None
+
+    def runs(self, limit: int = None):
+        """
+        (start poll, length, changed fields) of the first limit runs, or all of them
+        """
+        count = len(self) if limit is None else min(limit, len(self))
+        return [
+            (int(self.starts[i]), int(self.lengths[i]), changed_fields(int(self.field_bits[i])) or ["length"])
+            for i in range(count)
+        ]
+
+    def poll_pair(self, poll: int):
+        return (
+            self.a[poll] if poll < len(self.a) else None,
+            self.b[poll] if poll < len(self.b) else None
+        )
+
+    def ranges(self) -> np.ndarray:
+        """
+        (start, end) polls of every differing run, end exclusive
+        """
+        return np.stack((self.starts, self.starts + self.lengths), axis=1).astype(np.int64)
+
+    def frame_ranges(self, frame_map) -> np.ndarray:
+        """
+        (start, end) frames showing each differing run, end exclusive
+        """
+        if frame_map.polls == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        # polls past the end of the mapped movie (the longer one's extra polls) show on its
+        # last polled frame
+        ranges = np.minimum(self.ranges(), frame_map.polls)
+        first_frames = frame_map.frames(np.minimum(ranges[:, 0], frame_map.polls - 1))
+        last_frames = frame_map.frames(ranges[:, 1] - 1)
+        return np.stack((first_frames, last_frames + 1), axis=1)
+
+    def to_dict(self) -> dict:
+        return {
+            "port": self.port + 1,
+            "polls_a": len(self.a),
+            "polls_b": len(self.b),
+            "first_divergence": self.first,
+            "differing_polls": self.differing_polls,
+            "runs": [{"start": start, "polls": length, "fields": fields} for start, length, fields in self.runs()],
+        }
+
+class MovieDiff():
+    """
+    a DTMDiff for every port either movie has a controller in, in port order. a port only
+    one of them uses is compared against no polls. runs are (port, start poll, length,
+    changed fields), in poll order across all the ports
+    """
+    def __init__(self, a_ports: dict, b_ports: dict):
+        ports = sorted(set(a_ports) | set(b_ports))
+        self.diffs = [DTMDiff(a_ports.get(port, NO_INPUTS), b_ports.get(port, NO_INPUTS), port) for port in ports]
+        differing = [diff for diff in self.diffs if not diff.identical]
+        # the port that diverges first, or None if none do
+        self.first_diff = min(differing, key=lambda diff: diff.first) if differing else None
+        self.first = None if self.first_diff is None else self.first_diff.first
+        self.differing_polls = sum(diff.differing_polls for diff in self.diffs)
+
+    @classmethod
+    def from_sources(cls, a: DTMSource, b: DTMSource):
+        return cls(dict(zip(a.ports, a.port_inputs)), dict(zip(b.ports, b.port_inputs)))
+
+    def __len__(self):
+        return sum(len(diff) for diff in self.diffs)
+
+    @property
+    def identical(self) -> bool:
+        return self.first is None
+
+    @property
+    def polls(self) -> int:
+        # the most polls either movie has on any port
+        return max([max(len(diff.a), len(diff.b)) for diff in self.diffs] or [0])
+
+    def runs(self, limit: int = None):
+        """
+        (port, start poll, length, changed fields) of the first limit runs, or all of them
+        """
+        # the first limit runs overall are among the first limit of each port
+        runs = [(diff.port, *run) for diff in self.diffs for run in diff.runs(limit)]
+        runs.sort(key=lambda run: (run[1], run[0]))
+        return runs if limit is None else runs[:limit]
+
+    def frame_ranges(self, frame_map) -> np.ndarray:
+        """
+        (start, end) frames showing each differing run on any port, in frame order
+        """
+        ranges = np.concatenate([diff.frame_ranges(frame_map) for diff in self.diffs] or [np.zeros((0, 2), dtype=np.int64)])
+        return ranges[np.argsort(ranges[:, 0], kind="stable")]
+
+    def to_dict(self) -> dict:
+        return {
+            "first_divergence": self.first,
+            "first_divergence_port": None if self.first_diff is None else self.first_diff.port + 1,
+            "differing_polls": self.differing_polls,
+            "ports": [diff.to_dict() for diff in self.diffs],
+        }
+
+def summary(diff: MovieDiff, polls_per_second: float, max_runs: int = 20) -> str:
+    if diff.identical:
+        return f"Inputs are identical ({diff.polls} polls, {len(diff.diffs)} port(s))"
+    first = diff.first_diff
+    a, b = first.poll_pair(first.first)
+    lines = [
+        f"First divergence at poll {first.first} ({first.first / polls_per_second:.3f}s) on port {first.port + 1}",
+        f"  a: {format_poll(a)}",
+        f"  b: {format_poll(b)}",
+        f"{diff.differing_polls} differing polls in {len(diff)} runs",
+    ]
+    for port, start, length, fields in diff.runs(max_runs):
+        lines.append(f"  port {port + 1} polls {start}-{start + length - 1}: {', '.join(fields)}")
+    if len(diff) > max_runs:
+        lines.append(f"  ... {len(diff) - max_runs} more")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find where two DTMs' inputs diverge")
+    parser.add_argument("a")
+    parser.add_argument("b")
+    parser.add_argument("--json", action="store_true", help="print the diff as json")
+    args = parser.parse_args()
+    try:
+        source_a, source_b = DTMSource(args.a), DTMSource(args.b)
+    except (OSError, ValueError) as e:
+        err(f"Failed to read DTM file: {e}")
+        raise SystemExit(1)
+    start = time.perf_counter()
+    diff = MovieDiff.from_sources(source_a, source_b)
+    log(f"Compared {diff.polls} polls on {len(diff.diffs)} port(s) in {(time.perf_counter() - start) * 1000:.1f}ms")
+    if args.json:
+        print(json.dumps(diff.to_dict(), indent=2))
+    else:
+        for field in ("game_id", "rerecords", "input_count", "vi_count", "lag_count", "ports"):
+            value_a, value_b = getattr(source_a.header, field), getattr(source_b.header, field)
+            if value_a != value_b:
+                print(f"{field}: {value_a} vs {value_b}")
+        print(summary(diff, source_a.header.polls_per_second))
+    source_a.close()
+    source_b.close()
+    # exit code 1 when they differ, like diff
+    raise SystemExit(0 if diff.identical else 1)
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+
+class FrameCache():
+    """
+    LRU cache of decoded frames that are ready to show, keyed by (frame index, size) and
+    limited by the total size of the frames in bytes. frames are (array, image) buffers
+    from frame_decoder
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.frames    = OrderedDict()
+        self.bytes     = 0
+        self.hits      = 0
+        self.misses    = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get(self, index: int, size):
+        key = (index, size)
+        buffer = self.frames.get(key)
+        if buffer is None:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return buffer
+
+    def put(self, index: int, size, buffer):
+        key = (index, size)
+        nbytes = buffer[0].nbytes
+        if nbytes > self.max_bytes:
+            return
+        old = self.frames.pop(key, None)
+        if old is not None:
+            self.bytes -= old[0].nbytes
+        self.frames[key] = buffer
+        self.bytes += nbytes
+        # drop the least recently used frames until we're back under budget
+        while self.bytes > self.max_bytes:
+            _, evicted = self.frames.popitem(last=False)
+            self.bytes -= evicted[0].nbytes
+
+    def clear(self):
+        self.frames.clear()
+        self.bytes = 0
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), " \
+            f"{len(self.frames)} frames using {self.bytes / (1024 * 1024):.1f} MB"
@@ -0,0 +1,216 @@
+import queue
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+
+def fit_rect(frame_size, view_size):
+    """
+    returns the (x, y, w, h) a frame should be drawn at to fit centred inside the view
+    """
+    fw, fh = frame_size
+    cw, ch = view_size
+    scale = min(cw/fw, ch/fh)
+    nw, nh = max(1, int(fw*scale)), max(1, int(fh*scale))
+    return (cw - nw)//2, (ch - nh)//2, nw, nh
+
+def new_buffer(size):
+    """
+    allocates an RGBA frame buffer and a PIL image that shares its memory, so writing
+    into the array updates the image without any copying
+    """
+    w, h = size
+    array = np.empty((h, w, 4), dtype=np.uint8)
+    image = Image.frombuffer("RGBA", (w, h), array, "raw", "RGBA", 0, 1)
+    return array, image
+
+def copy_buffer(buffer):
+    array, image = new_buffer(buffer[1].size)
+    np.copyto(array, buffer[0])
+    return array, image
+
+def prepare_frame(frame, size, out = None, scratch = None, interpolation = cv2.INTER_AREA):
+    """
+    scales a decoded BGR frame to size (w, h) and converts it to RGBA. writes into the
+    out buffer and the scratch array (h, w, 3) if they're given and the right size,
+    otherwise allocates new ones
+    """
+    w, h = size
+    if out is None or out[1].size != size:
+        out = new_buffer(size)
+    if scratch is not None and scratch.shape[:2] != (h, w):
+        scratch = None
+    # scale first so the colour conversion only touches the smaller image
+    small = cv2.resize(frame, size, dst=scratch, interpolation=interpolation)
+    cv2.cvtColor(small, cv2.COLOR_BGR2RGBA, dst=out[0])
+    return out
+
+class FrameDecoder(threading.Thread):
+    """
+    decodes, converts and scales frames on a background thread into a bounded buffer so
+    the Tk thread only has to hand finished images to the canvas. the decoder owns the
+    capture while it's running, so stop() it before seeking.
+    frame buffers are recycled: give each one back with release() once it's been shown
+    and the decoder will write a later frame into it, so once it's warmed up playback
+    doesn't allocate any frame memory
+    """
+    direction = 1   # frames come out in increasing order
+
+    def __init__(self, cap, start_index: int, size, depth: int = 8):
+        super().__init__(daemon=True)
+        self.cap      = cap
+        self.position = start_index # the capture's position, i.e. the next frame read() returns
+        self.size     = size        # target (w, h), can be changed while running
+        self.frames   = queue.Queue(maxsize=max(1, depth))
+        self.free     = queue.SimpleQueue() # shown buffers waiting to be reused
+        self._raw     = None        # reused for the decoded full size frame
+        self._scratch = None        # reused for the scaled BGR frame
+        self.skip_to  = 0           # frames before this are grabbed but never decoded to images
+        self.step     = 1           # only every step-th frame is decoded, for fast forward
+        self._next    = start_index # the next frame step wants
+        self.fast     = False       # use cheaper scaling while playback is behind
+        self.skipped  = 0           # frames skipped over with grab()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # the player is behind or fast forwarding, so skip frames it won't show. grab()
+            # still has to decode them but skips retrieving, converting and scaling
+            target = max(self.skip_to, self._next)
+            if self.position < target:
+                if not self.cap.grab():
+                    self._put(None)
+                    return
+                if self.position < self.skip_to:
+                    self.skipped += 1
+                self.position += 1
+                continue
+            ret, frame = self.cap.read(self._raw)
+            if not ret:
+                self._put(None) # end of video
+                return
+            self._raw = frame
+            index = self.position
+            self.position += 1
+            self._next = index + self.step
+            size = self.size
+            if self._scratch is None or self._scratch.shape[1::-1] != size:
+                self._scratch = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            interpolation = cv2.INTER_LINEAR if self.fast else cv2.INTER_AREA
+            buffer = prepare_frame(frame, size, self._take_buffer(), self._scratch, interpolation)
+            if not self._put((index, buffer)):
+                return
+
+    def _take_buffer(self):
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _put(self, item) -> bool:
+        # block while the buffer is full, but keep checking if we've been stopped
+        while not self._stop_event.is_set():
+            try:
+                self.frames.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self):
+        """
+        returns the next (index, (array, image)) without blocking, None at the end of the
+        video, raises queue.Empty if the decoder hasn't caught up yet
+        """
+        return self.frames.get_nowait()
+
+    def release(self, buffer):
+        # buffers from before a resize are just dropped
+        if buffer[1].size == self.size:
+            self.free.put(buffer)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+class ReverseDecoder(FrameDecoder):
+    """
+    decodes frames for playing backwards. video can only be decoded forwards, so this
+    decodes a span of frames (a GOP when the keyframes are known) forward into buffers and
+    hands them out last to first, then moves back to the span before it. the next span is
+    decoded while the player is still showing the current one.
+    spans are limited to half of max_bytes, a GOP longer than that is decoded again from
+    its keyframe for each part. frames come out from start_index downwards, every step-th
+    frame, with None after frame 0.
+    it opens its own capture with open_capture() on the decoder thread, so it never
+    touches the player's
+    """
+    direction = -1
+
+    def __init__(self, open_capture, start_index: int, size, max_bytes: int, keyframe_before = None,
+                 chunk: int = 60):
+        frame_bytes = size[0] * size[1] * 4
+        self.span_frames = max(1, max_bytes // frame_bytes // 2)
+        super().__init__(None, start_index, size, depth=self.span_frames)
+        self.open_capture = open_capture
+        self.keyframe_before = keyframe_before # keyframe_before(i) if the keyframes are known
+        self.chunk = chunk              # how far back to decode from when they aren't
+        self.skip_to = start_index      # frames after this are never handed out
+        self.next_out = start_index     # the next frame to hand out
+        self.spans_decoded = 0
+
+    def run(self):
+        self.cap = self.open_capture()
+        end = self.next_out + 1 # exclusive end of the next span to decode
+        while end > 0 and not self._stop_event.is_set():
+            # the player fell behind and skipped back past this span
+            end = min(end, self.skip_to + 1, self.next_out + 1)
+            if end <= 0:
+                break
+            if self.keyframe_before is not None:
+                decode_from = self.keyframe_before(end - 1)
+            else:
+                decode_from = max(0, end - self.chunk)
+            keep_from = max(decode_from, end - self.span_frames)
+            span = self._decode_span(decode_from, keep_from, end)
+            if span is None:
+                return
+            self.spans_decoded += 1
+            for index, buffer in reversed(span):
+                if index > self.skip_to:
+                    self.release(buffer)
+                    continue
+                if not self._put((index, buffer)):
+                    return
+            end = keep_from
+        self._put(None)
+
+    def _decode_span(self, decode_from: int, keep_from: int, end: int):
+        # decodes [decode_from, end), only converting the frames from keep_from that will
+        # be handed out and grabbing past the rest
+        step = self.step
+        top = min(self.next_out, end - 1)
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, decode_from)
+        size = self.size
+        scratch = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        interpolation = cv2.INTER_LINEAR if self.fast else cv2.INTER_AREA
+        span = []
+        for index in range(decode_from, end):
+            if self._stop_event.is_set():
+                return None
+            if index < keep_from or index > top or (top - index) % step != 0:
+                if not self.cap.grab():
+                    break
+                continue
+            ret, frame = self.cap.read(self._raw)
+            if not ret:
+                break
+            self._raw = frame
+            span.append((index, prepare_frame(frame, size, self._take_buffer(), scratch, interpolation)))
+        # the lowest frame wanted in this span, the next one wanted is a step before it
+        self.next_out = top - (top - keep_from) // step * step - step
+        return span
+
+    def stop(self):
+        super().stop()
+        if self.cap is not None: self.cap.release()
@@ -0,0 +1,185 @@
+import hashlib
+from math import ceil
+from pathlib import Path
+import numpy as np
+from util import log, err
+
+#############
+# Frame map #
+#############
+# which input poll each video frame shows, and which frame each poll is shown on. both are
+# tables worked out once from the DTM header, so looking either way up is just an index.
+#
+# the header has the number of VIs (vertical blanks, 60 a second, 50 on PAL), the number of
+# polls and the number of lag VIs, the ones where the game didn't read the controller.
+# polls happen at an even rate on the VIs that aren't lag, a video frame lasts
+# vi_rate / fps VIs, and a frame that lands on a lag VI shows the last poll read before it.
+# the header doesn't say where the lag VIs are, so they're assumed to be spread evenly
+# unless they're given: a <movie>.dtm.lag file next to the movie with the index of each
+# lag VI on its own line (e.g. exported from a Dolphin lag counter log) is picked up
+# automatically, and anything else can pass lag_vis in directly.
+# the tables are in the movie's frames, offset is the video frame the movie's first frame is
+# on (from aligning the video, see align.py) and is added on the way in and out
+
+MAP_VERSION = 1
+# used when the header is missing its counts, what most games do
+DEFAULT_POLLS_PER_VI = 2
+DEFAULT_FPS = 30
+
+def read_lag_file(dtm_path):
+    """
+    the lag VIs listed in <movie>.dtm.lag, or None if there isn't one
+    """
+    path = Path(f"{dtm_path}.lag")
+    if not path.is_file():
+        return None
+    try:
+        lines = path.read_text().split("\n")
+        lag_vis = [int(line.split("#")[0]) for line in lines if line.split("#")[0].strip()]
+    except (OSError, ValueError) as e:
+        err(f"Ignoring lag file {path.name}: {e}")
+        return None
+    log(f"Loaded {len(lag_vis)} lag VIs from {path.name}")
+    return np.unique(np.array(lag_vis, dtype=np.int64))
+
+def frame_polls(header, polls: int, fps: float, frames: int = None, lag_vis = None, first: int = 0) -> np.ndarray:
+    """
+    the poll shown on each video frame from first on. can be past the last poll when the
+    video is longer than the movie
+    """
+    vis = header.vi_count
+    lag = header.lag_count if lag_vis is None else len(lag_vis)
+    polled_vis = vis - lag
+    # the input count has every port's polls in it, the map is the same for all of them
+    port_polls = header.input_count / len(header.ports)
+    polls_per_vi = port_polls / polled_vis if polled_vis > 0 and port_polls else DEFAULT_POLLS_PER_VI
+    vis_per_frame = header.vi_rate / (fps if fps and fps > 0 else DEFAULT_FPS)
+    if frames is None:
+        # enough frames to show every poll
+        frames = ceil((vis or polls / polls_per_vi) / vis_per_frame) + 1
+    # the first VI of each frame, and how many lag VIs come before it and up to it
+    frame_vis = np.floor(np.arange(first, max(first, frames)) * vis_per_frame + 1e-9).astype(np.int64)
+    if lag_vis is not None:
+        lag_before = np.searchsorted(lag_vis, frame_vis, side="left")
+        lag_through = np.searchsorted(lag_vis, frame_vis, side="right")
+    elif vis > 0:
+        lag_before = frame_vis * lag // vis
+        lag_through = (frame_vis + 1) * lag // vis
+    else:
+        lag_before = lag_through = np.zeros(len(frame_vis), dtype=np.int64)
+    # polls read before the frame's VI, that VI's first poll is the one shown
+    shown = np.floor((frame_vis - lag_before) * polls_per_vi + 1e-9).astype(np.int64)
+    # a lag VI reads nothing, so it still shows the poll before it
+    shown -= lag_through > lag_before
+    return np.maximum(shown, 0)
+
+def poll_frames(frame_polls: np.ndarray, start: int, end: int) -> np.ndarray:
+    """
+    the frame each poll in [start, end) is shown on
+    """
+    # frame_polls never goes down, so the reverse is a search for every poll at once.
+    # a poll is shown on the frame it falls in, or the first of the frames showing it
+    # when lag makes several frames show the same one
+    polls = np.arange(start, end)
+    first = np.searchsorted(frame_polls, polls, side="left")
+    exact = first < len(frame_polls)
+    exact[exact] = frame_polls[first[exact]] == polls[exact]
+    within = np.searchsorted(frame_polls, polls, side="right") - 1
+    return np.maximum(np.where(exact, first, within), 0).astype(np.int64)
+
+class FrameMap():
+    """
+    frame_polls[frame] is the poll shown on a movie frame, poll_frames[poll] is the movie
+    frame a poll is shown on. both are O(1) lookups, the methods take and give video frames
+    """
+    def __init__(self, frame_polls: np.ndarray, poll_frames: np.ndarray, offset: int = 0):
+        self.frame_polls = frame_polls
+        self.poll_frames = poll_frames
+        self.polls = len(poll_frames)
+        self.offset = offset
+
+    @classmethod
+    def build(cls, frame_polls: np.ndarray, polls: int, offset: int = 0):
+        return cls(frame_polls, poll_frames(frame_polls, 0, polls), offset)
+
+    @classmethod
+    def for_source(cls, source, fps: float, frames: int = None, cache = None, lag_vis = None, offset: int = 0):
+        """
+        the map for a DTMSource shown at fps in a video of frames frames, stored in the cache
+        next to its inputs
+        """
+        if lag_vis is None:
+            lag_vis = read_lag_file(source.path)
+        polls = len(source.inputs)
+        # the video's frames from the movie's first one on
+        frames = None if frames is None else max(0, frames - offset)
+        key = None
+        if cache is not None and source.key is not None:
+            lag_key = hashlib.blake2b(lag_vis.tobytes(), digest_size=8).hexdigest() if lag_vis is not None else "even"
+            key = f"{source.key}-{fps:.6f}-{frames}-{lag_key}-map-v{MAP_VERSION}"
+            cached_frames = cache.get(key, ".frame_polls.npy")
+            cached_polls = cache.get(key, ".poll_frames.npy")
+            if cached_frames and cached_polls:
+                try:
+                    return cls(np.load(cached_frames, mmap_mode="r"), np.load(cached_polls, mmap_mode="r"), offset)
+                except (OSError, ValueError) as e:
+                    err(f"Failed to load cached frame map: {e}")
+        frame_map = cls.build(frame_polls(source.header, polls, fps, frames, lag_vis), polls, offset)
+        if key is not None:
+            try:
+                cache.put(key, ".frame_polls.npy", lambda out: np.save(out, frame_map.frame_polls))
+                cache.put(key, ".poll_frames.npy", lambda out: np.save(out, frame_map.poll_frames))
+            except OSError as e:
+                err(f"Failed to cache frame map: {e}")
+        return frame_map
+
+    def extend(self, header, polls: int, fps: float):
+        """
+        grows the map to cover polls, for a movie that's still being recorded. the header
+        doesn't change while it is, so the frames already mapped stay the same
+        """
+        if polls <= self.polls:
+            return
+        frames = len(self.frame_polls)
+        self.frame_polls = np.concatenate((self.frame_polls, frame_polls(header, polls, fps, first=frames)))
+        # the old polls from the last old frame's on might be shown by the new frames
+        start = min(self.polls, int(self.frame_polls[frames - 1])) if frames else 0
+        self.poll_frames = np.concatenate((self.poll_frames[:start], poll_frames(self.frame_polls, start, polls)))
+        self.polls = polls
+
+    def __len__(self):
+        # video frames up to the end of the table
+        return max(0, len(self.frame_polls) + self.offset)
+
+    def poll(self, frame_index: int):
+        """
+        the poll shown on a frame, or None if the movie has no poll for it
+        """
+        frame_index -= self.offset
+        if not 0 <= frame_index < len(self.frame_polls):
+            return None
+        poll = int(self.frame_polls[frame_index])
+        return poll if poll < self.polls else None
+
+    def first_poll(self, frame_index: int) -> int:
+        """
+        the first poll from frame_index on, clamped to the ends of the table
+        """
+        frame_index -= self.offset
+        if frame_index <= 0:
+            return 0
+        if frame_index >= len(self.frame_polls):
+            return self.polls
+        return int(self.frame_polls[frame_index])
+
+    def frame(self, poll: int) -> int:
+        """
+        the frame a poll is shown on
+        """
+        return int(self.poll_frames[max(0, min(poll, self.polls - 1))]) + self.offset if self.polls else self.offset
+
+    def frames(self, polls: np.ndarray) -> np.ndarray:
+        """
+        the frames an array of polls are shown on
+        """
+        return self.poll_frames[polls] + self.offset
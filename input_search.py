@@ -0,0 +1,278 @@
+import re
+import numpy as np
+from analytics import BUTTON_MASK, STICK_MOVED, TRIGGER_THRESHOLD, columns
+from dtm import BUTTONS
+
+################
+# Input search #
+################
+# finds polls by what was held on them, e.g. "a+b main:right" or "(x | y) !z frame:600-1200".
+# the index is a packed bitset per button, per stick direction and per trigger bucket, one
+# bit per poll, so a query is a few bitwise ops over arrays 1/64th the length of the movie
+# no matter how many polls match.
+#
+# terms:
+#   start a b x y z up down left right l r    digital buttons (up/down/left/right are the dpad)
+#   main:<dir> c:<dir>                        stick directions: neutral, any, right, up-right,
+#                                             up, up-left, left, down-left, down, down-right
+#   lt:<level> rt:<level>                     analog triggers: off, any, light, hard, full
+#   poll:N  poll:N-M  poll:N-                 poll ranges
+#   frame:N  frame:N-M  frame:N-              frame ranges, the polls shown on those frames
+# operators, from loosest to tightest: | (or), + & or nothing (and), ! (not), and brackets
+#
+# in multiplayer movies a term matches a poll if it's held on any port, and p<N>.<term>
+# (e.g. "p2.a + p1.main:left") only looks at port N. poll N is the Nth poll of every port
+
+STICK_DIRECTIONS = ["right", "up-right", "up", "up-left", "left", "down-left", "down", "down-right"]
+# trigger levels above TRIGGER_THRESHOLD, the bucket starts
+TRIGGER_LEVELS = {"light": TRIGGER_THRESHOLD + 1, "hard": 128, "full": 255}
+# every term with a bitset, whether or not the movie has any polls
+TERMS = set(BUTTONS) | \
+    {f"{stick}:{direction}" for stick in ("main", "c") for direction in ["neutral", "any"] + STICK_DIRECTIONS} | \
+    {f"{trigger}:{level}" for trigger in ("lt", "rt") for level in ["off", "any"] + list(TRIGGER_LEVELS)}
+
+TOKEN_PATTERN = re.compile(r"\s*(?:([()|+&!])|((?:p\d\.)?[a-z]+(?::[a-z0-9-]+)?))", re.IGNORECASE)
+
+def _direction_lut():
+    # the direction of every stick word (y << 8 | x), -1 inside the deadzone
+    y, x = np.meshgrid(np.arange(256) - 128, np.arange(256) - 128, indexing="ij")
+    angle = np.arctan2(y, x) % (2 * np.pi)
+    directions = np.round(angle / (2 * np.pi / len(STICK_DIRECTIONS))).astype(np.int8) % len(STICK_DIRECTIONS)
+    directions[~STICK_MOVED.reshape(256, 256)] = -1
+    return directions.ravel()
+
+STICK_DIRECTION = _direction_lut()
+
+def pack(mask: np.ndarray, words: int) -> np.ndarray:
+    """
+    packs a bool per poll into uint64 words, poll i is bit i % 64 of word i // 64
+    """
+    packed = np.zeros(words * 8, dtype=np.uint8)
+    bits = np.packbits(mask, bitorder="little")
+    packed[:len(bits)] = bits
+    return packed.view(np.uint64)
+
+class InputIndex():
+    """
+    the bitsets of every term for each port's inputs (port_inputs and ports as in a
+    DTMSource), and of any port for the terms without a port
+    """
+    def __init__(self, port_inputs: list[np.ndarray], ports: list[int] = None, frame_map = None):
+        self.ports = list(ports) if ports is not None else list(range(len(port_inputs)))
+        self.polls = min(len(inputs) for inputs in port_inputs) if port_inputs else 0
+        self.words = (self.polls + 63) // 64
+        self.frame_map = frame_map  # the FrameMap for frame ranges and jumping to frames
+        # every real poll, so not doesn't match the padding after the last one
+        self.all = self.poll_range(0, self.polls)
+        self.port_bitsets = {port: self._bitsets(inputs[:self.polls]) for port, inputs in zip(self.ports, port_inputs)}
+        if len(self.ports) == 1:
+            self.bitsets = self.port_bitsets[self.ports[0]]
+        else:
+            self.bitsets = dict()
+            for bitsets in self.port_bitsets.values():
+                for term, bits in bitsets.items():
+                    self.bitsets[term] = self.bitsets[term] | bits if term in self.bitsets else bits
+
+    def _bitsets(self, inputs: np.ndarray) -> dict:
+        bitsets = dict()
+        if self.polls == 0:
+            return bitsets
+        buttons, triggers, main, c = columns(inputs)
+        buttons = buttons & BUTTON_MASK
+        for bit, name in enumerate(BUTTONS):
+            bitsets[name] = pack((buttons & (1 << bit)) != 0, self.words)
+        for stick, words in (("main", main), ("c", c)):
+            directions = STICK_DIRECTION[words]
+            bitsets[f"{stick}:neutral"] = pack(directions < 0, self.words)
+            bitsets[f"{stick}:any"] = self.all & ~bitsets[f"{stick}:neutral"]
+            for i, direction in enumerate(STICK_DIRECTIONS):
+                bitsets[f"{stick}:{direction}"] = pack(directions == i, self.words)
+        for trigger, values in (("lt", triggers & 0xFF), ("rt", triggers >> 8)):
+            bitsets[f"{trigger}:off"] = pack(values <= TRIGGER_THRESHOLD, self.words)
+            bitsets[f"{trigger}:any"] = self.all & ~bitsets[f"{trigger}:off"]
+            starts = list(TRIGGER_LEVELS.values()) + [256]
+            for (level, start), end in zip(TRIGGER_LEVELS.items(), starts[1:]):
+                bitsets[f"{trigger}:{level}"] = pack((values >= start) & (values < end), self.words)
+        return bitsets
+
+    def poll_range(self, start: int, end: int) -> np.ndarray:
+        """
+        the packed bitset of polls [start, end), without going through a bool per poll
+        """
+        start, end = max(0, start), min(self.polls, end)
+        bits = np.zeros(self.words, dtype=np.uint64)
+        if start >= end:
+            return bits
+        first, last = start // 64, (end - 1) // 64
+        bits[first:last + 1] = ~np.uint64(0)
+        bits[first] &= ~np.uint64(0) << np.uint64(start % 64)
+        bits[last] &= ~np.uint64(0) >> np.uint64(63 - (end - 1) % 64)
+        return bits
+
+    def first_poll(self, frame_index: int) -> int:
+        return self.frame_map.first_poll(frame_index)
+
+    def frame_of(self, poll: int) -> int:
+        return self.frame_map.frame(poll)
+
+    def search(self, query: str) -> np.ndarray:
+        """
+        the packed bitset of the polls matching query, raises ValueError if it's invalid
+        """
+        return QueryParser(self, query).parse()
+
+    def next_match(self, bits: np.ndarray, poll: int):
+        """
+        the first matching poll at or after poll, or None
+        """
+        if poll >= self.polls:
+            return None
+        poll = max(0, poll)
+        word = poll // 64
+        # the bits before poll in its word don't count
+        first = bits[word] & (~np.uint64(0) << np.uint64(poll % 64))
+        if first:
+            return word * 64 + _lowest_bit(first)
+        later = np.flatnonzero(bits[word + 1:])
+        if len(later) == 0:
+            return None
+        word += 1 + int(later[0])
+        return word * 64 + _lowest_bit(bits[word])
+
+    def previous_match(self, bits: np.ndarray, poll: int):
+        """
+        the last matching poll before poll, or None
+        """
+        poll = min(poll, self.polls)
+        if poll <= 0:
+            return None
+        word = (poll - 1) // 64
+        last = bits[word] & (~np.uint64(0) >> np.uint64(63 - (poll - 1) % 64))
+        if last:
+            return word * 64 + _highest_bit(last)
+        earlier = np.flatnonzero(bits[:word])
+        if len(earlier) == 0:
+            return None
+        word = int(earlier[-1])
+        return word * 64 + _highest_bit(bits[word])
+
+    def next_frame(self, bits: np.ndarray, frame_index: int):
+        """
+        the first frame after frame_index that shows a matching poll, or None
+        """
+        poll = self.next_match(bits, self.first_poll(frame_index + 1))
+        return None if poll is None else self.frame_of(poll)
+
+    def previous_frame(self, bits: np.ndarray, frame_index: int):
+        """
+        the last frame before frame_index that shows a matching poll, or None
+        """
+        poll = self.previous_match(bits, self.first_poll(frame_index))
+        return None if poll is None else self.frame_of(poll)
+
+    def count(self, bits: np.ndarray) -> int:
+        return int(np.unpackbits(bits.view(np.uint8)).sum())
+
+    def frames(self, bits: np.ndarray) -> np.ndarray:
+        """
+        every frame that shows a matching poll
+        """
+        polls = np.flatnonzero(np.unpackbits(bits.view(np.uint8), bitorder="little")[:self.polls])
+        return np.unique(self.frame_map.frames(polls))
+
+def _lowest_bit(word) -> int:
+    word = int(word)
+    return (word & -word).bit_length() - 1
+
+def _highest_bit(word) -> int:
+    return int(word).bit_length() - 1
+
+class QueryParser():
+    """
+    recursive descent over the tokens of a query, evaluating as it goes
+    """
+    def __init__(self, index: InputIndex, query: str):
+        self.index = index
+        self.tokens = []
+        position = 0
+        query = query.strip()
+        while position < len(query):
+            match = TOKEN_PATTERN.match(query, position)
+            if not match or match.end() == position:
+                raise ValueError(f"Unexpected '{query[position:].strip()[:10]}' in search")
+            self.tokens.append(match.group(1) or match.group(2).lower())
+            position = match.end()
+        self.position = 0
+
+    def parse(self) -> np.ndarray:
+        if not self.tokens:
+            raise ValueError("Search is empty")
+        bits = self._or()
+        if self.position < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.position]}' in search")
+        return bits
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _take(self):
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def _or(self) -> np.ndarray:
+        bits = self._and()
+        while self._peek() in ("|", "or"):
+            self._take()
+            bits = bits | self._and()
+        return bits
+
+    def _and(self) -> np.ndarray:
+        bits = self._not()
+        # terms next to each other are anded too, so "a b" is the same as "a+b"
+        while self._peek() not in (None, ")", "|", "or"):
+            if self._peek() in ("+", "&", "and"):
+                self._take()
+            bits = bits & self._not()
+        return bits
+
+    def _not(self) -> np.ndarray:
+        if self._peek() in ("!", "not"):
+            self._take()
+            return self.index.all & ~self._not()
+        if self._peek() == "(":
+            self._take()
+            bits = self._or()
+            if self._take_if(")") is None:
+                raise ValueError("Missing ')' in search")
+            return bits
+        if self._peek() is None:
+            raise ValueError("Search ends too early")
+        return self._term(self._take())
+
+    def _take_if(self, token):
+        return self._take() if self._peek() == token else None
+
+    def _term(self, term: str) -> np.ndarray:
+        if term in TERMS:
+            # a movie without any polls has no bitsets, so nothing matches
+            return self.index.bitsets.get(term, self.index.all)
+        port, dot, port_term = term.partition(".")
+        if dot:
+            if port_term not in TERMS:
+                raise ValueError(f"Unknown search term '{port_term}' in '{term}'")
+            bitsets = self.index.port_bitsets.get(int(port[1:]) - 1)
+            if bitsets is None:
+                raise ValueError(f"Port {port[1:]} has no controller in this movie")
+            return bitsets.get(port_term, self.index.all)
+        kind, _, value = term.partition(":")
+        if kind in ("poll", "frame"):
+            match = re.fullmatch(r"(\d+)(-(\d*))?", value)
+            if not match:
+                raise ValueError(f"Bad range in '{term}', use N, N-M or N-")
+            start = int(match.group(1))
+            end = int(match.group(3)) + 1 if match.group(3) else (None if match.group(2) else start + 1)
+            if kind == "frame":
+                start = self.index.first_poll(start)
+                end = None if end is None else self.index.first_poll(end)
+            return self.index.poll_range(start, self.index.polls if end is None else end)
+        raise ValueError(f"Unknown search term '{term}'")
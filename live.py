@@ -0,0 +1,432 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from dtm import HEADER_SIZE, INPUT_DTYPE, DTMHeader, split_ports
+from util import log, err
+from video_source import PART_PATTERN, dump_parts, open_video
+
+#############
+# Live mode #
+#############
+# follows a DTM and its frame dump while Dolphin is still writing them. the files are
+# watched with inotify on linux (and checked for changes a few times a second anywhere
+# else, or if inotify can't be used), and on a change only the bytes after the last whole
+# round of polls are parsed. frames are counted by grabbing on from the last frame counted
+# with a capture that's kept open, so each one is only read once here. a capture stops at
+# the end the file had when it was opened, so it's only opened again once the dump grows.
+# the watching and reading happens on a thread of its own, and the app takes the new polls
+# and frame count from a queue so everything it builds from them is only touched by Tk.
+#
+#   python live.py watch movie.dtm [framedump0.avi]
+#   python live.py simulate movie.dtm framedump0.avi out_dir [--speed 1]
+#
+# simulate pretends to be Dolphin: it writes a copy of a finished movie and dump into
+# out_dir bit by bit in real time, with the header's counts left empty until it's done
+
+POLL_INTERVAL = 0.25    # seconds between checks when the files can't be watched
+UPDATE_INTERVAL = 0.25  # the most often updates are made, so busy writes are read in batches
+WAIT_TIMEOUT = 1.0      # how long the thread waits for a change before checking if it should stop
+
+# inotify event flags and the fixed part of an event (wd, mask, cookie, name length)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class InotifyWatcher():
+    """
+    waits for the kernel to say something was written to the directories the files are in
+    """
+    def __init__(self, paths_fn):
+        self.paths_fn = paths_fn
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
+        # directories rather than files, so the parts of a split dump are seen when they're made
+        for directory in {path.parent for path in paths_fn()}:
+            if libc.inotify_add_watch(self.fd, str(directory).encode(), mask) < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"Unable to watch {directory}")
+
+    def wait(self, timeout: float) -> bool:
+        """
+        True if one of the files changed within timeout seconds
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        names = {path.name for path in self.paths_fn()}
+        changed = False
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            length = INOTIFY_EVENT.unpack_from(data, offset)[3]
+            start = offset + INOTIFY_EVENT.size
+            name = data[start:start + length].split(b"\0")[0].decode(errors="replace")
+            changed |= name in names
+            offset = start + length
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher():
+    """
+    checks the sizes and modified times of the files every POLL_INTERVAL
+    """
+    def __init__(self, paths_fn):
+        self.paths_fn = paths_fn
+        self.stats = self._stat()
+
+    def _stat(self):
+        stats = dict()
+        for path in self.paths_fn():
+            try:
+                stat = path.stat()
+                stats[path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                stats[path] = None
+        return stats
+
+    def wait(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            stats = self._stat()
+            if stats != self.stats:
+                self.stats = stats
+                return True
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            time.sleep(min(POLL_INTERVAL, left))
+
+    def close(self):
+        pass
+
+def make_watcher(paths_fn):
+    """
+    an inotify watcher on linux, or a polling one if that's not possible
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths_fn)
+        except (OSError, AttributeError, TypeError) as e:
+            log(f"Unable to use inotify, checking for changes instead: {e}")
+    return PollingWatcher(paths_fn)
+
+class GrowingArray():
+    """
+    an array that's appended to in chunks, with room to grow so appending only costs the
+    size of the chunk most of the time
+    """
+    def __init__(self, dtype, capacity: int = 4096):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.count = 0
+
+    def append(self, chunk: np.ndarray):
+        end = self.count + len(chunk)
+        if end > len(self.data):
+            bigger = np.zeros(max(end, 2 * len(self.data)), dtype=self.data.dtype)
+            bigger[:self.count] = self.data[:self.count]
+            self.data = bigger
+        self.data[self.count:end] = chunk
+        self.count = end
+
+    @property
+    def array(self) -> np.ndarray:
+        return self.data[:self.count]
+
+class DTMTail():
+    """
+    a DTM that's still being written. read() parses the polls added since it last ran, on
+    the watching thread, and restart() and append() use them on the app's. it has the same
+    header, inputs, port_inputs, ports, path and key as a DTMSource so the app can use
+    either, live movies just aren't cached
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.key = None
+        self.header = None      # the header as it was when polls were first read
+        self.ports = [0]
+        self.streams = [GrowingArray(INPUT_DTYPE)]
+        # what the watching thread has read so far
+        self.offset = HEADER_SIZE   # the byte after the last whole round of polls read
+        self.read_ports = None      # None until the header's been read
+        self.file_id = None         # the file's inode, a new one is a new recording
+        self.finished = False       # the header had its counts, so the recording had stopped
+
+    def read(self):
+        """
+        (header, polls of each port) added since the last read. header is only there when a
+        recording starts, which is the first read and whenever the file is started over, and
+        the polls before it are from the recording before. either can be None
+        """
+        try:
+            with open(self.path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                header = DTMHeader(f.read(HEADER_SIZE))
+                started = None
+                file_id = (stat.st_dev, stat.st_ino)
+                # the counts are only written when recording stops, so them going back to 0
+                # means another recording was started, as does the file being replaced or
+                # getting shorter
+                restarted = stat.st_size < self.offset or file_id != self.file_id or (self.finished and not header.vi_count)
+                if self.read_ports is None or restarted:
+                    if self.read_ports is not None:
+                        log("Live DTM was started over, reading it from the start")
+                    started = header
+                    self.offset = HEADER_SIZE
+                    self.read_ports = header.ports
+                    self.file_id = file_id
+                self.finished = header.vi_count > 0
+                f.seek(self.offset)
+                data = f.read()
+        except (OSError, ValueError):
+            # not written yet, or the header isn't all there
+            return None, None
+        # only whole rounds, the rest is read once Dolphin has written it
+        round_bytes = INPUT_DTYPE.itemsize * len(self.read_ports)
+        usable = len(data) // round_bytes * round_bytes
+        if usable == 0:
+            return started, None
+        self.offset += usable
+        records = np.frombuffer(data, dtype=INPUT_DTYPE, count=usable // INPUT_DTYPE.itemsize)
+        return started, split_ports(records, len(self.read_ports))
+
+    def restart(self, header: DTMHeader):
+        """
+        forgets the polls so far, for when a recording starts
+        """
+        self.header = header
+        self.ports = header.ports
+        self.streams = [GrowingArray(INPUT_DTYPE) for _ in self.ports]
+
+    def append(self, chunks):
+        for stream, chunk in zip(self.streams, chunks):
+            stream.append(chunk)
+
+    @property
+    def port_inputs(self) -> list[np.ndarray]:
+        return [stream.array for stream in self.streams]
+
+    @property
+    def inputs(self) -> np.ndarray:
+        return self.streams[0].array
+
+    def __len__(self):
+        return self.streams[0].count
+
+    def close(self):
+        pass
+
+class VideoTail():
+    """
+    counts the frames in a frame dump that's still being written
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.frames = 0
+        self.size = 0           # bytes in every part of the dump at the last count
+        self.cap = None
+        self.cap_size = None    # what size was when cap was opened, it can't read past that
+
+    def read(self) -> int:
+        """
+        how many frames there are now, only the ones added since the last count are read
+        """
+        try:
+            size = sum(part.stat().st_size for part in dump_parts(self.path))
+        except OSError:
+            size = 0
+        if size < self.size:
+            # a new dump was started over the old one
+            self.close()
+            self.frames = 0
+        self.size = size
+        if size != self.cap_size:
+            # open it again to see what's been written since, from the last frame counted
+            self.close()
+            self.cap = open_video(self.path)
+            self.cap_size = size
+            if self.frames and self.cap.isOpened():
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frames)
+        while self.cap.grab():
+            self.frames += 1
+        return self.frames
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = None
+        self.cap_size = None
+
+    def paths(self) -> list[Path]:
+        # the parts so far and the next one, which a split dump might start on
+        parts = dump_parts(self.path)
+        match = PART_PATTERN.match(parts[-1].name)
+        if match:
+            prefix, number, suffix = match.groups()
+            parts.append(parts[-1].with_name(f"{prefix}{int(number) + 1}{suffix}"))
+        return parts
+
+class LiveSession():
+    """
+    watches a DTM and optionally its frame dump on a thread of its own. poll() returns the
+    new polls of each port and the number of frames so far whenever either has changed
+    """
+    def __init__(self, dtm_path, video_path = None):
+        self.dtm = DTMTail(dtm_path)
+        self.video = VideoTail(video_path) if video_path else None
+        self.updates = queue.Queue()
+        self._stop = threading.Event()
+        self.watcher = make_watcher(self.paths)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        log(f"Following {self.dtm.path.name}{f' and {self.video.path.name}' if self.video else ''} live")
+
+    def paths(self) -> list[Path]:
+        return [self.dtm.path] + (self.video.paths() if self.video else [])
+
+    def _run(self):
+        # whatever is already there counts as a change
+        changed = True
+        while not self._stop.is_set():
+            if changed:
+                started, chunks = self.dtm.read()
+                frames = self.video.read() if self.video else 0
+                self.updates.put((started, chunks, frames))
+                # give the writes time to pile up rather than reading every small one
+                self._stop.wait(UPDATE_INTERVAL)
+            changed = self.watcher.wait(WAIT_TIMEOUT)
+        self.watcher.close()
+        if self.video:
+            self.video.close()
+
+    def poll(self):
+        """
+        (header, new polls per port, frames) since the last poll, or None if nothing changed.
+        header is the new recording's if one started, and then the polls are all from it.
+        header and the polls can be None. never blocks
+        """
+        started, chunks, frames, changed = None, [], 0, False
+        while True:
+            try:
+                new_started, new_chunks, frames = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            changed = True
+            if new_started is not None:
+                # anything before it was from the recording before
+                started, chunks = new_started, []
+            if new_chunks is not None:
+                chunks.append(new_chunks)
+        if not changed:
+            return None
+        if not chunks:
+            return started, None, frames
+        return started, [np.concatenate(port) for port in zip(*chunks)], frames
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=WAIT_TIMEOUT + 1)
+        log("Stopped following live recording")
+
+def watch(dtm: str, video: str = None):
+    """
+    prints how a live recording grows, without the app
+    """
+    session = LiveSession(dtm, video)
+    tail = session.dtm
+    try:
+        while True:
+            update = session.poll()
+            if update is not None:
+                started, chunks, frames = update
+                if started is not None:
+                    tail.restart(started)
+                if chunks is not None:
+                    tail.append(chunks)
+                log(f"{len(tail)} polls per port" + (f", {frames} frames" if video else ""))
+            time.sleep(UPDATE_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.stop()
+
+def simulate(dtm: str, video: str, out_dir: str, speed: float = 1.0, step: float = 0.05):
+    """
+    writes dtm and video into out_dir as if they were being recorded. the polls go in at
+    the movie's poll rate and the video's bytes at the same pace, and the real header is
+    written once everything's in, like Dolphin does when recording stops
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    header_bytes = Path(dtm).read_bytes()[:HEADER_SIZE]
+    header = DTMHeader(header_bytes)
+    records = Path(dtm).read_bytes()[HEADER_SIZE:]
+    round_bytes = INPUT_DTYPE.itemsize * len(header.ports)
+    rounds = len(records) // round_bytes
+    video_bytes = Path(video).read_bytes() if video else b""
+    seconds = rounds / header.polls_per_second
+    # the counts are only known when recording stops
+    empty_header = bytearray(header_bytes)
+    empty_header[0x0D:0x0D + 24] = bytes(24)
+
+    dtm_out = out / Path(dtm).name
+    video_out = out / Path(video).name if video else None
+    log(f"Simulating {seconds:.1f}s of recording into {out}")
+    with open(dtm_out, "wb") as dtm_file, open(video_out, "wb") if video_out else open(os.devnull, "wb") as video_file:
+        dtm_file.write(empty_header)
+        written_rounds = written_bytes = 0
+        start = time.perf_counter()
+        while written_rounds < rounds or written_bytes < len(video_bytes):
+            progress = min(1.0, (time.perf_counter() - start) * speed / seconds)
+            due_rounds = int(rounds * progress)
+            due_bytes = int(len(video_bytes) * progress)
+            dtm_file.write(records[written_rounds * round_bytes:due_rounds * round_bytes])
+            video_file.write(video_bytes[written_bytes:due_bytes])
+            dtm_file.flush()
+            video_file.flush()
+            written_rounds, written_bytes = due_rounds, due_bytes
+            time.sleep(step)
+        dtm_file.seek(0)
+        dtm_file.write(header_bytes)
+    log(f"Finished simulating {written_rounds} rounds of polls")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow a DTM and frame dump while they're being recorded")
+    commands = parser.add_subparsers(dest="command", required=True)
+    watch_parser = commands.add_parser("watch", help="print how a recording grows")
+    watch_parser.add_argument("dtm")
+    watch_parser.add_argument("video", nargs="?")
+    simulate_parser = commands.add_parser("simulate", help="write a finished recording out bit by bit")
+    simulate_parser.add_argument("dtm")
+    simulate_parser.add_argument("video", nargs="?")
+    simulate_parser.add_argument("out_dir")
+    simulate_parser.add_argument("--speed", type=float, default=1.0, help="how many times faster than real time")
+    args = parser.parse_args()
+    if args.command == "watch":
+        watch(args.dtm, args.video)
+    else:
+        try:
+            simulate(args.dtm, args.video, args.out_dir, args.speed)
+        except (OSError, ValueError) as e:
+            err(f"Simulation failed: {e}")
+            raise SystemExit(1)
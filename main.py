@@ -1,39 +1,94 @@
 from PIL import Image, ImageTk
 from util import *
+import subprocess
+import sys
+import time
+import numpy as np
 import customtkinter as ctk
 from customtkinter import filedialog
+import tkinter
 from tkinter import messagebox, simpledialog
-from convert_video import ffmpeg
-import subprocess
+from convert_video import EncodeJob, JobManager, default_segments
 from pathlib import Path
 from video_player import VideoPlayer
+from timeline import Timeline, activity_bands
+from stats_panel import StatsPanel
+from input_search import InputIndex
+from dtm_diff import MovieDiff, summary as diff_summary
+from video_source import dump_parts
 from math import floor, pi, sin, cos, radians, sqrt
-import time
 from preferences import PreferencesWindow, Preferences
-import shutil
 from shapes import *
+from cache import FileCache
+from proxy import ProxyManager
+from dtm import DTMSource, NO_INPUTS
+from frame_map import FrameMap, DEFAULT_FPS
+from align import synced_frame_map
+from live import LiveSession
+from sprite_renderer import PortsRenderer, get_renderer
+from overlay import RenderPlan, blank_state, blank_levels, MAIN_STICK, C_STICK, \
+    STICK_COLOURS, BUTTON_SHAPES, TRIGGER_SHAPES, DRAW_ORDER, OUTLINED_BUTTONS, END_COLOURS
 
 basedir = Path(__file__).resolve().parent
 
-log(f"Checking for dtm2text in PATH")
-if not shutil.which("dtm2text"):
-    err_popup("dtm2text not found either in PATH or your VENV. Install requirements with:\n" \
-        "pip install -r requirements.txt")
-    exit()
-
 corner_radius = cr = 6
 padding = pd = 4 
+# timeline markers for search results
+SEARCH_COLOUR = "#f38ba8"
+# timeline ranges where a compared DTM differs
+DIFF_COLOUR = "#fab387"
+# live mode: how often the app takes new polls and frames, how far behind the recording
+# playback can fall before it jumps, and how far behind it jumps to
+LIVE_POLL_MS = 100
+LIVE_MAX_BEHIND = 2.0
+LIVE_FOLLOW_BEHIND = 1.0
+# the stats go over every poll so they're only worked out again every so often
+LIVE_STATS_SECONDS = 5.0
 
 settings = Preferences()
+encoder = JobManager()
+dtm_cache = FileCache(basedir / "cache" / "dtm", int(settings.options["cache_size_mb"].value) * 1024 * 1024)
+proxy_cache = FileCache(basedir / "cache" / "proxy", int(settings.options["proxy_cache_mb"].value) * 1024 * 1024)
+proxies = ProxyManager(proxy_cache)
 
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
         self.dtm = ""
-        self.dtm_inputs = []
+        self.dtm_source = None
+        self.dtm_inputs = NO_INPUTS
         self.vid = ""
-        # timers used for fade effect
-        self.button_timers = [0.0] *  10
+        # compression jobs this window is waiting on, the video loads when one finishes
+        self.encode_jobs: list[EncodeJob] = []
+        # align.py lining the video up with the DTM, run as its own process like ffmpeg
+        self.align_proc = None
+        # a DTM and frame dump being followed while they're recorded, see live.py
+        self.live = None
+        self.live_video = ""
+        self.live_job = None
+        self.live_stats_time = 0.0
+        # per-poll overlay state, built when a DTM is loaded
+        self.render_plan = None
+        # a render plan per port for multiplayer movies, the first is render_plan
+        self.render_plans = []
+        # the ports the controller pane is drawing, only port 1 when nothing is loaded
+        self.ports = [0]
+        # a second DTM to compare against, drawn on its own controller
+        self.compare_dtm = ""
+        self.compare_source = None
+        self.compare_plans = []     # a render plan per port of the compared DTM
+        self.compare_sprites = None
+        self.compare_img = None
+        self.dtm_diff = None
+        # which poll each video frame shows, for the loaded and compared DTMs
+        self.frame_map = None
+        self.compare_map = None
+        # bitsets of the inputs for searching, and the polls the last search matched
+        self.search_index = None
+        self.search_bits = None
+        self.blank_state = blank_state()
+        # the overlay state currently on the canvas, so unchanged items can be skipped
+        self.drawn_state = None
         # list of button draw objects to iterate through when being pressed/fading
         self.button_draws = []
         # global button draw objects
@@ -83,17 +138,31 @@ class App(ctk.CTk):
         target_width = 300
         aspect_ratio = target_width / pil_img.width
 
-        self.img = ImageTk.PhotoImage(pil_img.resize((target_width, round(pil_img.height * aspect_ratio))))
+        self.gc_image = pil_img.resize((target_width, round(pil_img.height * aspect_ratio)))
+        self.img = ImageTk.PhotoImage(self.gc_image)
 
+        # the controller and the input stats under it
+        controller_pane = ctk.CTkFrame(self, fg_color="transparent")
+        controller_pane.grid(row=0, column=2, sticky="ns")
+        controller_pane.grid_rowconfigure(1, weight=1)
         self.img_gc = ctk.CTkCanvas(
-            self,
+            controller_pane,
             width=self.img.width(),
             height=self.img.height(),
             highlightthickness=0,
             bg=self.cget("fg_color")[1]
         )
-        self.img_gc.grid(row=0, column=2, sticky="nw")
-        self.img_gc.create_image(0, 0, anchor="nw", image=self.img)
+        self.img_gc.grid(row=0, column=0, sticky="nw")
+        # a second controller beside the first when comparing DTMs, only shown while one is loaded
+        self.img_compare = ctk.CTkCanvas(
+            controller_pane,
+            width=self.img.width(),
+            height=self.img.height(),
+            highlightthickness=0,
+            bg=self.cget("fg_color")[1]
+        )
+        self.stats_panel = StatsPanel(controller_pane, cr, pd)
+        self.stats_panel.grid(row=1, column=0, columnspan=2, padx=pd, pady=pd, sticky="nsew")
         self.init_draws()
 
         # labels
@@ -101,6 +170,18 @@ class App(ctk.CTk):
         self.lbl_dtm.grid(row=0, column=0, sticky="w", padx=pd, pady=0)
         self.lbl_vid = ctk.CTkLabel(statusbar, text=self.get_vid_text(), font=ctk.CTkFont(size=14))
         self.lbl_vid.grid(row=1, column=0, sticky="w", padx=pd, pady=0)
+        statusbar.grid_columnconfigure(0, weight=1)
+
+        # compression progress, only shown while a video is being compressed
+        self.encode_frame = ctk.CTkFrame(statusbar, fg_color="transparent")
+        self.lbl_encode = ctk.CTkLabel(self.encode_frame, text="", font=ctk.CTkFont(size=14))
+        self.lbl_encode.grid(row=0, column=0, sticky="e", padx=pd, pady=0)
+        self.prg_encode = ctk.CTkProgressBar(self.encode_frame, width=160)
+        self.prg_encode.grid(row=0, column=1, padx=pd, pady=0)
+        self.btn_cancel_encode = ctk.CTkButton(
+            self.encode_frame, text="Cancel", width=60, command=self.cancel_encode, corner_radius=cr
+        )
+        self.btn_cancel_encode.grid(row=0, column=2, padx=pd, pady=0)
 
         # buttons
         self.btn_sample = ctk.CTkButton(sidebar_upper, text="Load Sample", command=self.load_sample, corner_radius=cr)
@@ -109,32 +190,64 @@ class App(ctk.CTk):
         self.btn_dtm.grid(row=1, column=0, padx=pd, pady=pd)
         self.btn_video = ctk.CTkButton(sidebar_upper, text="Load Video", command=self.load_video, corner_radius=cr)
         self.btn_video.grid(row=2, column=0, padx=pd, pady=pd)
+        self.btn_compare = ctk.CTkButton(sidebar_upper, text="Compare DTM", command=self.load_compare, corner_radius=cr)
+        self.btn_compare.grid(row=3, column=0, padx=pd, pady=pd)
+        self.btn_align = ctk.CTkButton(sidebar_upper, text="Align Video", command=self.align_video, corner_radius=cr)
+        self.btn_align.grid(row=4, column=0, padx=pd, pady=pd)
+        self.btn_live = ctk.CTkButton(sidebar_upper, text="Go Live", command=self.load_live, corner_radius=cr)
+        self.btn_live.grid(row=5, column=0, padx=pd, pady=pd)
         self.btn_unload = ctk.CTkButton(sidebar_upper, text="Unload", command=self.unload, corner_radius=cr)
-        self.btn_unload.grid(row=3, column=0, padx=pd, pady=pd)
+        self.btn_unload.grid(row=6, column=0, padx=pd, pady=pd)
         # self.spacer
         self.spacer = ctk.CTkFrame(sidebar_upper, height=20, width=1)
-        self.spacer.grid(row=4, column=0, padx=pd, pady=pd)
+        self.spacer.grid(row=7, column=0, padx=pd, pady=pd)
         # preferences
         self.btn_pref = ctk.CTkButton(sidebar_upper, text="Preferences", command=self.open_pref, corner_radius=cr)
-        self.btn_pref.grid(row=5, column=0, padx=pd, pady=pd)
+        self.btn_pref.grid(row=8, column=0, padx=pd, pady=pd)
+        # input search, enter finds the next match and n / N go between them
+        self.ent_search = ctk.CTkEntry(sidebar_upper, placeholder_text="Search inputs", width=140)
+        self.ent_search.grid(row=9, column=0, padx=pd, pady=(pd * 4, pd))
+        self.ent_search.bind("<Return>", lambda e: self.search_inputs())
+        self.ent_search.bind("<Escape>", lambda e: self.focus_set())
+        self.lbl_search = ctk.CTkLabel(sidebar_upper, text="", font=ctk.CTkFont(size=12))
+        self.lbl_search.grid(row=10, column=0, padx=pd, pady=0)
         # lower pane
+        sidebar.grid_rowconfigure(2, weight=0)
+        self.lbl_rate = ctk.CTkLabel(sidebar, text="1x", font=ctk.CTkFont(size=14))
+        self.lbl_rate.grid(row=1, column=0, padx=pd, pady=0)
         self.btn_play = ctk.CTkButton(sidebar, text="Play", command=self.play_video, corner_radius=cr)
-        self.btn_play.grid(row=1, column=0, padx=pd, pady=pd)
+        self.btn_play.grid(row=2, column=0, padx=pd, pady=pd)
         self.video_player.play_button = self.btn_play
         self.video_player.on_frame_update = self.draw_inputs
+        self.video_player.on_rate_change = lambda rate: self.lbl_rate.configure(text=f"{rate:g}x")
 
         # keyboard shortcuts
-        self.bind("<space>", self.play_video)
-        self.bind("<k>", self.play_video)
-        self.bind("<Left>", self.try_seek)
-        self.bind("<j>", self.try_seek)
-        self.bind("<Right>", self.try_seek)
-        self.bind("<l>", self.try_seek)
+        self.bind_shortcut("<space>", self.play_video)
+        self.bind_shortcut("<k>", self.play_video)
+        self.bind_shortcut("<Left>", self.try_seek)
+        self.bind_shortcut("<j>", self.try_seek)
+        self.bind_shortcut("<Right>", self.try_seek)
+        self.bind_shortcut("<l>", self.try_seek)
+        # frame by frame, and playback speed
+        self.bind_shortcut("<comma>", lambda e: self.step_video(-1))
+        self.bind_shortcut("<period>", lambda e: self.step_video(1))
+        self.bind_shortcut("<less>", lambda e: self.video_player.change_rate(-1))
+        self.bind_shortcut("<greater>", lambda e: self.video_player.change_rate(1))
+        self.bind_shortcut("<BackSpace>", lambda e: self.play_video(direction=-1))
+        # next and previous search match
+        self.bind_shortcut("<n>", lambda e: self.jump_to_match(1))
+        self.bind_shortcut("<N>", lambda e: self.jump_to_match(-1))
+
+        # playback timeline
+        self.slider = Timeline(self)
 
-        # playback slider
-        self.slider = ctk.CTkSlider(self)
+    def bind_shortcut(self, sequence: str, command):
+        # shortcuts are for the whole window, but not while typing in a text box
+        self.bind(sequence, lambda e: None if isinstance(e.widget, tkinter.Entry) else command(e))
 
     def get_dtm_text(self) -> str:
+        if len(self.dtm) > 0 and self.compare_dtm:
+            return f"DTM loaded: {self.dtm} (comparing with {Path(self.compare_dtm).name})"
         if len(self.dtm) > 0:
             return f"DTM loaded: {self.dtm}"
         else:
@@ -150,6 +263,7 @@ class App(ctk.CTk):
         # if the dtm file is an empty string, then unload
         if len(filename) == 0:
             log("Unloading DTM file")
+            self.close_dtm()
             self.dtm = ""
             self.lbl_dtm.configure(text=self.get_dtm_text())
             return
@@ -159,44 +273,139 @@ class App(ctk.CTk):
             err_popup(f"DTM file was not found:\n\n{file.absolute()}")
             return
         
-        # check if the output dtm file already exists and if so try to remove it
-        output_dir = basedir / "dtm2text"
-        output_dir.mkdir(exist_ok=True)
-        output_fn = output_dir / f"{file.name}_inputs.txt"
-        if output_fn.exists() and output_fn.is_file():
-            try:
-                output_fn.unlink()
-                log(f"Removed existing DTM file: {output_fn.absolute()}")
-            except Exception as e:
-                err_popup(f"Failed to replace existing DTM inputs file:\n\n{e}")
-                return
-            
-        log(f"Converting DTM file to text at: {file.absolute()}")
-        subprocess.run(
-            [
-                "dtm2text",
-                str(file.absolute()),
-                "--no-header",
-                "-o", str(output_dir.absolute())
-            ],
-            cwd=output_dir.absolute()
-        )
-        
-        # if dtm2text fails there won't be an output file and thus we can't set the new dtm
-        if not output_fn.exists():
-            err_popup(f"Failed to convert DTM file to TXT.\nOutput not found at:\n\n{output_fn}")
+        log(f"Opening DTM file at: {file.absolute()}")
+        dtm_cache.max_bytes = int(settings.options["cache_size_mb"].value) * 1024 * 1024
+        try:
+            source = DTMSource(file, dtm_cache)
+        except Exception as e:
+            err_popup(f"Failed to read DTM file:\n\n{e}")
             return
+        self.close_dtm()
+        self.dtm_source = source
+        # zero-copy view of the mapped file (or its cache entry), polls are decoded when
+        # draw_inputs reads them
+        self.dtm_inputs = source.inputs
+        log(f"Mapped {len(self.dtm_inputs)} DTM inputs")
         
-        log("Successful conversion of DTM to TXT")
-        
-        with open(output_fn, 'r') as f:
-            self.dtm_inputs = [line.strip() for line in f.readlines()]
-        log("Read DTM input lines")
+        # work out the overlay for every poll up front
+        self.render_plans = [RenderPlan(inputs, source.header.polls_per_second) for inputs in source.port_inputs]
+        self.render_plan = self.render_plans[0]
+        self.drawn_state = None
+        log(f"Built DTM render plan for {len(self.render_plans)} port(s)")
+        self.set_ports(source.ports)
+        self.stats_panel.set_inputs(source.port_inputs, source.ports, source.header.polls_per_second)
+        self.search_index = InputIndex(source.port_inputs, source.ports)
+        log("Built DTM search index")
         
         self.dtm = str(file.absolute())
         self.lbl_dtm.configure(text=self.get_dtm_text())
+        self.update_frame_map()
         
-    def set_vid(self, filename: str, compression: str = "Ask"):
+    def close_dtm(self):
+        # the comparison was against these inputs
+        self.close_compare()
+        self.dtm_inputs = NO_INPUTS
+        self.render_plan = None
+        self.render_plans = []
+        self.set_ports([0])
+        self.frame_map = None
+        self.search_index = None
+        self.search_bits = None
+        if self.dtm_source is not None:
+            self.dtm_source.close()
+            self.dtm_source = None
+        self.slider.set_activity(None)
+        self.slider.clear_markers("search")
+        self.stats_panel.clear()
+        self.lbl_search.configure(text="")
+
+    def set_compare(self, filename: str):
+        """
+        loads a second DTM, diffs it against the loaded one and shows both controllers
+        """
+        if not self.dtm:
+            err_popup("Load a DTM first, then the DTM to compare it with")
+            return
+        file = Path(filename)
+        log(f"Opening DTM to compare at: {file.absolute()}")
+        try:
+            source = DTMSource(file, dtm_cache)
+        except Exception as e:
+            err_popup(f"Failed to read DTM file:\n\n{e}")
+            return
+        self.close_compare()
+        self.compare_source = source
+        self.compare_dtm = str(file.absolute())
+        self.compare_plans = [RenderPlan(inputs, source.header.polls_per_second) for inputs in source.port_inputs]
+        # every port of each movie, a port only one of them uses differs all the way through
+        self.dtm_diff = MovieDiff.from_sources(self.dtm_source, source)
+        if self.dtm_diff.identical:
+            log("Compared DTM inputs are identical")
+        else:
+            log(f"Compared DTM diverges at poll {self.dtm_diff.first} on port {self.dtm_diff.first_diff.port + 1}")
+        self.update_frame_map()
+        self.stats_panel.set_notes(diff_summary(self.dtm_diff, self.dtm_source.header.polls_per_second, 5))
+
+        # the compared controllers are always drawn with sprites, one canvas image is simplest
+        self.compare_sprites = PortsRenderer(get_renderer(self.gc_image, "compare"), source.ports)
+        self.compare_img = ImageTk.PhotoImage(self.compare_sprites.image)
+        self.img_compare.configure(width=self.compare_img.width(), height=self.compare_img.height())
+        self.img_compare.delete("all")
+        self.img_compare.create_image(0, 0, anchor="nw", image=self.compare_img)
+        self.img_compare.grid(row=0, column=1, sticky="nw")
+        self.lbl_dtm.configure(text=self.get_dtm_text())
+        self.draw_inputs(self.video_player.current_frame_index, not self.vid)
+        # straight to where they diverge, if that's on a frame at all
+        diff_ranges = self.dtm_diff.frame_ranges(self.frame_map)
+        if self.vid and len(diff_ranges):
+            self.video_player.seek(int(diff_ranges[0, 0]))
+
+    def close_compare(self):
+        if self.compare_source is None:
+            return
+        self.compare_source.close()
+        self.compare_source = None
+        self.compare_dtm = ""
+        self.compare_plans = []
+        self.compare_map = None
+        self.compare_sprites = None
+        self.dtm_diff = None
+        self.img_compare.grid_forget()
+        self.slider.clear_markers("diff")
+        self.stats_panel.set_notes("")
+        self.lbl_dtm.configure(text=self.get_dtm_text())
+
+    def update_frame_map(self):
+        """
+        works out which poll each frame shows again, for when the DTM, the compared DTM or
+        the video (and so its framerate and length) change
+        """
+        if self.dtm_source is None:
+            return
+        fps = self.video_player.fps if self.vid else DEFAULT_FPS
+        # a live video's length so far says nothing about the movie, it's mapped as it grows
+        frames = self.video_player.total_frames if self.vid and self.live is None else None
+        # lined up with the video if it's been aligned with this DTM
+        self.frame_map = synced_frame_map(self.dtm_source, self.vid, fps, frames, dtm_cache)
+        if self.search_index is not None:
+            self.search_index.frame_map = self.frame_map
+        if self.compare_source is not None:
+            # the compared DTM is drawn against the same video, so it gets the same offset
+            self.compare_map = FrameMap.for_source(
+                self.compare_source, fps, frames, dtm_cache, offset=self.frame_map.offset
+            )
+            self.slider.set_ranges("diff", self.dtm_diff.frame_ranges(self.frame_map), DIFF_COLOUR)
+        log(f"Mapped {len(self.frame_map)} frames to DTM polls")
+        self.update_activity()
+
+    def update_activity(self):
+        # input activity under the timeline, needs both the inputs and the video's length
+        if not self.vid or len(self.dtm_inputs) == 0 or self.frame_map is None:
+            self.slider.set_activity(None)
+            return
+        self.slider.set_activity(activity_bands(self.dtm_inputs, self.frame_map.frame_polls, self.frame_map.offset))
+        
+    def set_vid(self, filename: str, compression: str = "Ask", live: bool = False):
         # if the video file is an empty string, then unload
         if len(filename) == 0:
             log("Unloading video file")
@@ -209,6 +418,13 @@ class App(ctk.CTk):
             err_popup(f"Video file was not found:\n\n{filename}")
             return
         
+        # split dumps are played as one video straight from their parts
+        parts = dump_parts(file)
+        if len(parts) > 1:
+            log(f"Found {len(parts)} parts of a split frame dump, starting with {parts[0].name}")
+            file = parts[0]
+            compression = "Never"
+        
         if not compression == "Never":
             # init compression as true, assuming compression is set to always
             result = True
@@ -272,13 +488,24 @@ class App(ctk.CTk):
                             err_popup(f"Failed to replace existing video file:\n\n{e}")
                             return
                 
-                # calls ffmpeg with pre-defined command for a small 480p30 mp4 video
-                if ffmpeg(
+                # compress in the background with ffmpeg, the compressed video is loaded when
+                # it's done (see poll_encodes)
+                segments = int(settings.options["compress_segments"].value or 0) or default_segments()
+                job = EncodeJob(
                     input=str(file.absolute()),
                     output=str(output_fn.absolute()),
-                    fps=fps
-                ):
-                    file = output_fn
+                    fps=fps,
+                    segments=segments
+                )
+                if not encoder.submit(job):
+                    err_popup("There are already too many videos waiting to be compressed, " \
+                              "please wait for them to finish first.")
+                    return
+                self.encode_jobs.append(job)
+                # start polling unless it's already running for an earlier job
+                if len(self.encode_jobs) == 1:
+                    self.poll_encodes()
+                return
             
             elif result is None: # pressed Cancel
                 log("User cancelled video load when prompted about video compression")
@@ -291,8 +518,13 @@ class App(ctk.CTk):
             log("Video compression automatically skipped")
         
         # load video to canvas
+        self.video_player.buffer_depth = int(settings.options["frame_buffer_size"].value)
+        self.video_player.frame_cache.max_bytes = int(settings.options["frame_cache_mb"].value) * 1024 * 1024
+        self.video_player.reverse_buffer_bytes = int(settings.options["reverse_buffer_mb"].value) * 1024 * 1024
+        proxy_cache.max_bytes = int(settings.options["proxy_cache_mb"].value) * 1024 * 1024
+        self.video_player.proxy_manager = proxies if settings.options["proxy_videos"].value == "On" else None
         try:
-            self.video_player.set_video(file.absolute(), self.slider, 1, 1, pd)
+            self.video_player.set_video(file.absolute(), self.slider, 1, 1, pd, live)
         except Exception as e:
             err_popup(f"Failed to load the video to canvas using cv2:\n\n{e}")
             return
@@ -300,6 +532,196 @@ class App(ctk.CTk):
         log(f"Loaded video at: {file.absolute()}")
         self.vid = str(file.absolute())
         self.lbl_vid.configure(text=self.get_vid_text())
+        self.update_frame_map()
+
+    def poll_encodes(self):
+        # checks on the compression jobs, ffmpeg runs on another thread so this is
+        # polled instead of being called back
+        for job in list(self.encode_jobs):
+            if not job.finished:
+                continue
+            self.encode_jobs.remove(job)
+            if job.status == "done":
+                self.set_vid(job.output, "Never")
+            elif job.status == "failed":
+                err_popup(f"FFmpeg failed with error:\n\n{job.error}")
+        
+        if not self.encode_jobs:
+            self.encode_frame.grid_forget()
+            return
+        
+        job = self.encode_jobs[0]
+        text = f"Compressing {Path(job.input).name}"
+        if job.status == "queued":
+            text += " (queued)"
+        elif job.eta is not None:
+            minutes, seconds = divmod(int(job.eta), 60)
+            text += f" {job.progress:.0%} ETA {minutes}:{seconds:02}"
+        if len(self.encode_jobs) > 1:
+            text += f" +{len(self.encode_jobs) - 1} more"
+        self.lbl_encode.configure(text=text)
+        self.prg_encode.set(job.progress)
+        self.encode_frame.grid(row=0, rowspan=2, column=1, sticky="e", padx=pd, pady=0)
+        self.after(200, self.poll_encodes)
+    
+    def align_video(self):
+        """
+        lines the video up with the DTM in the background, the frame map picks up the sync
+        map it saves when it's done
+        """
+        if not self.dtm or not self.vid:
+            err_popup("Load a DTM and its video to align them")
+            return
+        if self.align_proc is not None:
+            return
+        log(f"Aligning {Path(self.vid).name} with {Path(self.dtm).name}")
+        self.align_proc = subprocess.Popen([sys.executable, str(basedir / "align.py"), self.vid, self.dtm])
+        self.btn_align.configure(text="Aligning...", state="disabled")
+        self.after(500, self.poll_align)
+
+    def poll_align(self):
+        if self.align_proc.poll() is None:
+            self.after(500, self.poll_align)
+            return
+        code = self.align_proc.returncode
+        self.align_proc = None
+        self.btn_align.configure(text="Align Video", state="normal")
+        if code != 0:
+            err_popup("Failed to align the video with the DTM, see the console for details")
+            return
+        self.update_frame_map()
+        self.draw_inputs(self.video_player.current_frame_index, not self.vid)
+
+    def start_live(self, dtm: str, video: str = ""):
+        """
+        follows a DTM, and the frame dump being recorded with it if there is one, while
+        Dolphin writes them. they're picked up once they have polls and frames in them
+        """
+        self.unload()
+        try:
+            self.live = LiveSession(dtm, video or None)
+        except OSError as e:
+            err_popup(f"Failed to follow the recording:\n\n{e}")
+            return
+        self.live_video = video
+        self.live_stats_time = 0.0
+        self.btn_live.configure(text="Stop Live")
+        self.lbl_dtm.configure(text=f"Waiting for polls in: {Path(dtm).name}")
+        self.poll_live()
+
+    def poll_live(self):
+        # the session reads the files on its own thread, this just takes what it's read
+        update = self.live.poll()
+        if update is not None:
+            self.extend_live(*update)
+        self.live_job = self.after(LIVE_POLL_MS, self.poll_live)
+
+    def extend_live(self, started, chunks, frames: int):
+        """
+        adds the polls of each port and the frames recorded since the last update, only the
+        new polls are planned and mapped and only the new part of the timeline is redrawn.
+        started is the header of a recording that's just started, everything from the one
+        before is thrown away
+        """
+        tail = self.live.dtm
+        if started is not None:
+            if self.dtm_source is not None:
+                log("Live DTM was started over, rebuilding from its first polls")
+                self.close_dtm()
+                self.dtm = ""
+                self.lbl_dtm.configure(text=f"Waiting for polls in: {tail.path.name}")
+            tail.restart(started)
+            self.live_stats_time = 0.0
+        header = tail.header
+        if chunks is not None:
+            tail.append(chunks)
+            self.dtm_inputs = tail.inputs
+            if self.dtm_source is None:
+                # the first polls, set up like a loaded DTM
+                log(f"Live DTM has {len(tail.ports)} port(s)")
+                self.dtm_source = tail
+                self.dtm = str(tail.path.absolute())
+                self.render_plans = [RenderPlan(inputs, header.polls_per_second) for inputs in tail.port_inputs]
+                self.render_plan = self.render_plans[0]
+                self.drawn_state = None
+                self.set_ports(tail.ports)
+                self.search_index = InputIndex(tail.port_inputs, tail.ports)
+                self.lbl_dtm.configure(text=self.get_dtm_text())
+            else:
+                for plan, chunk in zip(self.render_plans, chunks):
+                    plan.extend(chunk)
+            if time.monotonic() - self.live_stats_time > LIVE_STATS_SECONDS:
+                self.live_stats_time = time.monotonic()
+                self.stats_panel.set_inputs(tail.port_inputs, tail.ports, header.polls_per_second)
+
+        player = self.video_player
+        if self.vid and frames < player.total_frames:
+            # a new dump was started over the old one, it's opened again once it has frames
+            self.set_vid("")
+        if self.live_video and frames and not self.vid:
+            # the dump has its first frames, open it now
+            self.set_vid(self.live_video, compression="Never", live=True)
+        if self.vid:
+            player.extend_video(frames)
+
+        if self.dtm_source is not None:
+            if self.frame_map is None:
+                self.update_frame_map()
+            elif chunks is not None:
+                self.extend_frame_map()
+
+        if not self.vid:
+            # nothing to play, so show the latest poll
+            if self.frame_map is not None and len(self.dtm_inputs):
+                self.draw_inputs(self.frame_map.frame(len(self.dtm_inputs) - 1))
+            return
+        # playback follows the recording, but if it's fallen too far behind it jumps to
+        # just before the end so it never lags by more than LIVE_MAX_BEHIND
+        edge = player.total_frames - 1
+        fps = player.fps or DEFAULT_FPS
+        if (player.playing or player.live_waiting) and edge - player.current_frame_index > LIVE_MAX_BEHIND * fps:
+            player.seek(max(0, edge - round(LIVE_FOLLOW_BEHIND * fps)))
+        # the frame on screen might have only just got its polls
+        if self.frame_map is not None:
+            self.draw_inputs(player.current_frame_index)
+
+    def extend_frame_map(self):
+        # maps the new polls and redraws the activity from the first frame that could change
+        frame_map = self.frame_map
+        # the frame the last old poll is on might not have had all its polls yet
+        start = max(0, int(np.searchsorted(frame_map.frame_polls, frame_map.polls)) - 1)
+        frame_map.extend(self.dtm_source.header, len(self.dtm_inputs), self.video_player.fps if self.vid else DEFAULT_FPS)
+        if not self.vid:
+            return
+        if start + frame_map.offset <= 0:
+            self.update_activity()
+            return
+        # only the polls from the first changed frame on are looked at
+        first_poll = int(frame_map.frame_polls[start]) if start < len(frame_map.frame_polls) else len(self.dtm_inputs)
+        bands = activity_bands(self.dtm_inputs[first_poll:], frame_map.frame_polls[start:] - first_poll)
+        self.slider.extend_activity(bands, start + frame_map.offset)
+
+    def end_live(self):
+        if self.live_job is not None:
+            self.after_cancel(self.live_job)
+            self.live_job = None
+        self.live.stop()
+        self.live = None
+        self.btn_live.configure(text="Go Live")
+
+    def stop_live(self):
+        """
+        stops following the recording and opens what's been recorded like any other files
+        """
+        dtm, video = str(self.live.dtm.path), self.live_video
+        self.unload()
+        self.set_dtm(dtm)
+        if video and Path(video).exists():
+            self.set_vid(video, compression="Never")
+
+    def cancel_encode(self):
+        if self.encode_jobs:
+            self.encode_jobs[0].cancel()
 
     # button callbacks
     def load_sample(self):
@@ -322,6 +744,45 @@ class App(ctk.CTk):
         else:
             log("User cancelled loading DTM")
         
+    def load_live(self):
+        if self.live is not None:
+            self.stop_live()
+            return
+        # save dialogs so the files can be picked before Dolphin has made them
+        dtm = filedialog.asksaveasfilename(
+            title="DTM being recorded",
+            confirmoverwrite=False,
+            filetypes=[(
+                "DTM Dolphin Test Movie Files",
+                "*.dtm"
+            )]
+        )
+        if not dtm:
+            log("User cancelled going live")
+            return
+        # the frame dump is optional, cancelling follows just the DTM
+        video = filedialog.asksaveasfilename(
+            title="Frame dump being recorded (optional)",
+            confirmoverwrite=False,
+            filetypes=[(
+                "Video Files",
+                "*.avi;*.mp4"
+            )]
+        )
+        self.start_live(dtm, video)
+
+    def load_compare(self):
+        filename = filedialog.askopenfilename(
+            filetypes=[(
+                "DTM Dolphin Test Movie Files",
+                "*.dtm"
+            )]
+        )
+        if filename:
+            self.set_compare(filename)
+        else:
+            log("User cancelled loading DTM to compare")
+
     def load_video(self):
         # file dialog for selecting specific video files
         filename = filedialog.askopenfilename(
@@ -338,24 +799,71 @@ class App(ctk.CTk):
         else:
             log("User cancelled loading video")
 
-    def play_video(self, event = None):
+    def play_video(self, event = None, direction: int = 1):
         if not self.dtm or not self.vid:
             err("Both a DTM file and a video must be loaded for playback")
             return
         
         # play function handles if its already playing or not
-        self.video_player.play_pause()
+        self.video_player.play_pause(direction)
+
+    def search_inputs(self):
+        # runs the search in the search box, marks the matches and jumps to the next one
+        if self.search_index is None:
+            err("A DTM file must be loaded to search its inputs")
+            return
+        if self.search_index.polls != len(self.dtm_inputs):
+            # the movie is being recorded live and has grown since the index was built
+            self.search_index = InputIndex(self.dtm_source.port_inputs, self.dtm_source.ports, self.frame_map)
+        query = self.ent_search.get()
+        try:
+            self.search_bits = self.search_index.search(query)
+        except ValueError as e:
+            self.search_bits = None
+            self.slider.clear_markers("search")
+            self.lbl_search.configure(text=str(e))
+            return
+        count = self.search_index.count(self.search_bits)
+        log(f"Search '{query}' matched {count} polls")
+        self.lbl_search.configure(text=f"{count} matching polls")
+        self.slider.set_markers("search", self.search_index.frames(self.search_bits), SEARCH_COLOUR)
+        self.jump_to_match(1)
+
+    def jump_to_match(self, direction: int):
+        if self.search_bits is None or not self.vid:
+            return
+        current = self.video_player.current_frame_index
+        if direction > 0:
+            frame_index = self.search_index.next_frame(self.search_bits, current)
+            # carry on from the other end like a text search
+            if frame_index is None:
+                frame_index = self.search_index.next_frame(self.search_bits, -1)
+        else:
+            frame_index = self.search_index.previous_frame(self.search_bits, current)
+            if frame_index is None:
+                frame_index = self.search_index.previous_frame(self.search_bits, self.video_player.total_frames)
+        if frame_index is None or frame_index >= self.video_player.total_frames:
+            self.lbl_search.configure(text="No matches in the video")
+            return
+        self.video_player.seek(frame_index)
+
+    def step_video(self, delta: int):
+        if not self.vid:
+            return
+        self.video_player.step_frame(delta)
 
     def try_seek(self, event = None, value = 50):
         if event.keysym == "Left" or event.keysym == "j":
             self.slider.set(max(self.slider.get() - 50, 0))
         elif event.keysym == "Right" or event.keysym == "l":
-            self.slider.set(min(self.slider.get() + 50, self.slider.cget("to")))
+            self.slider.set(min(self.slider.get() + 50, self.slider.total - 1))
         self.video_player.on_seek(self.slider.get())
 
     # removes any currently loaded videos from the dtm and vid variables, pauses video if playing
     # TODO: implement clear image function in VideoPlayer and call that here
     def unload(self):
+        if self.live is not None:
+            self.end_live()
         self.set_dtm("")
         self.set_vid("")
         if self.video_player.playing:
@@ -367,215 +875,129 @@ class App(ctk.CTk):
         self.slider.grid_forget()
 
     def open_pref(self):
-        PreferencesWindow(self, settings)
+        PreferencesWindow(self, settings, on_close=self.apply_preferences)
+
+    def apply_preferences(self):
+        # the overlay renderer may have changed so rebuild the controller
+        self.init_draws()
+        self.draw_inputs(self.video_player.current_frame_index, not self.dtm)
+
+    def set_ports(self, ports: list[int]):
+        # more than one controller needs the sprite renderer, so rebuild the pane if they change
+        if ports == self.ports:
+            return
+        self.ports = ports
+        self.init_draws()
 
     def init_draws(self):
+        self.img_gc.delete("all")
+        self.drawn_state = None
+        self.sprites = None
+        if settings.options["overlay_renderer"].value == "Sprite" or len(self.ports) > 1:
+            # every controller is in one image composited from pre-rendered sprites
+            self.sprites = PortsRenderer(get_renderer(self.gc_image, "gc"), self.ports)
+            self.img = ImageTk.PhotoImage(self.sprites.image)
+            self.img_gc.configure(width=self.img.width(), height=self.img.height())
+            self.img_gc.create_image(0, 0, anchor="nw", image=self.img)
+            return
+
+        self.img = ImageTk.PhotoImage(self.gc_image)
+        self.img_gc.configure(width=self.img.width(), height=self.img.height())
+        self.img_gc.create_image(0, 0, anchor="nw", image=self.img)
         # sticks
-        self.drw_left_stick = self.img_gc.create_oval(
-            28+10, 51+10, 28+44, 51+44,
-            fill="#cccccc",
-            outline="black",
-            width=1
-        )
-        self.drw_c_stick = self.img_gc.create_oval(
-            174+14, 122+14, 174+52-14, 122+52-14,
-            fill="#ffff00",
-            outline="black",
-            width=1
-        )
-        # buttons
-        drw_start_btn = self.img_gc.create_oval(
-            143, 73, 143+15, 73+15,
-            fill="#333333",
-            outline="black",
-            width=1
-        )
-        drw_a_btn = self.img_gc.create_oval(
-            226, 60, 226+36, 60+36,
-            fill="#333333",
-            outline="black",
-            width=1
-        )
-        drw_b_btn = self.img_gc.create_oval(
-            200, 85, 200+23, 85+23,
-            fill="#333333",
-            outline="black",
-            width=1
-        )
-        # beans (X, Y)
-        x, y = 280, 70
-        w, h = 16, 32
-        drw_x_btn = create_bean_shape(
-            self.img_gc,
-            x, y, w, h,
-            rotation_deg=165,
-            fill="#333333",
+        self.drw_left_stick = create_shape(
+            self.img_gc, MAIN_STICK,
+            fill=STICK_COLOURS[0],
             outline="black",
             width=1
         )
-        x, y = 237, 44
-        w, h = 32, 16
-        drw_y_btn = create_bean_shape(
-            self.img_gc,
-            x, y, h, w,
-            rotation_deg=75,
-            fill="#333333",
+        self.drw_c_stick = create_shape(
+            self.img_gc, C_STICK,
+            fill=STICK_COLOURS[1],
             outline="black",
             width=1
         )
-        # bumpers (L, R, Z)
-        x, y = 50, 22
-        w, h = 46, 28
-        self.drw_l_btn = create_semi_circle(
-            self.img_gc,
-            x, y, w, h,
-            rotation_deg=157,
-            direction="top",
-            fill="#333333",
-            outline="black",
-            width=1
-        )
-        x, y = 246, 22
-        w, h = 46, 28
-        self.drw_r_btn = create_semi_circle(
-            self.img_gc,
-            x, y, w, h,
-            rotation_deg=203,
-            direction="top",
-            fill="#333333",
-            outline="black",
-            width=1
-        )
-        x, y = 246, 22
-        w, h = 54, 12
-        drw_z_btn = create_semi_circle(
-            self.img_gc,
-            x, y, w, h,
-            rotation_deg=203,
-            direction="top",
-            fill="#333333",
-            outline="black",
-            width=1
-        )
-        # D-PAD arrows (UP DOWN LEFT RIGHT)
-        x, y = 99, 134
-        w = 9
-        drw_du_btn = create_triangle(
-            self.img_gc,
-            x, y, w,
-            rotation_deg=0,
-            fill="#cccccc"
-        )
-        x, y = 99, 162
-        drw_dd_btn = create_triangle(
-            self.img_gc,
-            x, y, w,
-            rotation_deg=180,
-            fill="#cccccc"
-        )
-        x, y = 85, 148
-        drw_dl_btn = create_triangle(
-            self.img_gc,
-            x, y, w,
-            rotation_deg=270,
-            fill="#cccccc"
-        )
-        x, y = 113, 148
-        drw_dr_btn = create_triangle(
-            self.img_gc,
-            x, y, w,
-            rotation_deg=90,
-            fill="#cccccc"
-        )
+        # buttons and bumpers, see overlay.py for the layout
+        button_draws = [None] * len(BUTTON_SHAPES)
+        for kind, i in DRAW_ORDER:
+            if kind == "trigger":
+                drw = create_shape(self.img_gc, TRIGGER_SHAPES[i], fill="#333333", outline="black", width=1)
+                if i == 0: self.drw_l_btn = drw
+                else: self.drw_r_btn = drw
+            elif OUTLINED_BUTTONS[i]:
+                button_draws[i] = create_shape(
+                    self.img_gc, BUTTON_SHAPES[i],
+                    fill=END_COLOURS[i],
+                    outline="black",
+                    width=1
+                )
+            else:
+                button_draws[i] = create_shape(self.img_gc, BUTTON_SHAPES[i], fill=END_COLOURS[i])
         
-        self.button_draws.append(drw_start_btn)
-        self.button_draws.append(drw_a_btn)
-        self.button_draws.append(drw_b_btn)
-        self.button_draws.append(drw_x_btn)
-        self.button_draws.append(drw_y_btn)
-        self.button_draws.append(drw_z_btn)
         # note that L and R are excluded from this list because i draw their fill
         # based on how hard they are pressed (analog triggers)
-        self.button_draws.append(drw_du_btn)
-        self.button_draws.append(drw_dd_btn)
-        self.button_draws.append(drw_dl_btn)
-        self.button_draws.append(drw_dr_btn)
+        self.button_draws = button_draws
 
     def draw_inputs(self, frame_index, draw_blank=False):
         # default frame inputs
-        frame_inputs = "0:0:0:0:0:0:0:0:0:0:0:0:0:0:128:128:128:128"
+        poll = None
         # exit if no DTM loaded
         if not draw_blank:
-            if not self.dtm or len(self.dtm_inputs) == 0:
+            if not self.dtm or self.render_plan is None or len(self.render_plan) == 0:
                 print("no dtm")
                 return
             
-            # get frame inputs from dtm
-            if frame_index <= len(self.dtm_inputs):
-                frame_inputs = self.dtm_inputs[floor((frame_index - 1) * 4)]
+            # get frame inputs from the render plan
+            poll = self.frame_map.poll(frame_index)
+        self.draw_compare(frame_index, draw_blank)
         
-        # get btn presses and stick values
-        btn = [int(i) for i in frame_inputs.split(":")]
-        mainx: int = btn[14]
-        mainz: int = btn[15]
-        cx:    int = btn[16]
-        cz:    int = btn[17]
-        l:     int = btn[12]
-        r:     int = btn[13]
+        if self.sprites is not None:
+            blank = blank_levels()
+            levels = [blank if poll is None else plan.levels(poll) for plan in self.render_plans] or [blank]
+            # render() only redraws the controllers that changed since the last frame, and
+            # the image is updated once for all of them
+            if self.sprites.render(levels):
+                self.img.paste(self.sprites.image)
+            return
+        
+        state = self.blank_state if poll is None else self.render_plan.state(poll)
+        (main_dx, main_dy), (c_dx, c_dy), fills, l_fill, r_fill = state
+        drawn = self.drawn_state
         
         # position the main left stick, note that 0, 0 is top-left and 256, 256 is bottom-right
-        x, y = (28, 51)
-        x += round(10 * (mainx - 128) / 128)
-        y -= round(10 * (mainz - 128) / 128)
-        w, h = (x + 54, y + 54)
-        stick_rect = (x+10, y+10, w-10, h-10)
-        self.img_gc.coords(self.drw_left_stick, stick_rect)
+        if drawn is None or drawn[0] != state[0]:
+            x, y, w, h = MAIN_STICK[1]
+            x, y = (x + main_dx, y + main_dy)
+            self.img_gc.coords(self.drw_left_stick, (x, y, x + w, y + h))
         
         # position the c stick, same as above
-        x, y = (174, 122)
-        x += round(10 * (cx - 128) / 128)
-        y -= round(10 * (cz - 128) / 128)
-        w, h = (x + 52, y + 52)
-        stick_rect = (x+14, y+14, w-14, h-14)
-        self.img_gc.coords(self.drw_c_stick, stick_rect)
+        if drawn is None or drawn[1] != state[1]:
+            x, y, w, h = C_STICK[1]
+            x, y = (x + c_dx, y + c_dy)
+            self.img_gc.coords(self.drw_c_stick, (x, y, x + w, y + h))
         
-        # main buttons (Start,      A,          B,          X, Y,               Z        DPAD UDLR)
-        btn_colours = ["#b3b3b3", "#00ffff", "#ff0000"] + ["#cccccc"] * 2 + ["#0000c0"] + ["#808080"] * 4
-        end_rgb = ["#333333"] * 6 + ["#cccccc"] * 4
-        fade_duration = 0.6
+        # main buttons, only recolour the ones whose fade level changed
         for i, drw_btn in enumerate(self.button_draws):
-            start_rgb = hex_to_rgb(btn_colours[i])
-            # if button is just pressed, update timer to now
-            if btn[i]: self.button_timers[i] = time.time()
-            # gets duration since last press for fade progress
-            dif = time.time() - self.button_timers[i]
-            if dif <= fade_duration:
-                eased_t = ease_out_expo(dif / fade_duration) # looks nicer than linear
-                # calculates the rgb colour between start and end colour then converts it to hex
-                fill = rgb_to_hex(tuple(
-                    int(start + (end - start) * eased_t)
-                    for start, end in zip(start_rgb, hex_to_rgb(end_rgb[i]))
-                ))
-                self.img_gc.itemconfig(drw_btn, fill=fill) # update colour
+            if drawn is None or drawn[2][i] != fills[i]:
+                self.img_gc.itemconfig(drw_btn, fill=fills[i])
         
         # L and R triggers (analog demonstration based on how hard their pressed)
         # the sample video uses a controller without analog triggers so this effect isn't obvious
-        start_rgb = hex_to_rgb(btn_colours[0])
-        eased_t = 1.0 - ease_out_expo(l / 255) # inverted for fading IN instead of OUT
-        # calculates the rgb colour between start and end colour then converts it to hex
-        fill = rgb_to_hex(tuple(
-            int(start + (end - start) * eased_t)
-            for start, end in zip(start_rgb, hex_to_rgb(end_rgb[0]))
-        ))
-        self.img_gc.itemconfig(self.drw_l_btn, fill=fill)
+        if drawn is None or drawn[3] != l_fill:
+            self.img_gc.itemconfig(self.drw_l_btn, fill=l_fill)
+        if drawn is None or drawn[4] != r_fill:
+            self.img_gc.itemconfig(self.drw_r_btn, fill=r_fill)
         
-        # R trigger
-        eased_t = 1.0 - ease_out_expo(r / 255)
-        fill = rgb_to_hex(tuple(
-            int(start + (end - start) * eased_t)
-            for start, end in zip(start_rgb, hex_to_rgb(end_rgb[0]))
-        ))
-        self.img_gc.itemconfig(self.drw_r_btn, fill=fill)
+        self.drawn_state = state
+
+    def draw_compare(self, frame_index, draw_blank=False):
+        if self.compare_sprites is None:
+            return
+        poll = None if draw_blank else self.compare_map.poll(frame_index)
+        blank = blank_levels()
+        levels = [blank if poll is None else plan.levels(poll) for plan in self.compare_plans]
+        if self.compare_sprites.render(levels):
+            self.compare_img.paste(self.compare_sprites.image)
 
 # set custom tkinter appearance and theme
 ctk.set_appearance_mode("system")
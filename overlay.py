@@ -0,0 +1,174 @@
+import numpy as np
+from util import ease_out_expo, hex_to_rgb, rgb_to_hex
+
+###############
+# Render plan #
+###############
+# everything draw_inputs needs for a poll is worked out once when a DTM is loaded, so
+# drawing a frame is just looking up a row and updating whatever changed since the last
+# one. fades are measured in polls since the button was last pressed rather than wall
+# clock time, so seeking to a frame always draws it the same way
+
+# digital buttons in the same order as their bits in the buttons field (and the order
+# App.button_draws is built in): Start, A, B, X, Y, Z, DPAD Up Down Left Right
+BUTTON_COLOURS = ["#b3b3b3", "#00ffff", "#ff0000"] + ["#cccccc"] * 2 + ["#0000c0"] + ["#808080"] * 4
+END_COLOURS    = ["#333333"] * 6 + ["#cccccc"] * 4
+# the analog triggers fade from dark to light the harder they're pressed
+TRIGGER_COLOURS = ("#b3b3b3", "#333333")
+
+# where each part of the controller is drawn on the 300px wide controller image.
+# ovals are (x, y, w, h), beans and semicircles are (cx, cy, w, h, rotation) and
+# triangles are (cx, cy, w, rotation)
+MAIN_STICK = ("oval", (38, 61, 34, 34))
+C_STICK    = ("oval", (188, 136, 24, 24))
+STICK_COLOURS = ("#cccccc", "#ffff00")
+# in the same order as BUTTON_COLOURS
+BUTTON_SHAPES = [
+    ("oval", (143, 73, 15, 15)),        # Start
+    ("oval", (226, 60, 36, 36)),        # A
+    ("oval", (200, 85, 23, 23)),        # B
+    ("bean", (280, 70, 16, 32, 165)),   # X
+    ("bean", (237, 44, 16, 32, 75)),    # Y
+    ("semi", (246, 22, 54, 12, 203)),   # Z
+    ("triangle", (99, 134, 9, 0)),      # DPAD Up
+    ("triangle", (99, 162, 9, 180)),    # DPAD Down
+    ("triangle", (85, 148, 9, 270)),    # DPAD Left
+    ("triangle", (113, 148, 9, 90)),    # DPAD Right
+]
+TRIGGER_SHAPES = [
+    ("semi", (50, 22, 46, 28, 157)),    # L
+    ("semi", (246, 22, 46, 28, 203)),   # R
+]
+# draw order after the sticks, Z goes over R. ("button", i) or ("trigger", i)
+DRAW_ORDER = [("button", i) for i in range(5)] + [("trigger", 0), ("trigger", 1)] + \
+    [("button", i) for i in range(5, 10)]
+# the dpad arrows are the only parts without an outline
+OUTLINED_BUTTONS = [True] * 6 + [False] * 4
+
+FADE_SECONDS = 0.6
+FADE_LEVELS  = 32   # number of quantized colours in each fade
+STICK_RANGE  = 10   # how many pixels a stick moves from centre at full tilt
+
+def fade_polls(polls_per_second: float) -> int:
+    """
+    how many polls a button takes to fade out after it's let go
+    """
+    return max(1, round(FADE_SECONDS * polls_per_second))
+
+def fade_lut(start: str, end: str, invert: bool = False) -> list[str]:
+    """
+    hex colours from start to end, eased, one per fade level
+    """
+    start_rgb, end_rgb = hex_to_rgb(start), hex_to_rgb(end)
+    lut = []
+    for level in range(FADE_LEVELS):
+        t = ease_out_expo(level / (FADE_LEVELS - 1))
+        if invert: t = 1.0 - t
+        lut.append(rgb_to_hex(tuple(
+            int(s + (e - s) * t) for s, e in zip(start_rgb, end_rgb)
+        )))
+    return lut
+
+def stick_offsets(x: np.ndarray, y: np.ndarray):
+    # 128 is centre, y is flipped as 0, 0 is the top-left of the canvas
+    dx = np.rint(STICK_RANGE * (x.astype(np.int16) - 128) / 128).astype(np.int8)
+    dy = -np.rint(STICK_RANGE * (y.astype(np.int16) - 128) / 128).astype(np.int8)
+    return dx, dy
+
+class RenderPlan():
+    def __init__(self, inputs: np.ndarray, polls_per_second: float):
+        self.button_luts  = [fade_lut(s, e) for s, e in zip(BUTTON_COLOURS, END_COLOURS)]
+        self.trigger_lut  = fade_lut(*TRIGGER_COLOURS, invert=True)
+        self.fade_polls   = fade_polls(polls_per_second)
+        # 1-based poll number of each button's most recent press, 0 if it's never been pressed
+        self.last_press   = np.zeros(len(BUTTON_COLOURS), dtype=np.int32)
+        self.count        = 0   # polls planned, the arrays can be longer while recording live
+        self.main_dx = self.main_dy = self.c_dx = self.c_dy = np.zeros(0, dtype=np.int8)
+        self.button_levels = np.zeros((0, len(BUTTON_COLOURS)), dtype=np.uint8)
+        self.l_levels = self.r_levels = np.zeros(0, dtype=np.uint8)
+        self.extend(inputs)
+
+    def extend(self, inputs: np.ndarray):
+        """
+        plans polls that come after the ones already planned, for movies that are still
+        being recorded. only the new polls are worked out
+        """
+        n = len(inputs)
+        start, end = self.count, self.count + n
+        if end > len(self.button_levels):
+            # double the arrays so appending a few polls at a time stays cheap
+            self._grow(max(end, 2 * len(self.button_levels)))
+
+        # stick positions as pixel offsets from their centre
+        self.main_dx[start:end], self.main_dy[start:end] = stick_offsets(inputs["main_x"], inputs["main_y"])
+        self.c_dx[start:end], self.c_dy[start:end]       = stick_offsets(inputs["c_x"], inputs["c_y"])
+
+        # fade level of each button per poll, 0 is just pressed and FADE_LEVELS - 1 is faded out
+        fade = self.fade_polls
+        # 1-based poll numbers so 0 can mean "never pressed"
+        polls = np.arange(start + 1, end + 1, dtype=np.int32)
+        buttons = inputs["buttons"]
+        for i in range(len(BUTTON_COLOURS)):
+            pressed = (buttons >> i & 1).astype(np.int32)
+            # poll number of the most recent press at or before each poll
+            last_press = np.maximum.accumulate(np.maximum(polls * pressed, self.last_press[i]))
+            since = np.minimum(polls - last_press, fade)
+            since[last_press == 0] = fade
+            self.button_levels[start:end, i] = since * (FADE_LEVELS - 1) // fade
+            if n: self.last_press[i] = last_press[-1]
+
+        # analog triggers map straight from how hard they're pressed
+        self.l_levels[start:end] = inputs["l"].astype(np.uint16) * (FADE_LEVELS - 1) // 255
+        self.r_levels[start:end] = inputs["r"].astype(np.uint16) * (FADE_LEVELS - 1) // 255
+        self.count = end
+
+    def _grow(self, capacity: int):
+        def grown(array):
+            bigger = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            bigger[:self.count] = array[:self.count]
+            return bigger
+        self.main_dx, self.main_dy = grown(self.main_dx), grown(self.main_dy)
+        self.c_dx, self.c_dy = grown(self.c_dx), grown(self.c_dy)
+        self.button_levels = grown(self.button_levels)
+        self.l_levels, self.r_levels = grown(self.l_levels), grown(self.r_levels)
+
+    def __len__(self):
+        return self.count
+
+    def levels(self, poll: int):
+        """
+        returns (main offset, c offset, button fade levels, l level, r level) for a poll
+        """
+        return (
+            (int(self.main_dx[poll]), int(self.main_dy[poll])),
+            (int(self.c_dx[poll]), int(self.c_dy[poll])),
+            tuple(self.button_levels[poll].tolist()),
+            int(self.l_levels[poll]),
+            int(self.r_levels[poll])
+        )
+
+    def state(self, poll: int):
+        """
+        returns (main offset, c offset, button fills, l fill, r fill) for a poll
+        """
+        levels = self.button_levels[poll]
+        return (
+            (int(self.main_dx[poll]), int(self.main_dy[poll])),
+            (int(self.c_dx[poll]), int(self.c_dy[poll])),
+            [lut[level] for lut, level in zip(self.button_luts, levels)],
+            self.trigger_lut[self.l_levels[poll]],
+            self.trigger_lut[self.r_levels[poll]]
+        )
+
+def blank_levels():
+    """
+    levels of an idle controller, used when nothing is loaded
+    """
+    return ((0, 0), (0, 0), (FADE_LEVELS - 1,) * len(BUTTON_COLOURS), 0, 0)
+
+def blank_state():
+    """
+    the state of an idle controller, used when nothing is loaded
+    """
+    trigger_lut = fade_lut(*TRIGGER_COLOURS, invert=True)
+    return ((0, 0), (0, 0), list(END_COLOURS), trigger_lut[0], trigger_lut[0])
@@ -17,6 +17,14 @@ class Preferences():
         # initialise settings options here
         self.add_option("compress_video", "Ask", ["Ask", "Always", "Never"])
         self.add_option("compress_video_fps", "25", [])
+        self.add_option("cache_size_mb", "512", [])
+        self.add_option("frame_buffer_size", "8", [])
+        self.add_option("frame_cache_mb", "256", [])
+        self.add_option("compress_segments", "0", [])
+        self.add_option("overlay_renderer", "Canvas", ["Canvas", "Sprite"])
+        self.add_option("proxy_videos", "On", ["On", "Off"])
+        self.add_option("proxy_cache_mb", "4096", [])
+        self.add_option("reverse_buffer_mb", "256", [])
         # load from file if it exists, and save it if it doesn't
         self.load_settings()
         self.save_settings()
@@ -56,13 +64,15 @@ class Preferences():
         settings.write_text(json.dumps(out, indent=4))
 
 class PreferencesWindow(ctk.CTkToplevel):
-    def __init__(self, master, preferences: Preferences):
+    def __init__(self, master, preferences: Preferences, on_close = None):
         super().__init__(master)
         self.settings = preferences
+        self.on_close = on_close
         
         self.title("Preferences")
-        self.geometry("200x220")
+        self.geometry("200x700")
         self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.close)
 
         self.transient(master)
         self.grab_set()
@@ -104,6 +114,36 @@ class PreferencesWindow(ctk.CTkToplevel):
             validatecommand=vcmd
         )
         self.update_video_fps_visibility()
+        
+        # numeric settings, each is a label + entry that saves as you type
+        self.number_vars: dict[str, ctk.StringVar] = dict()
+        self.add_number_entry(frame_upper, 5, "cache_size_mb", "Cache Size (MB)")
+        self.add_number_entry(frame_upper, 7, "frame_buffer_size", "Frame Buffer Size")
+        self.add_number_entry(frame_upper, 9, "frame_cache_mb", "Frame Cache (MB)")
+        # 0 uses one segment per CPU core, 1 compresses in a single pass
+        self.add_number_entry(frame_upper, 13, "compress_segments", "Compression Segments")
+
+        lbl_proxy = ctk.CTkLabel(frame_upper, text="Proxy Videos", font=ctk.CTkFont(size=14))
+        lbl_proxy.grid(row=15, column=0, sticky="nw", padx=4, pady=(4, 0))
+        self.cmb_proxy = ctk.CTkComboBox(frame_upper, command=self.cmb_proxy_select, values=[
+            "On",
+            "Off"
+        ])
+        self.cmb_proxy.grid(row=16, column=0, padx=4, pady=(0, 4), sticky="nw")
+        self.cmb_proxy.bind("<Key>", lambda e: "break")
+        self.cmb_proxy.set(self.settings.options["proxy_videos"].value)
+        self.add_number_entry(frame_upper, 17, "proxy_cache_mb", "Proxy Cache (MB)")
+        self.add_number_entry(frame_upper, 19, "reverse_buffer_mb", "Reverse Buffer (MB)")
+
+        lbl_overlay = ctk.CTkLabel(frame_upper, text="Overlay Renderer", font=ctk.CTkFont(size=14))
+        lbl_overlay.grid(row=11, column=0, sticky="nw", padx=4, pady=(4, 0))
+        self.cmb_overlay = ctk.CTkComboBox(frame_upper, command=self.cmb_overlay_select, values=[
+            "Canvas",
+            "Sprite"
+        ])
+        self.cmb_overlay.grid(row=12, column=0, padx=4, pady=(0, 4), sticky="nw")
+        self.cmb_overlay.bind("<Key>", lambda e: "break")
+        self.cmb_overlay.set(self.settings.options["overlay_renderer"].value)
 
         restore_btn = ctk.CTkButton(frame, text="Restore Defaults", command=self.restore_defaults)
         restore_btn.grid(row=1, column=0, padx=4, pady=4, sticky="ew")
@@ -114,13 +154,46 @@ class PreferencesWindow(ctk.CTkToplevel):
     def restore_defaults(self):
         self.settings.restore_defaults()
         self.cmb_compress_video.set(self.settings.options["compress_video"].value)
+        self.cmb_overlay.set(self.settings.options["overlay_renderer"].value)
+        self.cmb_proxy.set(self.settings.options["proxy_videos"].value)
+        for option, var in self.number_vars.items():
+            var.set(self.settings.options[option].value)
         self.update_video_fps_visibility()
     
+    def add_number_entry(self, parent, row: int, option: str, text: str):
+        lbl = ctk.CTkLabel(parent, text=text, font=ctk.CTkFont(size=14))
+        lbl.grid(row=row, column=0, sticky="nw", padx=4, pady=(4, 0))
+        var = ctk.StringVar()
+        var.set(self.settings.options[option].value)
+        var.trace_add("write", lambda *args: self.number_changed(option, var))
+        num = ctk.CTkEntry(
+            parent,
+            textvariable=var,
+            validate="key",
+            validatecommand=(self.register(self.valid_number), "%P")
+        )
+        num.grid(row=row + 1, column=0, sticky="nw", padx=4, pady=(0, 4))
+        self.number_vars[option] = var
+    
+    def number_changed(self, option: str, var: ctk.StringVar):
+        value = var.get()
+        if value.isdigit():
+            self.settings.options[option].value = value
+            self.settings.save_settings()
+    
     def cmb_compress_video_select(self, value):
         self.settings.options["compress_video"].value = value
         self.settings.save_settings()
         self.update_video_fps_visibility()
     
+    def cmb_overlay_select(self, value):
+        self.settings.options["overlay_renderer"].value = value
+        self.settings.save_settings()
+    
+    def cmb_proxy_select(self, value):
+        self.settings.options["proxy_videos"].value = value
+        self.settings.save_settings()
+    
     def update_video_fps_visibility(self):
         value = self.settings.options["compress_video"].value
         # if the user wants to auto compress always, we need a default framerate
@@ -150,3 +223,5 @@ class PreferencesWindow(ctk.CTkToplevel):
     def close(self):
         self.grab_release()
         self.destroy()
+        if self.on_close is not None:
+            self.on_close()
@@ -0,0 +1,102 @@
+import subprocess
+import threading
+import cv2
+from cache import FileCache, sampled_digest
+from util import log, err
+
+################
+# Proxy videos #
+################
+# frame dumps are often much bigger than the canvas they're shown on, so most of the work
+# of decoding them is thrown away when they're scaled down. this makes smaller copies
+# (proxies) of a video in the background and keeps them in the cache. they're all-intra,
+# so every frame decodes on its own and seeking in them is exact and cheap.
+# proxies always have the same frames as the original, so frame indices are the same in both
+
+PROXY_VERSION = 1
+PROXY_HEIGHTS = (360, 720)
+
+def proxy_command(input: str, output: str, height: int) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-i", input,
+        "-vf", f"scale=-2:{height}",
+        # keep every frame exactly as it is, no fps conversion
+        "-fps_mode", "passthrough",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-tune", "fastdecode",
+        "-g", "1",
+        "-crf", "20",
+        "-an",
+        output,
+        "-y"
+    ]
+
+def pick_proxy(proxies: dict, display_height: int, video_height: int):
+    """
+    returns the height of the smallest proxy that's at least as tall as the display,
+    or None if the original is the best fit
+    """
+    for height in sorted(proxies):
+        if height >= display_height and height < video_height:
+            return height
+    return None
+
+class ProxyManager():
+    """
+    makes proxies one at a time on a background thread. ready holds the proxies that
+    exist for each video as {height: path}, it's only ever replaced so reading it from
+    another thread is safe
+    """
+    def __init__(self, cache: FileCache):
+        self.cache = cache
+        self.ready = dict()
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def proxies(self, video: str) -> dict:
+        return self.ready.get(str(video), dict())
+
+    def request(self, video: str, heights = PROXY_HEIGHTS):
+        """
+        finds or starts making proxies for a video, for the heights smaller than it is
+        """
+        video = str(video)
+        with self._lock:
+            if video in self._pending:
+                return
+            self._pending.add(video)
+        threading.Thread(target=self._make, args=(video, heights), daemon=True).start()
+
+    def _make(self, video: str, heights):
+        try:
+            cap = cv2.VideoCapture(video)
+            video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            cap.release()
+            key = sampled_digest(video)
+            for height in sorted(heights):
+                if height >= video_height:
+                    continue
+                name = f"{key}-{height}p-v{PROXY_VERSION}"
+                path = self.cache.get(name, ".mp4")
+                if path is None:
+                    log(f"Making {height}p proxy for {video}")
+                    path = self.cache.put_path(name, ".mp4", lambda tmp: subprocess.run(
+                        proxy_command(video, str(tmp), height),
+                        stdin=subprocess.DEVNULL,
+                        capture_output=True,
+                        text=True,
+                        check=True
+                    ))
+                    log(f"Made {height}p proxy: {path.name}")
+                self.ready = {**self.ready, video: {**self.proxies(video), height: path}}
+        except subprocess.CalledProcessError as e:
+            err(f"Failed to make proxy video: {e.stderr.strip()}")
+        except OSError as e:
+            err(f"Failed to make proxy video: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(video)
@@ -0,0 +1,228 @@
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import cv2
+import numpy as np
+from PIL import Image
+from cache import DTM_CACHE, DTM_CACHE_BYTES, FileCache
+from dtm import DTMSource
+from align import synced_frame_map
+from overlay import RenderPlan, blank_levels, fade_polls
+from seek_index import SeekIndex
+from sprite_renderer import PortsRenderer, get_renderer
+from util import log, err
+from video_source import dump_parts, open_video, split_frames
+
+################
+# Video render #
+################
+# renders a video with the controller overlay burned in, without opening the app.
+# the video is split into frame ranges that are rendered by a pool of processes, each
+# piping raw frames into its own ffmpeg, then the parts are joined with the concat
+# demuxer so nothing gets encoded twice. CAP_PROP_POS_FRAMES isn't frame accurate on long
+# GOP videos, so each part seeks to the keyframe before its first frame (from the video's
+# seek index) and grabs its way forward from there.
+#
+#   python render_video.py dump.avi movie.dtm out.mp4 [--jobs 4]
+
+basedir = Path(__file__).resolve().parent
+
+OVERLAY_SCALE = 0.3     # controller width as a fraction of the video width
+OVERLAY_MARGIN = 0.02   # gap from the bottom right corner, as a fraction of the video width
+
+class Compositor():
+    """
+    blends the sprite renderer's controllers (one per port) into the corner of BGR frames.
+    the overlay is only converted and premultiplied again when its levels change
+    """
+    def __init__(self, frame_size, ports = (0,), scale: float = OVERLAY_SCALE):
+        fw, fh = frame_size
+        base = Image.open(basedir / "images" / "gc.png")
+        # the grid of controllers takes up the same width as one would
+        columns = min(2, len(ports))
+        cw = max(1, round(fw * scale / columns))
+        ch = max(1, round(base.height * cw / base.width))
+        self.renderer = PortsRenderer(get_renderer(base.resize((cw, ch), Image.LANCZOS), "gc"), ports, columns)
+        w, h = self.renderer.image.size
+        margin = round(fw * OVERLAY_MARGIN)
+        self.x = max(0, fw - w - margin)
+        self.y = max(0, fh - h - margin)
+        # the part of the overlay that fits on the frame
+        self.w = min(w, fw - self.x)
+        self.h = min(h, fh - self.y)
+        self.premultiplied = None
+        self.inverse_alpha = None
+
+    def draw(self, frame: np.ndarray, levels):
+        # levels has a tuple per port
+        if self.renderer.render(levels) or self.premultiplied is None:
+            rgba = np.asarray(self.renderer.image)[:self.h, :self.w]
+            alpha = rgba[..., 3:4].astype(np.uint16)
+            self.premultiplied = rgba[..., 2::-1].astype(np.uint16) * alpha
+            self.inverse_alpha = 255 - alpha
+        region = frame[self.y:self.y + self.h, self.x:self.x + self.w]
+        blended = region * self.inverse_alpha
+        blended += self.premultiplied
+        blended //= 255
+        region[:] = blended
+
+def encoder_command(output, frame_size, fps: float, threads: int) -> list[str]:
+    w, h = frame_size
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "rawvideo",
+        "-pix_fmt", "bgr24",
+        "-s", f"{w}x{h}",
+        "-r", f"{fps}",
+        "-i", "-",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-crf", "20",
+        "-pix_fmt", "yuv420p",
+        "-threads", str(threads),
+        str(output),
+        "-y"
+    ]
+
+def render_part(video: str, dtm: str, start: int, end: int, total: int, output: str, threads: int,
+                keyframe: int = None) -> int:
+    """
+    renders frames [start, end) to output, returns how many frames were written. keyframe
+    is a keyframe at or before start to seek to, without one the capture seeks to start
+    itself. runs in a worker process so it opens everything itself
+    """
+    cap = open_video(video)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    position = start if keyframe is None else keyframe
+    if position > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+    while position < start and cap.grab():
+        position += 1
+
+    cache = FileCache(DTM_CACHE, DTM_CACHE_BYTES)
+    source = DTMSource(dtm, cache)
+    frame_map = synced_frame_map(source, video, fps, total, cache)
+    # only plan the polls this part shows, from far enough back that presses just before
+    # it have faded the same as they would over the whole movie
+    polls_per_second = source.header.polls_per_second
+    first = max(0, frame_map.first_poll(start) - fade_polls(polls_per_second))
+    last = frame_map.first_poll(end) + 1
+    plans = [RenderPlan(inputs[first:last], polls_per_second) for inputs in source.port_inputs]
+    compositor = Compositor(size, source.ports)
+    blank = blank_levels()
+
+    proc = subprocess.Popen(encoder_command(output, size, fps, threads), stdin=subprocess.PIPE)
+    written = 0
+    frame = None
+    try:
+        for index in range(start, end):
+            ret, frame = cap.read(frame)
+            if not ret:
+                break
+            poll = frame_map.poll(index)
+            compositor.draw(frame, [blank if poll is None else plan.levels(poll - first) for plan in plans])
+            proc.stdin.write(frame.data)
+            written += 1
+    finally:
+        proc.stdin.close()
+        proc.wait()
+        cap.release()
+        source.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"FFmpeg exited with code {proc.returncode} while writing {output}")
+    if written < end - start:
+        # the container's frame count can be a little off, so the last part can be short.
+        # anywhere else the parts after it would be out of step with the video
+        message = f"Only rendered {written} of frames {start}-{end - 1} to {Path(output).name}"
+        if end < total:
+            raise RuntimeError(message)
+        err(message)
+    return written
+
+def concat_list(path: Path, files) -> str:
+    path.write_text("".join(f"file '{Path(file).resolve().as_posix()}'\n" for file in files))
+    return str(path)
+
+def concat_parts(parts: list[Path], video: str, output: str):
+    """
+    joins the rendered parts without re-encoding them and takes the audio from the source,
+    which can be split into parts too
+    """
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", concat_list(parts[0].parent / "parts.txt", parts),
+        "-f", "concat", "-safe", "0", "-i", concat_list(parts[0].parent / "sources.txt", dump_parts(video)),
+        "-map", "0:v", "-map", "1:a?",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-shortest",
+        output,
+        "-y"
+    ], check=True)
+
+def render(video: str, dtm: str, output: str, jobs: int = 0, parts: int = 0) -> float:
+    """
+    renders the whole video with the overlay, returns the throughput in frames per second
+    """
+    jobs = jobs or os.cpu_count() or 1
+    # a couple of parts per process so a slow range doesn't leave the others idle at the end
+    parts = parts or jobs * 2
+    cap = open_video(video)
+    if not cap.isOpened():
+        raise RuntimeError(f"Unable to open video: {video}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    # parse the DTM and work out its frame map once here so every worker maps the cached
+    # ones instead
+    cache = FileCache(DTM_CACHE, DTM_CACHE_BYTES)
+    source = DTMSource(dtm, cache)
+    synced_frame_map(source, video, fps, total, cache)
+    source.close()
+    # split dumps seek within whichever part the frame is in, like the player
+    index = SeekIndex.for_video(video) if len(dump_parts(video)) == 1 else None
+    if index is None:
+        log("Parts will start from CAP_PROP_POS_FRAMES seeks, which may not be frame accurate")
+
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    ranges = split_frames(total, parts)
+    log(f"Rendering {total} frames in {len(ranges)} parts with {jobs} processes")
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="dtm-render-") as tmp:
+        part_files = [Path(tmp) / f"part{i:04}.mp4" for i in range(len(ranges))]
+        written = 0
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(
+                    render_part, video, dtm, start, end, total, str(part), threads,
+                    None if index is None else index.keyframe_before(start)
+                ): part
+                for (start, end), part in zip(ranges, part_files)
+            }
+            for future in as_completed(futures):
+                written += future.result()
+                log(f"Rendered {futures[future].name} ({written}/{total} frames)")
+        concat_parts(part_files, video, output)
+    elapsed = time.perf_counter() - start_time
+    fps = written / elapsed if elapsed > 0 else 0.0
+    log(f"Rendered {written} frames to {output} in {elapsed:.1f}s ({fps:.1f} fps)")
+    return fps
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a video with the DTM inputs drawn over it")
+    parser.add_argument("video")
+    parser.add_argument("dtm")
+    parser.add_argument("output")
+    parser.add_argument("--jobs", type=int, default=0, help="worker processes, defaults to the CPU count")
+    parser.add_argument("--parts", type=int, default=0, help="frame ranges to split into, defaults to 2 per job")
+    args = parser.parse_args()
+    try:
+        render(args.video, args.dtm, args.output, args.jobs, args.parts)
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        err(f"Render failed: {e}")
+        raise SystemExit(1)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+import numpy as np
+from util import log, err
+
+##############
+# Seek index #
+##############
+# cv2 can't tell us where the keyframes are, so seeking with CAP_PROP_POS_FRAMES has to
+# guess and decode from whatever keyframe comes before, every single time. this builds
+# a table of keyframes and true frame timestamps once per video with ffprobe and keeps
+# it next to the video, so the player can jump to the right keyframe itself and only
+# decode forward as far as it needs to
+
+INDEX_VERSION = 1
+
+# the player and compression jobs can both ask for a video's index at once from their own
+# threads, this makes the second wait for the first's index instead of building its own
+_build_lock = threading.Lock()
+
+def index_path(video_path) -> Path:
+    video_path = Path(video_path)
+    return video_path.with_name(f"{video_path.name}.seekidx.npz")
+
+class SeekIndex():
+    def __init__(self, keyframes: np.ndarray, timestamps: np.ndarray):
+        self.keyframes  = keyframes     # sorted frame indices of every keyframe
+        self.timestamps = timestamps    # presentation time in seconds of every frame
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def keyframe_before(self, frame_index: int) -> int:
+        """
+        returns the last keyframe at or before frame_index
+        """
+        i = np.searchsorted(self.keyframes, frame_index, side="right") - 1
+        return int(self.keyframes[max(i, 0)])
+
+    def save(self, path, video_path):
+        """
+        writes the index to a temporary file next to path then atomically moves it into
+        place, so anything loading it at the same time never sees a half-written index
+        """
+        path = Path(path)
+        stat = Path(video_path).stat()
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    version=INDEX_VERSION,
+                    video_size=stat.st_size,
+                    video_mtime=stat.st_mtime_ns,
+                    keyframes=self.keyframes,
+                    timestamps=self.timestamps
+                )
+            os.replace(tmp, path)
+        except Exception:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def load(path, video_path):
+        """
+        loads a saved index, or returns None if it's missing or out of date
+        """
+        path = Path(path)
+        if not path.is_file():
+            return None
+        try:
+            stat = Path(video_path).stat()
+            with np.load(path) as data:
+                if int(data["version"]) != INDEX_VERSION or \
+                    int(data["video_size"]) != stat.st_size or \
+                    int(data["video_mtime"]) != stat.st_mtime_ns:
+                    return None
+                return SeekIndex(data["keyframes"], data["timestamps"])
+        except Exception as e:
+            err(f"Failed to read seek index {path.name}: {e}")
+            return None
+
+    @staticmethod
+    def build(video_path):
+        """
+        probes every video packet with ffprobe, returns None if ffprobe isn't available
+        """
+        if not shutil.which("ffprobe"):
+            return None
+        proc = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags",
+                "-of", "csv=p=0",
+                str(video_path)
+            ],
+            capture_output=True,
+            text=True
+        )
+        if proc.returncode != 0:
+            err(f"ffprobe failed to index video: {proc.stderr.strip()}")
+            return None
+
+        pts, key = [], []
+        for line in proc.stdout.splitlines():
+            fields = line.split(",")
+            if len(fields) < 2 or fields[0] in ("", "N/A"):
+                continue
+            pts.append(float(fields[0]))
+            key.append("K" in fields[1])
+        if not pts:
+            return None
+
+        # packets come in decode order, frame indices are in presentation order
+        pts = np.array(pts)
+        order = np.argsort(pts, kind="stable")
+        frame_of_packet = np.empty_like(order)
+        frame_of_packet[order] = np.arange(len(order))
+        keyframes = np.sort(frame_of_packet[np.array(key)])
+        if len(keyframes) == 0 or keyframes[0] != 0:
+            keyframes = np.concatenate(([0], keyframes))
+        return SeekIndex(keyframes.astype(np.int64), pts[order])
+
+    @staticmethod
+    def for_video(video_path):
+        """
+        loads the index saved next to the video, building and saving it if needed. safe to
+        call from several threads, other processes only ever see a whole index file
+        """
+        path = index_path(video_path)
+        with _build_lock:
+            index = SeekIndex.load(path, video_path)
+            if index is not None:
+                log(f"Loaded seek index: {path.name}")
+                return index
+
+            index = SeekIndex.build(video_path)
+            if index is None:
+                log("No seek index available (ffprobe not found or failed)")
+                return None
+            log(f"Built seek index with {len(index.keyframes)} keyframes over {len(index)} frames")
+            try:
+                index.save(path, video_path)
+            except OSError as e:
+                err(f"Failed to save seek index next to the video: {e}")
+            return index
@@ -1,8 +1,8 @@
 from math import pi, sin, cos, radians, sqrt
 
-def create_bean_shape(canvas, cx, cy, cw, ch, steps=10, rotation_deg=0, **kwargs):
+def bean_points(cx, cy, cw, ch, steps=10, rotation_deg=0):
     """
-    draws a 'bean' shape for X and Y buttons
+    points of a 'bean' shape for X and Y buttons
     taken from https://math.stackexchange.com/a/4642743
     """
     points = []
@@ -34,14 +34,20 @@ def create_bean_shape(canvas, cx, cy, cw, ch, steps=10, rotation_deg=0, **kwargs
         ry = nx * sin(angle_rad) + ny * cos(angle_rad)
 
         # translate to center
-        final_points.extend((cx + rx, cy + ry))
+        final_points.append((cx + rx, cy + ry))
 
-    return canvas.create_polygon(final_points, smooth=True, **kwargs)
+    return final_points
 
-def create_semi_circle(canvas, cx, cy, cw=100, ch=50, rotation_deg=0,
-                       direction="top", steps=10, **kwargs):
+def create_bean_shape(canvas, cx, cy, cw, ch, steps=10, rotation_deg=0, **kwargs):
     """
-    draws a semicircle with rotation controls
+    draws a 'bean' shape for X and Y buttons
+    """
+    points = bean_points(cx, cy, cw, ch, steps, rotation_deg)
+    return canvas.create_polygon([c for p in points for c in p], smooth=True, **kwargs)
+
+def semi_circle_points(cx, cy, cw=100, ch=50, rotation_deg=0, direction="top", steps=10):
+    """
+    points of a semicircle with rotation controls
     """
     angle_rad = radians(rotation_deg)
     radius_x = cw / 2
@@ -71,11 +77,19 @@ def create_semi_circle(canvas, cx, cy, cw=100, ch=50, rotation_deg=0,
     # close the semicircle back to center
     arc_points.append((cx, cy))
 
+    return arc_points
+
+def create_semi_circle(canvas, cx, cy, cw=100, ch=50, rotation_deg=0,
+                       direction="top", steps=10, **kwargs):
+    """
+    draws a semicircle with rotation controls
+    """
+    arc_points = semi_circle_points(cx, cy, cw, ch, rotation_deg, direction, steps)
     return canvas.create_polygon(arc_points, smooth=True, **kwargs)
 
-def create_triangle(canvas, cx, cy, cw=100, rotation_deg=0, **kwargs):
+def triangle_points(cx, cy, cw=100, rotation_deg=0):
     """
-    draws an equilateral triangle centered at (cx, cy) and can be rotated
+    points of an equilateral triangle centered at (cx, cy), can be rotated
     """
     height = (sqrt(3) / 2) * cw
 
@@ -94,6 +108,74 @@ def create_triangle(canvas, cx, cy, cw=100, rotation_deg=0, **kwargs):
         return (cx + x_rot, cy + y_rot)
 
     # apply transform
-    points = [rotate_and_translate(*p) for p in (p1, p2, p3)]
+    return [rotate_and_translate(*p) for p in (p1, p2, p3)]
 
+def create_triangle(canvas, cx, cy, cw=100, rotation_deg=0, **kwargs):
+    """
+    draws an equilateral triangle centered at (cx, cy) and can be rotated
+    """
+    points = triangle_points(cx, cy, cw, rotation_deg)
     return canvas.create_polygon(points, **kwargs)
+
+def smooth_points(points, steps=8):
+    """
+    approximates Tk's smooth=True for a closed polygon, so shapes drawn without Tk look
+    the same. each corner becomes a quadratic bezier between the midpoints of its edges
+    """
+    smoothed = []
+    n = len(points)
+    for i in range(n):
+        p0, p1, p2 = points[i - 1], points[i], points[(i + 1) % n]
+        start = ((p0[0] + p1[0]) / 2, (p0[1] + p1[1]) / 2)
+        end = ((p1[0] + p2[0]) / 2, (p1[1] + p2[1]) / 2)
+        for s in range(steps):
+            t = s / steps
+            a, b, c = (1 - t) ** 2, 2 * (1 - t) * t, t ** 2
+            smoothed.append((
+                a * start[0] + b * p1[0] + c * end[0],
+                a * start[1] + b * p1[1] + c * end[1]
+            ))
+    return smoothed
+
+def create_shape(canvas, shape, **kwargs):
+    """
+    draws a (kind, params) shape from a layout table, see overlay.py
+    """
+    kind, params = shape
+    if kind == "oval":
+        x, y, w, h = params
+        return canvas.create_oval(x, y, x + w, y + h, **kwargs)
+    if kind == "bean":
+        cx, cy, w, h, rotation = params
+        return create_bean_shape(canvas, cx, cy, w, h, rotation_deg=rotation, **kwargs)
+    if kind == "semi":
+        cx, cy, w, h, rotation = params
+        return create_semi_circle(canvas, cx, cy, w, h, rotation_deg=rotation, direction="top", **kwargs)
+    if kind == "triangle":
+        cx, cy, w, rotation = params
+        return create_triangle(canvas, cx, cy, w, rotation_deg=rotation, **kwargs)
+    raise ValueError(f"Unknown shape: {kind}")
+
+def shape_points(shape):
+    """
+    outline of a (kind, params) shape as a list of points, with Tk's smoothing applied
+    the same way create_shape draws it
+    """
+    kind, params = shape
+    if kind == "oval":
+        x, y, w, h = params
+        steps = 64
+        return [
+            (x + w / 2 + w / 2 * cos(2 * pi * i / steps), y + h / 2 + h / 2 * sin(2 * pi * i / steps))
+            for i in range(steps)
+        ]
+    if kind == "bean":
+        cx, cy, w, h, rotation = params
+        return smooth_points(bean_points(cx, cy, w, h, rotation_deg=rotation))
+    if kind == "semi":
+        cx, cy, w, h, rotation = params
+        return smooth_points(semi_circle_points(cx, cy, w, h, rotation_deg=rotation, direction="top"))
+    if kind == "triangle":
+        cx, cy, w, rotation = params
+        return triangle_points(cx, cy, w, rotation_deg=rotation)
+    raise ValueError(f"Unknown shape: {kind}")
@@ -0,0 +1,143 @@
+from math import ceil
+from PIL import Image, ImageDraw
+from shapes import shape_points
+from overlay import MAIN_STICK, C_STICK, STICK_COLOURS, BUTTON_SHAPES, TRIGGER_SHAPES, \
+    DRAW_ORDER, OUTLINED_BUTTONS, BUTTON_COLOURS, END_COLOURS, TRIGGER_COLOURS, fade_lut
+
+###################
+# Sprite renderer #
+###################
+# draws the controller overlay without any canvas items. every button is rasterised once
+# in each of its fade colours into a strip (the atlas) when the renderer is made, then a
+# frame is the base controller image with one sprite composited per part. the cost of a
+# frame doesn't depend on Tk at all, so the same renderer works headless too.
+# multiplayer movies are drawn as a grid of controllers in one image by PortsRenderer,
+# which shares a single atlas between them and only redraws the controllers that changed
+
+SUPERSAMPLE = 4     # shapes are drawn this many times bigger then scaled down to smooth their edges
+LAYOUT_WIDTH = 300  # the width the layout in overlay.py is measured at
+
+class SpriteStrip():
+    """
+    one part of the controller rasterised in every colour it can be, side by side
+    """
+    def __init__(self, shape, colours: list[str], outlined: bool, scale: float):
+        points = [(x * scale, y * scale) for x, y in shape_points(shape)]
+        pad = 2
+        self.x = int(min(x for x, _ in points)) - pad
+        self.y = int(min(y for _, y in points)) - pad
+        self.w = int(max(x for x, _ in points)) + pad - self.x + 1
+        self.h = int(max(y for _, y in points)) + pad - self.y + 1
+
+        s = SUPERSAMPLE
+        local = [((x - self.x) * s, (y - self.y) * s) for x, y in points]
+        self.image = Image.new("RGBA", (self.w * len(colours), self.h))
+        for i, colour in enumerate(colours):
+            big = Image.new("RGBA", (self.w * s, self.h * s))
+            ImageDraw.Draw(big).polygon(
+                local,
+                fill=colour,
+                outline="black" if outlined else None,
+                width=max(1, round(scale * s)) if outlined else 1
+            )
+            self.image.paste(big.reduce(s), (i * self.w, 0))
+
+    def draw(self, target: Image.Image, index: int, dx: int = 0, dy: int = 0):
+        left = index * self.w
+        target.alpha_composite(
+            self.image,
+            dest=(self.x + dx, self.y + dy),
+            source=(left, 0, left + self.w, self.h)
+        )
+
+class SpriteRenderer():
+    def __init__(self, base: Image.Image):
+        self.base = base.convert("RGBA")
+        self.scale = self.base.width / LAYOUT_WIDTH
+        self.image = self.base.copy()   # the frame is composited into this
+        self.drawn = None               # levels the image currently shows
+
+        self.main_stick = SpriteStrip(MAIN_STICK, [STICK_COLOURS[0]], True, self.scale)
+        self.c_stick    = SpriteStrip(C_STICK, [STICK_COLOURS[1]], True, self.scale)
+        self.buttons = [
+            SpriteStrip(shape, fade_lut(start, end), outlined, self.scale)
+            for shape, start, end, outlined in zip(BUTTON_SHAPES, BUTTON_COLOURS, END_COLOURS, OUTLINED_BUTTONS)
+        ]
+        trigger_lut = fade_lut(*TRIGGER_COLOURS, invert=True)
+        self.triggers = [SpriteStrip(shape, trigger_lut, True, self.scale) for shape in TRIGGER_SHAPES]
+
+    def render(self, levels) -> bool:
+        """
+        composites the controller for a RenderPlan.levels() tuple into self.image,
+        returns False if the image already showed those levels
+        """
+        if levels == self.drawn:
+            return False
+        self.draw(self.image, levels)
+        self.drawn = levels
+        return True
+
+    def draw(self, image: Image.Image, levels, x: int = 0, y: int = 0):
+        """
+        composites the controller for a levels tuple into image with its top left at x, y
+        """
+        (main_dx, main_dy), (c_dx, c_dy), button_levels, l_level, r_level = levels
+        s = self.scale
+        image.paste(self.base, (x, y))
+        self.main_stick.draw(image, 0, x + round(main_dx * s), y + round(main_dy * s))
+        self.c_stick.draw(image, 0, x + round(c_dx * s), y + round(c_dy * s))
+        trigger_levels = (l_level, r_level)
+        for kind, i in DRAW_ORDER:
+            if kind == "trigger":
+                self.triggers[i].draw(image, trigger_levels[i], x, y)
+            else:
+                self.buttons[i].draw(image, button_levels[i], x, y)
+
+class PortsRenderer():
+    """
+    a controller per port in a grid (side by side for two, 2x2 for three or four), all in
+    one image so showing a frame is a single update however many ports there are
+    """
+    def __init__(self, renderer: SpriteRenderer, ports: list[int], columns: int = 2):
+        self.renderer = renderer
+        self.ports = ports
+        self.columns = min(columns, len(ports))
+        rows = ceil(len(ports) / self.columns)
+        w, h = renderer.base.size
+        self.cells = [(i % self.columns * w, i // self.columns * h) for i in range(len(ports))]
+        self.image = Image.new("RGBA", (w * self.columns, h * rows))
+        self.drawn = [None] * len(ports)    # levels each cell currently shows
+        # port numbers, drawn once here as text is slower to draw than a whole controller
+        self.labels = []
+        if len(ports) > 1:
+            for port in ports:
+                label = Image.new("RGBA", (24, 14))
+                ImageDraw.Draw(label).text((0, 0), f"P{port + 1}", fill="#808080")
+                self.labels.append(label)
+
+    def render(self, levels) -> bool:
+        """
+        composites a levels tuple per port into self.image, returns False if it already
+        showed all of them
+        """
+        changed = False
+        for i, (port_levels, (x, y)) in enumerate(zip(levels, self.cells)):
+            if port_levels == self.drawn[i]:
+                continue
+            self.renderer.draw(self.image, port_levels, x, y)
+            if self.labels:
+                self.image.alpha_composite(self.labels[i], dest=(x + 4, y + 2))
+            self.drawn[i] = port_levels
+            changed = True
+        return changed
+
+_renderers = dict()
+
+def get_renderer(base: Image.Image, key) -> SpriteRenderer:
+    """
+    renderers are cached so the atlas is only built once per base image and size
+    """
+    key = (key, base.size)
+    if key not in _renderers:
+        _renderers[key] = SpriteRenderer(base)
+    return _renderers[key]
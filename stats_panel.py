@@ -0,0 +1,66 @@
+import customtkinter as ctk
+from customtkinter import filedialog
+from analytics import compute_ports, export_json, summary
+from util import log, err_popup
+
+###############
+# Stats panel #
+###############
+# shows the analytics for the loaded DTM under the controller, one block per port, and saves
+# them as json. notes go above them, for things like where a compared DTM diverges
+
+class StatsPanel(ctk.CTkFrame):
+    def __init__(self, parent, corner_radius: int = 6, padding: int = 4):
+        super().__init__(parent)
+        self.stats = None   # a stats dict per port
+        self.notes = ""     # shown above the stats, e.g. where a compared DTM diverges
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.txt_stats = ctk.CTkTextbox(self, font=ctk.CTkFont(family="Courier", size=12), wrap="none")
+        self.txt_stats.grid(row=0, column=0, padx=padding, pady=padding, sticky="nsew")
+        self.btn_export = ctk.CTkButton(
+            self, text="Export Stats", command=self.export, corner_radius=corner_radius, state="disabled"
+        )
+        self.btn_export.grid(row=1, column=0, padx=padding, pady=(0, padding))
+        self.show(None)
+
+    def set_inputs(self, port_inputs, ports: list[int], polls_per_second: float):
+        self.stats = compute_ports(port_inputs, ports, polls_per_second)
+        log(f"Worked out stats for {self.stats[0]['polls']} polls on {len(ports)} port(s)")
+        self.show(self.stats)
+
+    def clear(self):
+        self.stats = None
+        self.notes = ""
+        self.show(None)
+
+    def set_notes(self, notes: str):
+        self.notes = notes
+        self.show(self.stats)
+
+    def show(self, stats):
+        text = "\n\n".join(summary(port_stats) for port_stats in stats) if stats else "Load a DTM to see input stats"
+        if self.notes:
+            text = f"{self.notes}\n\n{text}"
+        self.txt_stats.configure(state="normal")
+        self.txt_stats.delete("1.0", "end")
+        self.txt_stats.insert("1.0", text)
+        self.txt_stats.configure(state="disabled")
+        self.btn_export.configure(state="normal" if stats else "disabled")
+
+    def export(self):
+        if not self.stats:
+            return
+        filename = filedialog.asksaveasfilename(
+            title="Export input stats",
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json")]
+        )
+        # filename will be blank if the user cancels
+        if not filename:
+            return
+        try:
+            export_json(self.stats, filename)
+        except OSError as e:
+            err_popup(f"Failed to export stats:\n\n{e}")
@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+import cv2
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from align import SyncMap, correlate, dtm_key, frame_differences, input_changes, lag_frames
+from cache import FileCache
+from dtm import INPUT_DTYPE, NEUTRAL_INPUT, DTMSource
+
+SAMPLE = ROOT / "sample" / "pikmin.dtm"
+FRAMES = 40
+# frames that repeat the one before them
+DUPLICATES = [10, 11, 25]
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory) -> str:
+    # a square moving across the picture, standing still on the duplicate frames
+    path = tmp_path_factory.mktemp("align") / "dump.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (128, 72))
+    x = 0
+    for index in range(FRAMES):
+        if index not in DUPLICATES:
+            x += 2
+        frame = np.zeros((72, 128, 3), dtype=np.uint8)
+        frame[20:50, x:x + 30] = 255
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+def test_frame_differences(video):
+    differences = frame_differences(video, 0, FRAMES)
+    assert np.isinf(differences[0])
+    assert np.flatnonzero(differences < 1.0).tolist() == DUPLICATES
+
+def test_frame_differences_from_keyframe(video):
+    # grabbing forward from a keyframe gives the same as seeking straight there
+    whole = frame_differences(video, 0, FRAMES)
+    assert np.array_equal(frame_differences(video, 20, 30, keyframe=0), whole[20:30])
+    assert np.array_equal(frame_differences(video, 20, 30), whole[20:30])
+
+def test_correlate_finds_offset():
+    rng = np.random.default_rng(0)
+    movie = rng.random(300) < 0.2
+    for offset in (-17, 0, 42):
+        video = np.zeros(400, dtype=bool)
+        if offset >= 0:
+            video[offset:offset + 300] = movie[:400 - offset]
+        else:
+            video[:300 + offset] = movie[-offset:]
+        scores = correlate(video, movie, 60)
+        assert int(np.argmax(scores)) - 60 == offset
+    # nothing to line up with a flat signal
+    assert not correlate(np.zeros(100), movie, 10).any()
+
+def test_input_changes_and_lag():
+    inputs = np.full(12, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+    inputs["buttons"][5] = 1
+    frame_polls = np.array([0, 4, 4, 8, 12])
+    # poll 5 changes, and poll 6 changes back. frame 1 repeats on frame 2 for lag, so it's
+    # frame 2 that goes on to show polls 5-7
+    assert input_changes([inputs], frame_polls).tolist() == [False, False, True, False, False]
+    # a change on another port counts too
+    other = np.full(12, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+    other["main_x"][9] = 255
+    assert input_changes([inputs, other], frame_polls).tolist() == [False, False, True, True, False]
+    assert lag_frames(frame_polls).tolist() == [False, False, True, False, False]
+
+def test_sync_map_round_trip(tmp_path, video):
+    source = DTMSource(SAMPLE, FileCache(tmp_path, max_bytes=1 << 30))
+    uncached = DTMSource(SAMPLE)
+    try:
+        # the key is the same with or without a cache
+        assert dtm_key(source) == source.key == dtm_key(uncached)
+        sync = SyncMap(3, DUPLICATES, dtm_key(source), FRAMES, 30.0, 0.5)
+        path = tmp_path / "dump.avi"
+        sync.save(path)
+        loaded = SyncMap.load(path)
+        assert (loaded.offset, loaded.dtm_digest, loaded.video_frames) == (3, source.key, FRAMES)
+        assert loaded.duplicates.tolist() == DUPLICATES
+        # at 60Hz and 30fps each frame is 2 VIs, counted from the movie's first frame
+        assert sync.lag_vis(source.header, 30.0).tolist() == [14, 15, 16, 17, 44, 45]
+    finally:
+        source.close()
+        uncached.close()
@@ -0,0 +1,127 @@
+import sys
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from analytics import ANGLE_BINS, columns, compute, compute_ports, export_json, runs, summary
+from dtm import BUTTONS, INPUT_DTYPE, NEUTRAL_INPUT, button_states, read_dtm
+
+def bit(name: str) -> int:
+    return 1 << BUTTONS.index(name)
+
+def neutral(n: int) -> np.ndarray:
+    return np.full(n, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+
+def test_columns():
+    inputs = np.array([(0x0123, 1, 2, 3, 4, 5, 6)], dtype=INPUT_DTYPE)
+    buttons, triggers, main, c = columns(inputs)
+    assert buttons[0] == 0x0123
+    # the second byte of each pair is the high byte
+    assert triggers[0] == 2 << 8 | 1
+    assert main[0] == 4 << 8 | 3
+    assert c[0] == 6 << 8 | 5
+
+def test_press_counts():
+    inputs = neutral(20)
+    # A held for 3 polls then tapped again, B held for 2, Start tapped once
+    inputs["buttons"][0:3] |= bit("a")
+    inputs["buttons"][5] |= bit("a")
+    inputs["buttons"][3:5] |= bit("b")
+    inputs["buttons"][10] |= bit("start")
+    # a bit above the buttons that some movies always have set isn't a press
+    inputs["buttons"] |= 1 << 13
+    stats = compute(inputs, 10)
+    buttons = stats["buttons"]
+    assert buttons["a"]["presses"] == 2
+    assert buttons["a"]["held_polls"] == 4
+    assert buttons["b"]["presses"] == 1
+    assert buttons["b"]["held_polls"] == 2
+    assert buttons["start"]["presses"] == 1
+    assert sum(button["presses"] for button in buttons.values()) == 4
+    # 20 polls at 10 a second is 2 seconds, both A presses are within one second
+    assert buttons["a"]["presses_per_second"] == 1.0
+    assert buttons["a"]["peak_presses_per_second"] == 2
+
+def test_stick_directions():
+    inputs = neutral(10)
+    sticks = [
+        (255, 128), (255, 128), (255, 128),     # right
+        (128, 255), (128, 255),                 # up
+        (0, 255),                               # up and left
+        (128, 0),                               # down
+        (140, 120),                             # inside the deadzone
+    ]
+    for i, (x, y) in enumerate(sticks):
+        inputs["main_x"][i] = x
+        inputs["main_y"][i] = y
+    inputs["c_x"][0] = 0
+    stats = compute(inputs, 10)
+    main = stats["main_stick"]
+    assert main["moved_polls"] == 7
+    # sectors are 360 / ANGLE_BINS degrees anticlockwise from right
+    expected = np.zeros(ANGLE_BINS, dtype=np.int64)
+    expected[0] = 3
+    expected[ANGLE_BINS // 4] = 2
+    expected[ANGLE_BINS * 3 // 8] = 1
+    expected[ANGLE_BINS * 3 // 4] = 1
+    assert main["angle_counts"] == expected.tolist()
+    assert main["angle_bins"][ANGLE_BINS // 4] == 90
+    # the c stick was pushed left once
+    assert stats["c_stick"]["moved_polls"] == 1
+    assert stats["c_stick"]["angle_counts"][ANGLE_BINS // 2] == 1
+
+def test_triggers():
+    inputs = neutral(10)
+    inputs["l"][0:2] = 255
+    inputs["l"][2] = 20     # under the threshold
+    inputs["r"][3] = 100
+    stats = compute(inputs, 10)
+    assert stats["l_trigger"]["pressed_polls"] == 2
+    assert stats["l_trigger"]["mean_when_pressed"] == 255
+    assert stats["l_trigger"]["counts"][-1] == 2
+    assert stats["l_trigger"]["counts"][1] == 1
+    assert stats["r_trigger"]["pressed_polls"] == 1
+    assert stats["r_trigger"]["mean_when_pressed"] == 100
+
+def test_idle():
+    inputs = neutral(20)
+    inputs["buttons"][5] = bit("a")
+    inputs["main_x"][12] = 255
+    stats = compute(inputs, 10)
+    assert stats["idle_polls"] == 18
+    longest = stats["longest_idle"]
+    assert [(stretch["start_poll"], stretch["polls"]) for stretch in longest] == [(13, 7), (6, 6), (0, 5)]
+
+def test_runs():
+    starts, lengths = runs(np.array([1, 1, 0, 0, 1, 0, 1, 1, 1], dtype=bool))
+    assert starts.tolist() == [0, 4, 6]
+    assert lengths.tolist() == [2, 1, 3]
+
+def test_ports(tmp_path):
+    a, b = neutral(10), neutral(10)
+    b["buttons"][3] = bit("start")
+    stats = compute_ports([a, b], [0, 3], 10)
+    assert [port["port"] for port in stats] == [1, 4]
+    assert stats[0]["buttons"]["start"]["presses"] == 0
+    assert stats[1]["buttons"]["start"]["presses"] == 1
+    assert summary(stats[1]).startswith("port 4: 10 polls")
+    # one port exports as it always has, more go in a list
+    export_json(stats[:1], tmp_path / "one.json")
+    export_json(stats, tmp_path / "two.json")
+    assert '"port": 1' in (tmp_path / "one.json").read_text()
+    assert (tmp_path / "two.json").read_text().startswith('{\n  "ports": [')
+
+def test_presses_match_sample():
+    # counted one poll at a time, the way the old text inputs would have been
+    header, inputs = read_dtm(ROOT / "sample" / "pikmin.dtm")
+    expected = [0] * len(BUTTONS)
+    previous = [0] * len(BUTTONS)
+    for poll in inputs:
+        states = button_states(poll)
+        for i, (state, before) in enumerate(zip(states, previous)):
+            expected[i] += state and not before
+        previous = states
+    stats = compute(inputs, header.polls_per_second)
+    assert [stats["buttons"][name]["presses"] for name in BUTTONS] == expected
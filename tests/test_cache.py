@@ -0,0 +1,70 @@
+import os
+import sys
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cache import FileCache, file_digest
+
+def put_bytes(cache: FileCache, key: str, data: bytes) -> Path:
+    return cache.put(key, ".bin", lambda f: f.write(data))
+
+def age(path: Path, seconds: float):
+    # eviction sorts by mtime, so set it rather than relying on the clock's resolution
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime - seconds))
+
+def test_hit_and_miss(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=1 << 20)
+    assert cache.get("movie", ".bin") is None
+    path = put_bytes(cache, "movie", b"polls")
+    assert cache.get("movie", ".bin") == path
+    assert path.read_bytes() == b"polls"
+    # the suffix is part of the entry
+    assert cache.get("movie", ".npy") is None
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=250)
+    a = put_bytes(cache, "a", b"a" * 100)
+    b = put_bytes(cache, "b", b"b" * 100)
+    age(a, 20)
+    age(b, 10)
+    # reading a makes b the least recently used
+    cache.get("a", ".bin")
+    c = put_bytes(cache, "c", b"c" * 100)
+    assert a.exists() and c.exists()
+    assert not b.exists()
+
+def test_keeps_new_entry_over_budget(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=50)
+    a = put_bytes(cache, "a", b"a" * 40)
+    age(a, 10)
+    big = put_bytes(cache, "big", b"b" * 100)
+    # everything else goes, but the entry that was just written stays
+    assert big.exists()
+    assert not a.exists()
+
+def test_failed_write_leaves_nothing(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=1 << 20)
+    path = put_bytes(cache, "movie", b"old")
+
+    def write(f):
+        f.write(b"half")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        cache.put("movie", ".bin", write)
+    # the old entry is untouched and the temporary file is cleaned up
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+def test_digest_is_by_content(tmp_path):
+    a = tmp_path / "a.dtm"
+    b = tmp_path / "b.dtm"
+    a.write_bytes(b"DTM\x1a" + bytes(300))
+    b.write_bytes(b"DTM\x1a" + bytes(300))
+    assert file_digest(a) == file_digest(b)
+    b.write_bytes(b"DTM\x1a" + bytes(299) + b"\x01")
+    assert file_digest(a) != file_digest(b)
@@ -0,0 +1,91 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+# the modules are flat at the top of the repo
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cache import FileCache
+from dtm import BUTTONS, HEADER_SIZE, INPUT_DTYPE, DTMSource, button_states, read_dtm
+
+SAMPLE = ROOT / "sample" / "pikmin.dtm"
+# dtm2text 0.0.8's output for the sample, made with: dtm2text sample/pikmin.dtm --no-header
+FIXTURE = ROOT / "tests" / "fixtures" / "pikmin.dtm_inputs.txt"
+
+def as_dtm2text(inputs: np.ndarray) -> list[str]:
+    # every poll as a dtm2text line: the buttons in BUTTONS order, then l, r, main x/y, c x/y
+    return [
+        ":".join(str(value) for value in button_states(poll) + [
+            int(poll["l"]), int(poll["r"]), int(poll["main_x"]), int(poll["main_y"]), int(poll["c_x"]), int(poll["c_y"])
+        ])
+        for poll in inputs
+    ]
+
+def read_lines(path) -> list[str]:
+    return [line.strip() for line in Path(path).read_text().splitlines() if line.strip()]
+
+def test_header():
+    header, inputs = read_dtm(SAMPLE)
+    assert header.game_id == "GPIP01"
+    assert header.vi_count == 2998
+    assert header.input_count == 5996
+    assert header.lag_count == 0
+    # one record per poll after the header
+    assert len(inputs) == header.input_count
+
+def test_matches_dtm2text_fixture():
+    _, inputs = read_dtm(SAMPLE)
+    assert as_dtm2text(inputs) == read_lines(FIXTURE)
+
+def test_source_matches_read_dtm():
+    header, inputs = read_dtm(SAMPLE)
+    source = DTMSource(SAMPLE)
+    try:
+        assert source.header.input_count == header.input_count
+        assert len(source) == len(inputs)
+        assert np.array_equal(source.inputs, inputs)
+        assert source[100] == inputs[100]
+    finally:
+        source.close()
+
+def test_source_ignores_partial_record(tmp_path):
+    # a truncated movie can end part way through a record, which is left out
+    path = tmp_path / "partial.dtm"
+    path.write_bytes(SAMPLE.read_bytes()[:HEADER_SIZE + 10 * INPUT_DTYPE.itemsize + 3])
+    source = DTMSource(path)
+    try:
+        assert len(source) == 10
+    finally:
+        source.close()
+
+def test_source_from_cache(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=1 << 30)
+    first = DTMSource(SAMPLE, cache)
+    second = DTMSource(SAMPLE, cache)
+    try:
+        assert first.key == second.key
+        assert cache.get(first.key, ".inputs.npy") is not None
+        assert np.array_equal(first.inputs, second.inputs)
+    finally:
+        first.close()
+        second.close()
+
+def test_button_columns():
+    # each button is one bit of the buttons field, in the order dtm2text writes them
+    poll = np.zeros(1, dtype=[("buttons", "<u2")])[0]
+    for bit in range(len(BUTTONS)):
+        poll["buttons"] = 1 << bit
+        assert button_states(poll) == [int(i == bit) for i in range(len(BUTTONS))]
+
+def test_matches_dtm2text():
+    dtm2text = pytest.importorskip("dtm2text")
+    # decode every record with dtm2text's own converter
+    data = SAMPLE.read_bytes()[HEADER_SIZE:]
+    expected = [
+        dtm2text.text_input_from_bytes(data[i:i + INPUT_DTYPE.itemsize])
+        for i in range(0, len(data) - len(data) % INPUT_DTYPE.itemsize, INPUT_DTYPE.itemsize)
+    ]
+    _, inputs = read_dtm(SAMPLE)
+    assert as_dtm2text(inputs) == expected
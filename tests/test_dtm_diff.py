@@ -0,0 +1,105 @@
+import sys
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from analytics import runs
+from dtm import BUTTONS, INPUT_DTYPE, NEUTRAL_INPUT, read_dtm
+from dtm_diff import DTMDiff, MovieDiff, changed_fields, summary
+from frame_map import FrameMap
+
+def neutral(n: int) -> np.ndarray:
+    return np.full(n, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+
+def every_4_polls(polls: int) -> FrameMap:
+    # a frame every 4 polls, with one more frame after the last
+    return FrameMap.build(np.arange(polls // 4 + 2) * 4, polls)
+
+def test_identical():
+    _, inputs = read_dtm(ROOT / "sample" / "pikmin.dtm")
+    diff = DTMDiff(inputs, inputs.copy())
+    assert diff.identical
+    assert diff.first is None
+    assert len(diff) == 0
+    assert diff.differing_polls == 0
+    assert diff.runs() == []
+    assert diff.frame_ranges(every_4_polls(len(inputs))).shape == (0, 2)
+    assert summary(MovieDiff({0: inputs}, {0: inputs.copy()}), 60).startswith("Inputs are identical")
+
+def test_different_lengths():
+    a, b = neutral(100), neutral(120)
+    diff = DTMDiff(a, b)
+    assert not diff.identical
+    # the polls only one of them has are a run at the end
+    assert diff.first == 100
+    assert diff.runs() == [(100, 20, ["length"])]
+    assert diff.differing_polls == 20
+    assert diff.poll_pair(110)[0] is None
+    # and it's the same the other way around
+    assert DTMDiff(b, a).runs() == [(100, 20, ["length"])]
+
+def test_empty_movie():
+    empty = neutral(0)
+    assert DTMDiff(empty, empty).identical
+    diff = DTMDiff(empty, neutral(10))
+    assert diff.first == 0
+    assert diff.runs() == [(0, 10, ["length"])]
+    assert diff.frame_ranges(every_4_polls(10)).tolist() == [[0, 3]]
+    # against the empty movie's map there's nothing to show them on
+    assert diff.frame_ranges(every_4_polls(0)).shape == (0, 2)
+    assert summary(MovieDiff({0: empty}, {0: neutral(10)}), 60).startswith("First divergence at poll 0")
+
+def test_multi_field_runs():
+    a, b = neutral(100), neutral(100)
+    # one run where A and the main stick change, then a gap, then one with the c stick and R
+    b["buttons"][10:15] |= 1 << BUTTONS.index("a")
+    b["main_x"][12:18] = 255
+    b["c_y"][40] = 0
+    b["r"][41] = 200
+    # a bit above the buttons still counts
+    b["buttons"][90] |= 1 << 14
+    diff = DTMDiff(a, b)
+    assert diff.first == 10
+    assert diff.runs() == [
+        (10, 8, ["a", "main_x"]),
+        (40, 2, ["r", "c_y"]),
+        (90, 1, ["buttons"]),
+    ]
+    assert diff.differing_polls == 11
+    # polls 10-17 are on frames 2-4, 40-41 on frame 10
+    assert diff.frame_ranges(every_4_polls(100)).tolist() == [[2, 5], [10, 11], [22, 23]]
+    assert diff.runs(limit=1) == [(10, 8, ["a", "main_x"])]
+
+def test_ports():
+    a1, a2 = neutral(100), neutral(100)
+    b1, b2 = neutral(100), neutral(100)
+    b1["buttons"][50] |= 1 << BUTTONS.index("a")
+    b2["main_x"][20:23] = 0
+    # port 4 is only in the second movie
+    diff = MovieDiff({0: a1, 1: a2}, {0: b1, 1: b2, 3: neutral(100)})
+    assert [port.port for port in diff.diffs] == [0, 1, 3]
+    assert diff.first == 0
+    assert diff.first_diff.port == 3
+    assert diff.differing_polls == 104
+    assert diff.runs() == [(3, 0, 100, ["length"]), (1, 20, 3, ["main_x"]), (0, 50, 1, ["a"])]
+    assert diff.runs(limit=2) == [(3, 0, 100, ["length"]), (1, 20, 3, ["main_x"])]
+    # the frames of every run, in order
+    assert diff.frame_ranges(every_4_polls(100)).tolist() == [[0, 25], [5, 6], [12, 13]]
+    text = summary(diff, 60)
+    assert "on port 4" in text
+    assert "port 2 polls 20-22: main_x" in text
+    assert [port["port"] for port in diff.to_dict()["ports"]] == [1, 2, 4]
+    # the same ports with the same inputs are identical
+    assert MovieDiff({0: a1, 1: a2}, {0: a1.copy(), 1: a2.copy()}).identical
+
+def test_changed_fields():
+    assert changed_fields(0) == []
+    assert changed_fields(1 << BUTTONS.index("b") | 1 << BUTTONS.index("start")) == ["start", "b"]
+    # l is the third byte of the record
+    assert changed_fields(0xFF << 16) == ["l"]
+
+def test_runs_of_nothing():
+    starts, lengths = runs(np.zeros(0, dtype=bool))
+    assert len(starts) == 0 and len(lengths) == 0
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from frame_cache import FrameCache
+from frame_decoder import new_buffer
+
+SIZE = (10, 10)
+# a 10x10 RGBA frame
+FRAME_BYTES = 10 * 10 * 4
+
+def frame():
+    return new_buffer(SIZE)
+
+def test_hit_and_miss():
+    cache = FrameCache(10 * FRAME_BYTES)
+    assert cache.get(0, SIZE) is None
+    buffer = frame()
+    cache.put(0, SIZE, buffer)
+    assert cache.get(0, SIZE) is buffer
+    # frames scaled to another size are separate entries
+    assert cache.get(0, (20, 20)) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_evicts_least_recently_used():
+    cache = FrameCache(3 * FRAME_BYTES)
+    for index in range(3):
+        cache.put(index, SIZE, frame())
+    # reading frame 0 makes frame 1 the least recently used
+    cache.get(0, SIZE)
+    cache.put(3, SIZE, frame())
+    assert len(cache) == 3
+    assert cache.get(1, SIZE) is None
+    assert all(cache.get(index, SIZE) is not None for index in (0, 2, 3))
+
+def test_byte_budget():
+    cache = FrameCache(3 * FRAME_BYTES)
+    for index in range(10):
+        cache.put(index, SIZE, frame())
+        assert cache.bytes <= cache.max_bytes
+    assert cache.bytes == 3 * FRAME_BYTES
+    # replacing an entry doesn't count it twice
+    cache.put(9, SIZE, frame())
+    assert cache.bytes == 3 * FRAME_BYTES
+    # a frame bigger than the whole budget is never stored
+    cache.put(10, (100, 100), new_buffer((100, 100)))
+    assert cache.get(10, (100, 100)) is None
+    assert len(cache) == 3
+
+def test_clear():
+    cache = FrameCache(3 * FRAME_BYTES)
+    cache.put(0, SIZE, frame())
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.bytes == 0
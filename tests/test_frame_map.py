@@ -0,0 +1,123 @@
+import struct
+import sys
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cache import FileCache
+from dtm import HEADER_SIZE, INPUT_DTYPE, NEUTRAL_INPUT, DTMHeader, DTMSource
+from frame_map import FrameMap, frame_polls, read_lag_file
+
+SAMPLE = ROOT / "sample" / "pikmin.dtm"
+
+def make_header(game_id: str, vis: int, polls: int, lag: int = 0, pal60: bool = False) -> bytes:
+    # the sample's header with the region, counts and 60Hz flag swapped out
+    data = bytearray(SAMPLE.read_bytes()[:HEADER_SIZE])
+    data[0x04:0x0A] = game_id.encode("ascii")
+    struct.pack_into("<QQQ", data, 0x0D, vis, polls, lag)
+    data[0x9C] = pal60
+    return bytes(data)
+
+def make_dtm(path: Path, game_id: str, vis: int, polls: int, lag: int = 0) -> Path:
+    path.write_bytes(make_header(game_id, vis, polls, lag) + np.full(polls, NEUTRAL_INPUT, dtype=INPUT_DTYPE).tobytes())
+    return path
+
+def test_vi_rates():
+    assert DTMHeader(make_header("GPIE01", 600, 1200)).vi_rate == 60
+    assert DTMHeader(make_header("GPIP01", 500, 1000)).vi_rate == 50
+    # a PAL game running at 60Hz
+    pal60 = DTMHeader(make_header("GPIP01", 600, 1200, pal60=True))
+    assert pal60.pal60
+    assert pal60.vi_rate == 60
+    assert pal60.polls_per_second == 120
+
+def test_ntsc():
+    header = DTMHeader(make_header("GPIE01", 600, 1200))
+    # 2 VIs a frame at 30fps and 2 polls a VI
+    polls = frame_polls(header, 1200, 30)
+    assert polls[:5].tolist() == [0, 4, 8, 12, 16]
+    assert polls[299] == 1196
+    # 60fps is a frame every VI
+    assert frame_polls(header, 1200, 60)[:4].tolist() == [0, 2, 4, 6]
+
+def test_pal50():
+    header = DTMHeader(make_header("GPIP01", 500, 1000))
+    # 2 VIs a frame at 25fps
+    assert frame_polls(header, 1000, 25)[:4].tolist() == [0, 4, 8, 12]
+    # at 30fps a frame is 5/3 VIs, so the frames land on VIs 0, 1, 3, 5, 6, 8
+    assert frame_polls(header, 1000, 30)[:6].tolist() == [0, 2, 6, 10, 12, 16]
+
+def test_pal60():
+    # the same movie at 60Hz has frames every 2 VIs at 30fps, like NTSC
+    header = DTMHeader(make_header("GPIP01", 600, 1200, pal60=True))
+    assert frame_polls(header, 1200, 30)[:5].tolist() == [0, 4, 8, 12, 16]
+
+def test_lag_spread_evenly():
+    # 100 VIs with 20 lag ones spread through them, the other 80 read 2 polls each
+    header = DTMHeader(make_header("GPIE01", 100, 160, lag=20))
+    polls = frame_polls(header, 160, 60, frames=100)
+    # every 5th VI is a lag one, and shows the last poll read before it
+    assert polls[:7].tolist() == [0, 2, 4, 6, 7, 8, 10]
+    assert np.all(np.diff(polls) >= 0)
+    assert np.count_nonzero(polls % 2) == 20
+    assert polls[-1] == 159
+
+def test_lag_vis_given():
+    header = DTMHeader(make_header("GPIE01", 10, 16, lag=2))
+    # lag on VIs 1 and 2, nowhere else
+    polls = frame_polls(header, 16, 60, frames=10, lag_vis=np.array([1, 2]))
+    assert polls.tolist() == [0, 1, 1, 2, 4, 6, 8, 10, 12, 14]
+
+def test_reverse_lookup():
+    frame_map = FrameMap.build(np.array([0, 1, 1, 2, 4, 6]), 8)
+    assert frame_map.poll(2) == 1
+    assert frame_map.poll(6) is None
+    # a poll shown on several frames goes to the first, one that's skipped to the frame before
+    assert frame_map.frame(1) == 1
+    assert frame_map.frame(3) == 3
+    assert frame_map.frame(4) == 4
+    assert frame_map.first_poll(-1) == 0
+    assert frame_map.first_poll(100) == 8
+
+def test_extend_matches_build():
+    # a header that's still being recorded has no counts yet
+    header = DTMHeader(make_header("GPIE01", 0, 0))
+    frame_map = FrameMap.build(frame_polls(header, 10, 30), 10)
+    for polls in range(50, 2000, 97):
+        frame_map.extend(header, polls, 30)
+    frame_map.extend(header, 2000, 30)
+    whole = FrameMap.build(frame_polls(header, 2000, 30), 2000)
+    assert frame_map.polls == 2000
+    assert np.array_equal(frame_map.frame_polls, whole.frame_polls[:len(frame_map.frame_polls)])
+    assert np.array_equal(frame_map.poll_frames, whole.poll_frames)
+
+def test_lag_file(tmp_path):
+    path = make_dtm(tmp_path / "lag.dtm", "GPIE01", 10, 16, lag=2)
+    assert read_lag_file(path) is None
+    Path(f"{path}.lag").write_text("2  # comment\n1\n\n")
+    assert read_lag_file(path).tolist() == [1, 2]
+    source = DTMSource(path, FileCache(tmp_path / "cache", max_bytes=1 << 30))
+    try:
+        frame_map = FrameMap.for_source(source, 60, frames=10)
+        assert frame_map.frame_polls.tolist() == [0, 1, 1, 2, 4, 6, 8, 10, 12, 14]
+        # a bad lag file is ignored, and the lag is spread evenly instead
+        Path(f"{path}.lag").write_text("one\n")
+        assert read_lag_file(path) is None
+    finally:
+        source.close()
+
+def test_cached_map_matches(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=1 << 30)
+    source = DTMSource(SAMPLE, cache)
+    try:
+        first = FrameMap.for_source(source, 30, cache=cache)
+        second = FrameMap.for_source(source, 30, cache=cache)
+        assert np.array_equal(first.frame_polls, second.frame_polls)
+        assert np.array_equal(first.poll_frames, second.poll_frames)
+        # pikmin is PAL switched to 60Hz, at 2 polls a VI that's 4 polls a 30fps frame
+        assert source.header.vi_rate == 60
+        assert first.frame_polls[:4].tolist() == [0, 4, 8, 12]
+    finally:
+        source.close()
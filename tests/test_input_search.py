@@ -0,0 +1,134 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dtm import BUTTONS, INPUT_DTYPE, NEUTRAL_INPUT
+from frame_map import FrameMap
+from input_search import TERMS, InputIndex
+
+POLLS = 300
+
+def make_inputs() -> np.ndarray:
+    # buttons on overlapping stretches that cross word boundaries
+    inputs = np.full(POLLS, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+    rng = np.random.default_rng(0)
+    for name in ("a", "b", "x", "z"):
+        inputs["buttons"] |= (rng.random(POLLS) < 0.4).astype(np.uint16) << BUTTONS.index(name)
+    inputs["main_x"][100:140] = 255
+    inputs["l"][200:210] = 255
+    return inputs
+
+def held(inputs: np.ndarray, name: str) -> np.ndarray:
+    return (inputs["buttons"] >> BUTTONS.index(name) & 1).astype(bool)
+
+def matches(index: InputIndex, query: str) -> np.ndarray:
+    bits = index.search(query)
+    return np.unpackbits(bits.view(np.uint8), bitorder="little")[:index.polls].astype(bool)
+
+@pytest.fixture(scope="module")
+def inputs():
+    return make_inputs()
+
+@pytest.fixture(scope="module")
+def index(inputs):
+    # a frame every 4 polls
+    return InputIndex([inputs], frame_map=FrameMap.build(np.arange(POLLS // 4 + 1) * 4, POLLS))
+
+def test_terms_match_bitsets(index):
+    assert set(index.bitsets) == TERMS
+
+def test_precedence(inputs, index):
+    a, b, x, z = (held(inputs, name) for name in ("a", "b", "x", "z"))
+    # and binds tighter than or, with or without the +
+    assert np.array_equal(matches(index, "a | b + x"), a | (b & x))
+    assert np.array_equal(matches(index, "a | b x"), a | (b & x))
+    assert np.array_equal(matches(index, "a + b | x"), (a & b) | x)
+    # not binds tighter than and
+    assert np.array_equal(matches(index, "!a + b"), ~a & b)
+    assert np.array_equal(matches(index, "!a | b"), ~a | b)
+    assert np.array_equal(matches(index, "!!a"), a)
+    # brackets
+    assert np.array_equal(matches(index, "(a | b) + x"), (a | b) & x)
+    assert np.array_equal(matches(index, "!(a | b)"), ~(a | b))
+    assert np.array_equal(matches(index, "((a | b) !z) | x"), ((a | b) & ~z) | x)
+
+def test_sticks_and_triggers(index):
+    right = np.zeros(POLLS, dtype=bool)
+    right[100:140] = True
+    assert np.array_equal(matches(index, "main:right"), right)
+    assert np.array_equal(matches(index, "main:any"), right)
+    assert np.array_equal(matches(index, "main:neutral"), ~right)
+    full = np.zeros(POLLS, dtype=bool)
+    full[200:210] = True
+    assert np.array_equal(matches(index, "lt:full"), full)
+    assert not matches(index, "rt:any").any()
+
+def test_not_stays_inside_the_movie(index):
+    # the padding after the last poll in its word never matches
+    assert index.count(index.search("!a | a")) == POLLS
+
+def test_ranges(index):
+    expected = np.zeros(POLLS, dtype=bool)
+    expected[63:130] = True
+    assert np.array_equal(matches(index, "poll:63-129"), expected)
+    # frames are 4 polls each, frame:a-b is every poll shown on frames a to b
+    expected = np.zeros(POLLS, dtype=bool)
+    expected[4 * 10:4 * 21] = True
+    assert np.array_equal(matches(index, "frame:10-20"), expected)
+    assert np.array_equal(matches(index, "frame:10"), np.arange(POLLS) // 4 == 10)
+    assert np.array_equal(matches(index, "frame:70-"), np.arange(POLLS) >= 280)
+    # ranges past the end are clipped to the movie
+    assert matches(index, "frame:70-1000").sum() == 20
+    assert not matches(index, "frame:1000-").any()
+
+def test_poll_range_bounds(index):
+    for start, end in [(0, 1), (63, 64), (64, 65), (0, POLLS), (10, 10), (250, 1000), (-5, 3)]:
+        bits = np.unpackbits(index.poll_range(start, end).view(np.uint8), bitorder="little")
+        expected = np.zeros(len(bits), dtype=np.uint8)
+        expected[max(0, start):min(POLLS, end)] = 1
+        assert np.array_equal(bits, expected)
+
+def test_next_and_previous(inputs, index):
+    a = np.flatnonzero(held(inputs, "a"))
+    bits = index.search("a")
+    assert index.next_match(bits, 0) == a[0]
+    assert index.next_match(bits, int(a[5]) + 1) == a[6]
+    assert index.previous_match(bits, int(a[5])) == a[4]
+    assert index.next_match(bits, int(a[-1]) + 1) is None
+    assert index.previous_match(bits, int(a[0])) is None
+
+def test_ports(inputs):
+    # port 4 holds A wherever port 1 doesn't, and B on the first 10 polls
+    other = np.full(POLLS, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+    other["buttons"] = ~inputs["buttons"] & (1 << BUTTONS.index("a"))
+    other["buttons"][:10] |= 1 << BUTTONS.index("b")
+    index = InputIndex([inputs, other], [0, 3])
+    a = held(inputs, "a")
+    b = np.arange(POLLS) < 10
+    # a bare term is any port, a p<N>. one only that port
+    assert matches(index, "a").all()
+    assert np.array_equal(matches(index, "p1.a"), a)
+    assert np.array_equal(matches(index, "p4.a"), ~a)
+    assert np.array_equal(matches(index, "b"), held(inputs, "b") | b)
+    assert np.array_equal(matches(index, "p4.b + !p1.b"), b & ~held(inputs, "b"))
+    assert np.array_equal(matches(index, "P1.MAIN:RIGHT"), matches(index, "main:right"))
+    # a port without a controller is an error rather than matching nothing
+    with pytest.raises(ValueError):
+        index.search("p2.a")
+
+@pytest.mark.parametrize("query", ["banana", "main:sideways", "a + q", "frame:x", "a +", "(a | b", "a )", "p1.banana", "p1.poll:3"])
+def test_bad_queries(index, query):
+    with pytest.raises(ValueError):
+        index.search(query)
+
+def test_empty_index():
+    index = InputIndex([np.zeros(0, dtype=INPUT_DTYPE)])
+    # real terms match nothing, made up ones are still an error
+    assert index.count(index.search("a | main:right")) == 0
+    assert index.count(index.search("!a")) == 0
+    with pytest.raises(ValueError):
+        index.search("banana")
@@ -0,0 +1,117 @@
+import sys
+import threading
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dtm import HEADER_SIZE, INPUT_DTYPE, read_dtm
+from live import DTMTail, LiveSession, VideoTail, simulate
+
+SAMPLE = ROOT / "sample" / "pikmin.dtm"
+FRAMES = 60
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory) -> Path:
+    path = tmp_path_factory.mktemp("live") / "framedump0.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 36))
+    for index in range(FRAMES):
+        writer.write(np.full((36, 64, 3), index * 4, dtype=np.uint8))
+    writer.release()
+    return path
+
+def two_port_dtm(rounds: int) -> tuple[bytes, np.ndarray]:
+    # the sample's polls on ports 1 and 4, with port 4 holding A the whole time
+    header = bytearray(SAMPLE.read_bytes()[:HEADER_SIZE])
+    header[0x0B] = 0b1001
+    _, inputs = read_dtm(SAMPLE)
+    records = np.empty(2 * rounds, dtype=INPUT_DTYPE)
+    records[0::2] = inputs[:rounds]
+    records[1::2] = inputs[:rounds]
+    records["buttons"][1::2] |= 1 << 1
+    return bytes(header), records
+
+def test_dtm_tail_reads_whole_rounds(tmp_path):
+    header, records = two_port_dtm(100)
+    data = records.tobytes()
+    path = tmp_path / "live.dtm"
+    tail = DTMTail(path)
+    # nothing there yet
+    assert tail.read() == (None, None)
+    # the header and 10 and a half rounds
+    path.write_bytes(header + data[:21 * INPUT_DTYPE.itemsize])
+    started, chunks = tail.read()
+    assert started.ports == [0, 3]
+    tail.restart(started)
+    tail.append(chunks)
+    assert len(tail) == 10
+    # the rest of the half round and everything after it
+    with open(path, "ab") as f:
+        f.write(data[21 * INPUT_DTYPE.itemsize:])
+    started, chunks = tail.read()
+    assert started is None
+    tail.append(chunks)
+    assert np.array_equal(tail.port_inputs[0], records[0::2])
+    assert np.array_equal(tail.port_inputs[1], records[1::2])
+    # the same file written over from the start is a new recording
+    path.write_bytes(header + data[:4 * INPUT_DTYPE.itemsize])
+    started, chunks = tail.read()
+    assert started is not None
+    assert len(chunks[0]) == 2
+
+def test_video_tail_grows(tmp_path, video):
+    data = video.read_bytes()
+    path = tmp_path / "framedump0.avi"
+    tail = VideoTail(path)
+    assert tail.read() == 0
+    counts = []
+    for end in (len(data) // 3, 2 * len(data) // 3, len(data)):
+        with open(path, "ab") as f:
+            f.write(data[path.stat().st_size if path.exists() else 0:end])
+        counts.append(tail.read())
+        # nothing new written, so the same capture carries on
+        cap = tail.cap
+        assert tail.read() == counts[-1]
+        assert tail.cap is cap
+    assert counts == sorted(counts)
+    assert counts[-1] == FRAMES
+    tail.close()
+
+def test_simulate_reads_every_poll(tmp_path, video):
+    _, inputs = read_dtm(SAMPLE)
+    out = tmp_path / "out"
+    out.mkdir()
+    session = LiveSession(out / SAMPLE.name, out / video.name)
+    tail = session.dtm
+    # the whole movie in about a second and a half
+    writer = threading.Thread(target=simulate, args=(str(SAMPLE), str(video), str(out), 35.0, 0.02))
+    writer.start()
+    frames = 0
+    updates = 0
+    try:
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            update = session.poll()
+            if update is not None:
+                started, chunks, frames = update
+                if started is not None:
+                    tail.restart(started)
+                if chunks is not None:
+                    tail.append(chunks)
+                    updates += 1
+            if not writer.is_alive() and len(tail) == len(inputs) and frames == FRAMES:
+                break
+            time.sleep(0.05)
+    finally:
+        writer.join()
+        session.stop()
+    # it came in bit by bit, and nothing was missed or read twice
+    assert updates > 1
+    assert np.array_equal(tail.inputs, inputs)
+    assert frames == FRAMES
+    # the real header went in once the recording finished
+    assert DTMTail(out / SAMPLE.name).read()[0].vi_count == 2998
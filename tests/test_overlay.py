@@ -0,0 +1,128 @@
+import sys
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dtm import INPUT_DTYPE, NEUTRAL_INPUT, read_dtm
+from overlay import BUTTON_COLOURS, END_COLOURS, FADE_LEVELS, FADE_SECONDS, RenderPlan, blank_levels, blank_state, fade_polls
+from util import ease_out_expo, hex_to_rgb, rgb_to_hex
+
+# a rate where each fade level is two polls, so every even number of polls since a press
+# lands exactly on a level
+FADE_POLLS = 2 * (FADE_LEVELS - 1)
+POLLS_PER_SECOND = FADE_POLLS / FADE_SECONDS
+
+def baseline_fill(start: str, end: str, t: float) -> str:
+    # how the original draw_inputs worked out a colour part way through a fade
+    return rgb_to_hex(tuple(
+        int(s + (e - s) * ease_out_expo(t)) for s, e in zip(hex_to_rgb(start), hex_to_rgb(end))
+    ))
+
+def baseline_state(poll, seconds_since_press):
+    """
+    what the original canvas drawing showed for a poll, with how long ago each button was
+    last pressed (None if never)
+    """
+    main = (round(10 * (int(poll["main_x"]) - 128) / 128), -round(10 * (int(poll["main_y"]) - 128) / 128))
+    c = (round(10 * (int(poll["c_x"]) - 128) / 128), -round(10 * (int(poll["c_y"]) - 128) / 128))
+    fills = []
+    for i, since in enumerate(seconds_since_press):
+        if since is None or since > FADE_SECONDS:
+            # the item keeps its end colour once the fade is over
+            fills.append(END_COLOURS[i])
+        else:
+            fills.append(baseline_fill(BUTTON_COLOURS[i], END_COLOURS[i], since / FADE_SECONDS))
+    # the triggers fade in from the end colour as they're pressed harder
+    l = baseline_fill(BUTTON_COLOURS[0], END_COLOURS[0], 1.0 - ease_out_expo(int(poll["l"]) / 255))
+    r = baseline_fill(BUTTON_COLOURS[0], END_COLOURS[0], 1.0 - ease_out_expo(int(poll["r"]) / 255))
+    return main, c, fills, l, r
+
+def make_inputs(n: int) -> np.ndarray:
+    inputs = np.full(n, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+    # A tapped on poll 10, B held from 20 to 30
+    inputs["buttons"][10] |= 1 << 1
+    inputs["buttons"][20:31] |= 1 << 2
+    # main stick pushed up and right, c stick left
+    inputs["main_x"][10] = 255
+    inputs["main_y"][10] = 255
+    inputs["c_x"][10] = 0
+    # a half pressed L and fully pressed R
+    inputs["l"][40] = 128
+    inputs["r"][40] = 255
+    return inputs
+
+def seconds_since_press(inputs: np.ndarray, poll: int):
+    since = []
+    for i in range(len(BUTTON_COLOURS)):
+        pressed = np.flatnonzero(inputs["buttons"][:poll + 1] >> i & 1)
+        since.append((poll - pressed[-1]) / POLLS_PER_SECOND if len(pressed) else None)
+    return since
+
+def assert_same_colour(a: str, b: str):
+    # the two can differ by one from rounding the fade's time
+    assert max(abs(x - y) for x, y in zip(hex_to_rgb(a), hex_to_rgb(b))) <= 1, (a, b)
+
+def test_matches_baseline_drawing():
+    inputs = make_inputs(200)
+    plan = RenderPlan(inputs, POLLS_PER_SECOND)
+    assert len(plan) == len(inputs)
+    # idle, the presses, part way through each fade, and after everything has faded out
+    for poll in [0, 10, 12, 20, 26, 30, 32, 40, 10 + FADE_POLLS, 30 + FADE_POLLS, 199]:
+        main, c, fills, l, r = plan.state(poll)
+        base_main, base_c, base_fills, base_l, base_r = baseline_state(inputs[poll], seconds_since_press(inputs, poll))
+        assert main == base_main
+        assert c == base_c
+        if poll != 40:
+            # quantizing the triggers is exact at fully released and fully pressed
+            assert l == base_l
+            assert r == base_r
+        for fill, base_fill in zip(fills, base_fills):
+            assert_same_colour(fill, base_fill)
+
+def test_known_levels():
+    inputs = make_inputs(200)
+    plan = RenderPlan(inputs, POLLS_PER_SECOND)
+    main, c, buttons, l, r = plan.levels(10)
+    assert main == (10, -10)
+    assert c == (-10, 0)
+    # A was just pressed, everything else has never been pressed
+    assert buttons[1] == 0
+    assert all(level == FADE_LEVELS - 1 for i, level in enumerate(buttons) if i != 1)
+    # B is held, so stays at the start of its fade until it's let go
+    assert plan.levels(30)[2][2] == 0
+    assert plan.levels(32)[2][2] == 1
+    assert plan.levels(30 + FADE_POLLS)[2][2] == FADE_LEVELS - 1
+    # L at half is part way, R at full is the last level
+    _, _, _, l, r = plan.levels(40)
+    assert l == 128 * (FADE_LEVELS - 1) // 255
+    assert r == FADE_LEVELS - 1
+
+def test_blank():
+    plan = RenderPlan(np.full(1, NEUTRAL_INPUT, dtype=INPUT_DTYPE), POLLS_PER_SECOND)
+    assert plan.levels(0) == blank_levels()
+    assert plan.state(0) == blank_state()
+
+def test_extended_plan_matches_whole():
+    # planned a few polls at a time, the way a live recording is
+    header, inputs = read_dtm(ROOT / "sample" / "pikmin.dtm")
+    whole = RenderPlan(inputs, header.polls_per_second)
+    plan = RenderPlan(inputs[:1], header.polls_per_second)
+    for start in range(1, len(inputs), 97):
+        plan.extend(inputs[start:start + 97])
+    assert len(plan) == len(whole)
+    for poll in range(0, len(inputs), 7):
+        assert plan.levels(poll) == whole.levels(poll)
+
+def test_partial_plan_matches_whole():
+    # a plan over part of the movie, from a fade's length before it, draws it the same
+    header, inputs = read_dtm(ROOT / "sample" / "pikmin.dtm")
+    polls_per_second = header.polls_per_second
+    whole = RenderPlan(inputs, polls_per_second)
+    fade = fade_polls(polls_per_second)
+    for start, end in [(0, 500), (1000, 1600), (5900, len(inputs))]:
+        first = max(0, start - fade)
+        part = RenderPlan(inputs[first:end], polls_per_second)
+        for poll in range(start, end):
+            assert part.levels(poll - first) == whole.levels(poll)
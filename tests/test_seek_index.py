@@ -0,0 +1,77 @@
+import sys
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from seek_index import SeekIndex, index_path
+
+def make_index() -> SeekIndex:
+    return SeekIndex(np.array([0, 30, 60], dtype=np.int64), np.arange(90) / 30)
+
+def test_keyframe_before():
+    index = make_index()
+    assert index.keyframe_before(0) == 0
+    assert index.keyframe_before(29) == 0
+    assert index.keyframe_before(30) == 30
+    assert index.keyframe_before(59) == 30
+    assert index.keyframe_before(1000) == 60
+
+def test_save_and_load(tmp_path):
+    video = tmp_path / "framedump0.avi"
+    video.write_bytes(bytes(1000))
+    path = index_path(video)
+    make_index().save(path, video)
+    # only the index itself is left in the folder, the temporary file was moved into place
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["framedump0.avi", path.name]
+
+    index = SeekIndex.load(path, video)
+    assert np.array_equal(index.keyframes, [0, 30, 60])
+    assert len(index) == 90
+
+def test_load_out_of_date(tmp_path):
+    video = tmp_path / "framedump0.avi"
+    video.write_bytes(bytes(1000))
+    path = index_path(video)
+    make_index().save(path, video)
+    # a video that's been rewritten since the index was saved needs a new one
+    video.write_bytes(bytes(2000))
+    assert SeekIndex.load(path, video) is None
+    assert SeekIndex.load(tmp_path / "missing.npz", video) is None
+
+def test_save_replaces_old_index(tmp_path):
+    video = tmp_path / "framedump0.avi"
+    video.write_bytes(bytes(1000))
+    path = index_path(video)
+    path.write_bytes(b"not an index")
+    make_index().save(path, video)
+    assert SeekIndex.load(path, video) is not None
+
+def test_for_video_builds_once(tmp_path, monkeypatch):
+    video = tmp_path / "framedump0.avi"
+    video.write_bytes(bytes(1000))
+    builds = []
+
+    def build(video_path):
+        builds.append(video_path)
+        # long enough for the other threads to be waiting on it
+        time.sleep(0.05)
+        return make_index()
+
+    monkeypatch.setattr(SeekIndex, "build", staticmethod(build))
+    results = [None] * 4
+
+    def run(i):
+        results[i] = SeekIndex.for_video(video)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the first thread builds and saves it, the rest load what it saved
+    assert len(builds) == 1
+    assert all(index is not None and len(index) == 90 for index in results)
@@ -0,0 +1,99 @@
+import sys
+from pathlib import Path
+import numpy as np
+import customtkinter as ctk
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dtm import INPUT_DTYPE, NEUTRAL_INPUT
+from timeline import ACTIVITY_KEYS, activity_bands, band_pixels, band_pyramid, extend_pyramid, theme_colour
+
+def random_bands(frames: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((len(ACTIVITY_KEYS), frames)) < 0.05
+
+def test_band_pyramid_levels():
+    bands = random_bands(1001)
+    pyramid = band_pyramid(bands)
+    # each level halves the width, rounding up, down to one column
+    widths = [level.shape[1] for level in pyramid]
+    assert widths[0] == 1001
+    assert widths[-1] == 1
+    assert all(b == (a + 1) // 2 for a, b in zip(widths, widths[1:]))
+    # a column is active if any frame it covers is
+    for level, columns in enumerate(pyramid):
+        scale = 2 ** level
+        for column in range(columns.shape[1]):
+            covered = bands[:, column * scale:(column + 1) * scale]
+            assert np.array_equal(columns[:, column], covered.any(axis=1))
+
+def test_band_pyramid_single_frame():
+    bands = np.ones((len(ACTIVITY_KEYS), 1), dtype=bool)
+    assert len(band_pyramid(bands)) == 1
+
+def test_extend_pyramid_matches_rebuild():
+    bands = random_bands(1500, seed=2)
+    # grown a little at a time, from odd and even frames, and redone from part way back
+    for old, start in [(1000, 1000), (999, 999), (1000, 995), (1, 1), (2, 1), (1024, 1024), (1499, 1200)]:
+        pyramid = extend_pyramid(band_pyramid(bands[:, :old]), bands[:, start:], start)
+        expected = band_pyramid(bands)
+        assert len(pyramid) == len(expected)
+        for level, expected_level in zip(pyramid, expected):
+            assert np.array_equal(level, expected_level)
+
+def test_extend_pyramid_in_steps():
+    bands = random_bands(700, seed=3)
+    pyramid = band_pyramid(bands[:, :1])
+    for end in range(8, 700, 37):
+        # the last frame before the new ones can change too
+        start = pyramid[0].shape[1] - 1
+        pyramid = extend_pyramid(pyramid, bands[:, start:end], start)
+    pyramid = extend_pyramid(pyramid, bands[:, pyramid[0].shape[1]:], pyramid[0].shape[1])
+    for level, expected_level in zip(pyramid, band_pyramid(bands)):
+        assert np.array_equal(level, expected_level)
+
+def test_extend_empty_pyramid():
+    bands = random_bands(10)
+    assert all(np.array_equal(a, b) for a, b in zip(extend_pyramid([], bands, 0), band_pyramid(bands)))
+
+def test_band_pixels_matches_frames():
+    bands = random_bands(5000, seed=1)
+    pyramid = band_pyramid(bands)
+    # zoomed all the way out, part way in and in past a frame per pixel
+    for view_start, view_frames, width in [(0, 5000, 300), (1234.5, 800, 200), (4000, 50, 400)]:
+        pixels = band_pixels(pyramid, view_start, view_frames, width)
+        assert pixels.shape == (len(ACTIVITY_KEYS), width)
+        per_pixel = view_frames / width
+        for x in range(width):
+            first = int((view_start + x * per_pixel))
+            end = max(int(np.ceil(view_start + (x + 1) * per_pixel)), first + 1)
+            if per_pixel >= 2:
+                # a coarser level can take in a few frames either side, but never misses any
+                assert np.all(pixels[:, x] >= bands[:, first:end].any(axis=1))
+            else:
+                assert np.array_equal(pixels[:, x], bands[:, first:end].any(axis=1))
+
+def test_band_pixels_past_the_end():
+    pyramid = band_pyramid(np.ones((len(ACTIVITY_KEYS), 10), dtype=bool))
+    pixels = band_pixels(pyramid, 0, 20, 20)
+    assert pixels[:, :10].all()
+    assert not pixels[:, 10:].any()
+
+def test_activity_bands():
+    inputs = np.full(16, NEUTRAL_INPUT, dtype=INPUT_DTYPE)
+    inputs["buttons"][1] = 1
+    inputs["main_x"][9] = 255
+    inputs["r"][15] = 255
+    # 4 polls a frame, and a frame past the end of the inputs
+    bands = activity_bands(inputs, np.arange(5) * 4)
+    assert bands.shape == (len(ACTIVITY_KEYS), 5)
+    assert bands[0].tolist() == [True, False, False, False, False]
+    assert bands[1].tolist() == [False, False, True, False, False]
+    assert not bands[2].any()
+    assert bands[3].tolist() == [False, False, False, True, False]
+
+def test_theme_colours():
+    ctk.ThemeManager.load_theme(str(ROOT / "themes" / "lavender.json"))
+    for key in ["fg_color", "tick_color", "playhead_color"] + ACTIVITY_KEYS:
+        light, dark = theme_colour(key, 0), theme_colour(key, 1)
+        assert light.startswith("#") and dark.startswith("#")
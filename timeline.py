@@ -0,0 +1,374 @@
+import numpy as np
+import customtkinter as ctk
+from PIL import Image, ImageTk
+from analytics import BUTTON_MASK, STICK_MOVED, TRIGGER_PRESSED, columns, runs
+from util import hex_to_rgb
+
+############
+# Timeline #
+############
+# the seek bar. only the range of frames that's in view is drawn, and it's redrawn at most
+# once per display refresh no matter how often the position changes, so it costs the same
+# for a 100 frame clip as for a dump with millions of frames.
+# input activity is drawn from a pyramid of images made once when it's set: each level is
+# half the width of the one before, with a frame column marked if anything in the frames
+# it covers was active. drawing picks the smallest level that still has a column per pixel.
+# colours come from the "Timeline" section of the theme, as (light, dark) pairs
+
+REFRESH_HZ = 60         # redraws per second at most
+HEIGHT = 40
+BAND_TOP = 14           # activity bands go between here and the bottom
+MAX_FRAME_PX = 16       # zoomed all the way in a frame is this wide
+ZOOM_STEP = 1.25
+TICK_SPACING = 80       # rough pixels between ticks
+# theme keys of the activity rows: buttons, main stick, c stick, triggers
+ACTIVITY_KEYS = ["button_color", "main_stick_color", "c_stick_color", "trigger_color"]
+
+def activity_bands(inputs: np.ndarray, frame_polls: np.ndarray, offset: int = 0) -> np.ndarray:
+    """
+    (rows, frames) bool array of which inputs are active on each frame, a frame counts as
+    active if any of its polls are. frame_polls is the poll shown on each movie frame and
+    offset is the video frame the movie starts on
+    """
+    frames = len(frame_polls)
+    if len(inputs) == 0 or frames == 0:
+        return np.zeros((len(ACTIVITY_KEYS), frames), dtype=bool)
+    buttons, triggers, main, c = columns(inputs)
+    rows = np.stack((
+        (buttons & BUTTON_MASK) != 0,
+        STICK_MOVED[main],
+        STICK_MOVED[c],
+        TRIGGER_PRESSED[triggers],
+    ))
+    # the frames after the DTM ends stay empty
+    starts = np.asarray(frame_polls, dtype=np.intp)
+    covered = int(np.searchsorted(starts, len(inputs)))
+    bands = np.zeros((len(ACTIVITY_KEYS), frames), dtype=bool)
+    if covered > 0:
+        bands[:, :covered] = np.logical_or.reduceat(rows, starts[:covered], axis=1)
+    # the video frames before the movie starts stay empty
+    if offset > 0:
+        return np.concatenate((np.zeros((len(ACTIVITY_COLOURS), offset), dtype=bool), bands), axis=1)
+    return bands[:, -offset:]
+
+def band_pyramid(bands: np.ndarray) -> list[np.ndarray]:
+    """
+    bands, then bands halved in width again and again down to a single column
+    """
+    levels = [bands]
+    while levels[-1].shape[1] > 1:
+        level = levels[-1]
+        if level.shape[1] % 2:
+            level = np.concatenate((level, level[:, -1:]), axis=1)
+        levels.append(level[:, 0::2] | level[:, 1::2])
+    return levels
+
+def extend_pyramid(pyramid: list[np.ndarray], bands: np.ndarray, start: int) -> list[np.ndarray]:
+    """
+    the pyramid with its frames from start on replaced by bands, only the columns each
+    level has over those frames are worked out again
+    """
+    if not pyramid or start <= 0:
+        return band_pyramid(bands)
+    levels = [np.concatenate((pyramid[0][:, :start], bands), axis=1)]
+    while levels[-1].shape[1] > 1:
+        level = levels[-1]
+        # the first column of the next level that covers a changed frame
+        start //= 2
+        tail = level[:, 2 * start:]
+        if tail.shape[1] % 2:
+            tail = np.concatenate((tail, tail[:, -1:]), axis=1)
+        old = pyramid[len(levels)][:, :start] if len(levels) < len(pyramid) else level[:, :0]
+        levels.append(np.concatenate((old, tail[:, 0::2] | tail[:, 1::2]), axis=1))
+    return levels
+
+def band_pixels(pyramid: list[np.ndarray], view_start: float, view_frames: float, width: int) -> np.ndarray:
+    """
+    (rows, width) bool array of the activity under each pixel of a view, a pixel is active
+    if any frame under it is
+    """
+    # the smallest level with at least a column per pixel
+    per_pixel = view_frames / width
+    level = 0
+    while level + 1 < len(pyramid) and 2 ** (level + 1) <= per_pixel:
+        level += 1
+    bands = pyramid[level]
+    scale = 2 ** level
+    frame_edges = view_start + np.arange(width + 1) * per_pixel
+    # the column under each pixel's left edge, and the one after its right edge
+    firsts = (frame_edges[:-1] // scale).astype(np.int64)
+    ends = np.maximum(np.ceil(frame_edges[1:] / scale).astype(np.int64), firsts + 1)
+    pixels = np.zeros((len(bands), width), dtype=bool)
+    inside = firsts < bands.shape[1]
+    if not inside.any():
+        return pixels
+    firsts, ends = firsts[inside], np.minimum(ends[inside], bands.shape[1])
+    # or over each pixel's columns, as a difference of running counts over just the
+    # visible columns so it's one pass over them
+    lo = firsts[0]
+    visible = bands[:, lo:ends[-1]]
+    counts = np.zeros((len(bands), visible.shape[1] + 1), dtype=np.int64)
+    np.cumsum(visible, axis=1, out=counts[:, 1:])
+    pixels[:, inside] = counts[:, ends - lo] > counts[:, firsts - lo]
+    return pixels
+
+def theme_colour(key: str, mode: int) -> str:
+    """
+    a colour from the theme's Timeline section for an appearance mode, 0 is light and 1 dark
+    """
+    colour = ctk.ThemeManager.theme["Timeline"][key]
+    return colour[mode] if isinstance(colour, (list, tuple)) else colour
+
+class Timeline(ctk.CTkCanvas):
+    def __init__(self, app):
+        super().__init__(app, height=HEIGHT, highlightthickness=0)
+        self.command    = None      # called with the frame index when the user seeks
+        self.total      = 0         # number of frames
+        self.position   = 0         # the frame under the playhead
+        self.view_start = 0.0       # first frame in view, can be fractional when zoomed in
+        self.view_frames = 1.0      # how many frames are in view
+        self.pyramid    = []        # activity bands at every level of detail
+        self.markers    = dict()    # group -> (sorted frame indices, colour)
+        self.ranges     = dict()    # group -> ((n, 2) sorted [start, end) frames, colour)
+        self.band_photo = None
+        self.band_key   = None      # the view the band image was drawn for
+        self.redraw_job = None
+        self.refresh_ms = 1000 // REFRESH_HZ
+        self.tick_ids   = []        # (line, label) canvas items, reused as the view changes
+        self.activity_colours = []  # rgb of each activity row
+
+        self.band_id     = self.create_image(0, BAND_TOP, anchor="nw")
+        self.playhead_id = self.create_line(0, 0, 0, HEIGHT, width=2)
+        self._set_appearance_mode(ctk.AppearanceModeTracker.get_mode())
+        ctk.AppearanceModeTracker.add(self._set_appearance_mode, self)
+
+        self.bind("<Configure>", lambda e: self.request_redraw())
+        self.bind("<Button-1>", self._on_drag)
+        self.bind("<B1-Motion>", self._on_drag)
+        # mouse wheel zooms around the cursor, shift scrolls
+        self.bind("<MouseWheel>", lambda e: self._on_wheel(e, 1 if e.delta > 0 else -1))
+        self.bind("<Shift-MouseWheel>", lambda e: self._on_scroll(1 if e.delta > 0 else -1))
+        self.bind("<Button-4>", lambda e: self._on_wheel(e, 1))
+        self.bind("<Button-5>", lambda e: self._on_wheel(e, -1))
+        self.bind("<Shift-Button-4>", lambda e: self._on_scroll(1))
+        self.bind("<Shift-Button-5>", lambda e: self._on_scroll(-1))
+
+    def set_range(self, total: int, command = None):
+        """
+        resets the timeline for a video of total frames, zoomed all the way out
+        """
+        self.total = max(1, total)
+        self.command = command
+        self.position = 0
+        self.view_start = 0.0
+        self.view_frames = float(self.total)
+        self.band_key = None
+        self.request_redraw()
+
+    def extend_range(self, total: int):
+        """
+        grows the timeline to total frames without moving the view, for videos that are
+        still being recorded. zoomed all the way out it stays that way
+        """
+        total = max(1, total)
+        if total == self.total:
+            return
+        if self.view_frames >= self.total:
+            self.view_frames = float(total)
+        self.total = total
+        self.band_key = None
+        self.request_redraw()
+
+    def set(self, frame_index):
+        frame_index = int(frame_index)
+        if frame_index == self.position:
+            return
+        self.position = frame_index
+        # follow the playhead a page at a time when it leaves the view
+        if not self.view_start <= frame_index < self.view_start + self.view_frames:
+            self._set_view(frame_index - self.view_frames * 0.1, self.view_frames)
+        self.request_redraw()
+
+    def get(self) -> int:
+        return self.position
+
+    def set_activity(self, bands: np.ndarray):
+        self.pyramid = band_pyramid(bands) if bands is not None and bands.size else []
+        self.band_key = None
+        self.request_redraw()
+
+    def extend_activity(self, bands: np.ndarray, start: int):
+        """
+        replaces the activity from frame start on with bands, for recordings that are growing
+        """
+        if bands is None or bands.size == 0:
+            return
+        self.pyramid = extend_pyramid(self.pyramid, bands, start)
+        self.band_key = None
+        self.request_redraw()
+
+    def set_markers(self, group: str, frames, colour: str):
+        """
+        replaces a group of markers, e.g. search results
+        """
+        self.markers[group] = (np.unique(np.asarray(frames, dtype=np.int64)), colour)
+        self.request_redraw()
+
+    def set_ranges(self, group: str, ranges, colour: str):
+        """
+        replaces a group of [start, end) frame ranges, e.g. where two movies differ
+        """
+        ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        self.ranges[group] = (ranges[np.argsort(ranges[:, 0], kind="stable")], colour)
+        self.request_redraw()
+
+    def clear_markers(self, group: str):
+        # markers and ranges
+        removed = self.markers.pop(group, None) is not None
+        removed |= self.ranges.pop(group, None) is not None
+        if removed:
+            self.request_redraw()
+
+    def request_redraw(self):
+        if self.redraw_job is None:
+            self.redraw_job = self.after(self.refresh_ms, self._redraw)
+
+    def destroy(self):
+        ctk.AppearanceModeTracker.remove(self._set_appearance_mode)
+        super().destroy()
+
+    def _set_appearance_mode(self, mode):
+        # called with "Light" or "Dark" when the appearance mode changes
+        if isinstance(mode, str):
+            mode = 1 if mode.lower() == "dark" else 0
+        self.tick_colour = theme_colour("tick_color", mode)
+        self.activity_colours = [hex_to_rgb(theme_colour(key, mode)) for key in ACTIVITY_KEYS]
+        self.configure(bg=theme_colour("fg_color", mode))
+        self.itemconfigure(self.playhead_id, fill=theme_colour("playhead_color", mode))
+        for line_id, label_id in self.tick_ids:
+            self.itemconfigure(line_id, fill=self.tick_colour)
+            self.itemconfigure(label_id, fill=self.tick_colour)
+        self.band_key = None
+        self.request_redraw()
+
+    # view #
+
+    def _frame_px(self) -> float:
+        return max(1, self.winfo_width()) / self.view_frames
+
+    def _x_of(self, frame_index: float) -> float:
+        return (frame_index - self.view_start) * self._frame_px()
+
+    def _frame_at(self, x: float) -> int:
+        return int(self.view_start + x / self._frame_px())
+
+    def _set_view(self, start: float, frames: float):
+        min_frames = min(self.total, max(1.0, self.winfo_width() / MAX_FRAME_PX))
+        frames = max(min_frames, min(float(self.total), frames))
+        self.view_frames = frames
+        self.view_start = max(0.0, min(start, self.total - frames))
+
+    def _on_wheel(self, event, direction: int):
+        # keep the frame under the cursor where it is
+        anchor = self.view_start + event.x / self._frame_px()
+        frames = self.view_frames / ZOOM_STEP if direction > 0 else self.view_frames * ZOOM_STEP
+        self._set_view(anchor - event.x / max(1, self.winfo_width()) * frames, frames)
+        self.request_redraw()
+
+    def _on_scroll(self, direction: int):
+        self._set_view(self.view_start - direction * self.view_frames * 0.1, self.view_frames)
+        self.request_redraw()
+
+    def _on_drag(self, event):
+        frame_index = max(0, min(self._frame_at(event.x), self.total - 1))
+        self.set(frame_index)
+        if self.command: self.command(frame_index)
+
+    # drawing #
+
+    def _redraw(self):
+        self.redraw_job = None
+        width = self.winfo_width()
+        if width <= 1 or self.total <= 0:
+            return
+        view = (round(self.view_start, 3), round(self.view_frames, 3), width)
+        # everything but the playhead only changes with the view
+        if view != self.band_key:
+            self.band_key = view
+            self._draw_ticks(width)
+            self._draw_bands(width)
+            self._draw_markers(width)
+        x = self._x_of(self.position + 0.5)
+        self.coords(self.playhead_id, x, 0, x, HEIGHT)
+        self.tag_raise(self.playhead_id)
+
+    def _visible(self) -> tuple[int, int]:
+        first = int(self.view_start)
+        last = min(self.total, int(self.view_start + self.view_frames) + 1)
+        return first, last
+
+    def _draw_ticks(self, width: int):
+        # a round number of frames between ticks, about TICK_SPACING pixels apart
+        spacing = TICK_SPACING / self._frame_px()
+        step = 1
+        while step < spacing:
+            for multiple in (2, 5, 10):
+                if step * multiple >= spacing:
+                    step *= multiple
+                    break
+            else:
+                step *= 10
+        first, last = self._visible()
+        ticks = range(first - first % step, last, step)
+        # move the items from the last draw into place, only making more when there are
+        # more ticks in view than ever before
+        while len(self.tick_ids) < len(ticks):
+            self.tick_ids.append((
+                self.create_line(0, 0, 0, BAND_TOP - 4, fill=self.tick_colour),
+                self.create_text(0, 0, anchor="nw", fill=self.tick_colour, font=("TkDefaultFont", 7))
+            ))
+        for (line_id, label_id), frame_index in zip(self.tick_ids, ticks):
+            x = self._x_of(frame_index)
+            self.coords(line_id, x, 0, x, BAND_TOP - 4)
+            self.coords(label_id, x + 2, 0)
+            self.itemconfigure(line_id, state="normal")
+            self.itemconfigure(label_id, text=str(frame_index), state="normal")
+        for line_id, label_id in self.tick_ids[len(ticks):]:
+            self.itemconfigure(line_id, state="hidden")
+            self.itemconfigure(label_id, state="hidden")
+
+    def _draw_bands(self, width: int):
+        if not self.pyramid:
+            self.itemconfigure(self.band_id, image="")
+            self.band_photo = None
+            return
+        pixels = band_pixels(self.pyramid, self.view_start, self.view_frames, width)
+        rows = len(pixels)
+        row_h = max(1, (HEIGHT - BAND_TOP) // rows)
+        image = np.zeros((row_h * rows, width, 4), dtype=np.uint8)
+        for i, colour in enumerate(self.activity_colours[:rows]):
+            image[i * row_h:(i + 1) * row_h - 1, pixels[i]] = (*colour, 255)
+        self.band_photo = ImageTk.PhotoImage(Image.fromarray(image, "RGBA"))
+        self.itemconfigure(self.band_id, image=self.band_photo)
+
+    def _draw_markers(self, width: int):
+        self.delete("marker")
+        first, last = self._visible()
+        for ranges, colour in self.ranges.values():
+            # ranges that overlap the view, as pixel spans
+            visible = ranges[(ranges[:, 1] > first) & (ranges[:, 0] < last)]
+            x0 = np.clip(((visible[:, 0] - self.view_start) * self._frame_px()).astype(np.int64), 0, width)
+            x1 = np.clip(np.ceil((visible[:, 1] - self.view_start) * self._frame_px()).astype(np.int64), 0, width)
+            # merged per pixel, so there's at most one rectangle per gap between them
+            covered = np.zeros(width + 1, dtype=np.int64)
+            np.add.at(covered, x0, 1)
+            np.add.at(covered, np.minimum(np.maximum(x1, x0 + 1), width), -1)
+            starts, lengths = runs(np.cumsum(covered)[:width] > 0)
+            for x, w in zip(starts.tolist(), lengths.tolist()):
+                self.create_rectangle(x, 0, x + w, HEIGHT, fill=colour, outline="", stipple="gray50", tags="marker")
+        for frames, colour in self.markers.values():
+            lo, hi = np.searchsorted(frames, (first, last))
+            # at most one marker per pixel
+            xs = np.unique(((frames[lo:hi] - self.view_start + 0.5) * self._frame_px()).astype(np.int64))
+            for x in xs.tolist():
+                self.create_line(x, 0, x, HEIGHT, fill=colour, tags="marker")
@@ -1,6 +1,5 @@
 # basic util functions
 from datetime import datetime
-import tkinter.messagebox as messagebox
 import platform
 
 def log(message: str, type: str = "LOG"):
@@ -12,6 +11,8 @@ def err(message: str):
     
 def err_popup(message: str):
     err(message)
+    # imported here so the headless tools don't need Tk
+    import tkinter.messagebox as messagebox
     messagebox.showerror("Error", message)
 
 def ease_out_expo(t):
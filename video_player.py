@@ -1,8 +1,18 @@
 import cv2
-from pathlib import Path
-from PIL import Image, ImageTk
+import queue
+from PIL import ImageTk
 import customtkinter as ctk
 import time
+import threading
+from frame_decoder import FrameDecoder, ReverseDecoder, prepare_frame, fit_rect, copy_buffer
+from frame_cache import FrameCache
+from seek_index import SeekIndex
+from proxy import pick_proxy
+from video_source import open_video, MultiFileSource
+from util import log
+
+# playback rates the player steps through, above 1x the frames in between aren't decoded
+RATES = [0.25, 0.5, 1, 2, 4, 8, 16]
 
 class VideoPlayer(ctk.CTkCanvas):
     def __init__(self, app, video_path = ""):
@@ -14,33 +24,87 @@ class VideoPlayer(ctk.CTkCanvas):
         self.on_frame_update = None     # a callback function for when the current frame changes
         self.playing         = False    # whether video is playing or not
         self.play_button     = None     # play / pause button
-        self.slider          = None     # slider for seeking
+        self.slider          = None     # timeline for seeking
         self.seek_job        = None     # handle for the debounced callback
         self.last_seek       = 0.0      # timestamp of the last actual seek
         self.min_seek_ms     = 180      # throttle
         self.debounce_ms     = 200      # debounce
+        self.cap             = None     # cv2 capture, owned by the decoder while it's running
+        self.cap_index       = 0        # the next frame the capture will read
+        self.decoder         = None     # background FrameDecoder, alive while playing / paused
+        self.buffer_depth    = 8        # how many frames the decoder may get ahead
+        self.frames_shown    = 0        # frames presented since play was pressed
+        self.buffer_underruns = 0       # times the buffer was empty when a frame was due
+        self.frames_dropped  = 0        # frames skipped to keep up with the media clock
+        self.frames_late     = 0        # frames shown after their due time
+        self.on_time_streak  = 0        # frames shown on time in a row, to leave fast mode
+        self.late_slack      = 0.25     # fraction of a frame a frame can be late by and still count as on time
+        self.view_size       = (1, 1)   # canvas size, kept up to date by <Configure>
+        self.frame_size      = None     # size of the video's frames
+        self.display_rect    = (0, 0, 1, 1) # where frames are drawn (x, y, w, h), only changes on resize
+        self.photo           = None     # the one PhotoImage every frame is pasted into
+        self.shown_buffer    = None     # decoder buffer currently on screen, released on the next frame
+        self.frame_job       = None     # handle for the next scheduled _next_frame
+        self.seek_index      = None     # keyframe table, built in the background per video
+        self.video_path      = ""
+        self.frame_cache     = FrameCache(256 * 1024 * 1024) # recently shown frames, for scrubbing
+        self.proxy_manager   = None     # ProxyManager to play smaller copies of the video from
+        self.proxy_height    = None     # height of the proxy the decoder reads, None for the original
+        self.proxy_cap       = None     # capture of that proxy
+        self.shown_from_proxy = False   # whether the frame on screen came from a proxy
+        self.still_job       = None     # handle for redrawing a paused proxy frame from the original
+        self.step_job        = None     # handle for checking if a stepped to frame has been decoded
+        self.step_target     = 0        # the frame being stepped to
+        self.step_deadline   = 0.0      # when to give up waiting for the decoder and seek instead
+        self.rate            = 1        # playback speed, one of RATES
+        self.direction       = 1        # 1 plays forwards, -1 plays backwards
+        self.reverse_buffer_bytes = 256 * 1024 * 1024 # memory the reverse decoder may buffer frames in
+        self.decoder_from_proxy = False # whether the decoder is reading a proxy
+        self.on_rate_change  = None     # a callback function for when the rate changes
+        self.live            = False    # the video is still being recorded, its end isn't the end
+        self.live_waiting    = False    # playback reached the end of a live video and wants more
+        self.bind("<Configure>", self._on_resize)
         if video_path: self.set_video(video_path)
-        
-    def set_video(self, video_path: str, slider = None, slider_row = 0, slider_col = 0, slider_pad = 0):
+
+    def set_video(self, video_path: str, slider = None, slider_row = 0, slider_col = 0, slider_pad = 0,
+                  live: bool = False):
         # Video setup
-        self.cap = cv2.VideoCapture(str(video_path))
+        self._cancel_step()
+        self._stop_decoder()
+        if self.still_job is not None:
+            self.after_cancel(self.still_job)
+            self.still_job = None
+        if self.cap: self.cap.release()
+        self._close_proxy()
+        self.cap = open_video(video_path)
+        self.cap_index = 0
+        self.video_path = str(video_path)
+        self.seek_index = None
+        self.frame_cache.clear()
+        self.live = live
+        self.live_waiting = False
+        # the seek index and proxies are made from a single file, split dumps seek
+        # within whichever part the frame is in instead. a live video isn't finished yet
+        if not isinstance(self.cap, MultiFileSource) and not live:
+            if self.proxy_manager: self.proxy_manager.request(self.video_path)
+            threading.Thread(target=self._load_seek_index, args=(self.video_path,), daemon=True).start()
         self.fps = self.cap.get(cv2.CAP_PROP_FPS)
         self.delay = int(1000 / self.fps)
         self.current_frame_index = 0
-        
+        self.frame_size = (
+            int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        )
+
         self.image_id = self.create_image(0, 0, anchor="nw")
-        self.photo = None  # keep reference
-        
+        self.photo = None
+        self._update_geometry()
+
         # Seek slider
         self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
         if slider:
             self.slider = slider
-            slider.configure(
-                from_=0,
-                to=self.total_frames,
-                number_of_steps=self.total_frames,
-                command=self.on_seek
-            )
+            slider.set_range(self.total_frames, command=self.on_seek)
             slider.grid(
                 row=slider_row,
                 column=slider_col,
@@ -50,39 +114,266 @@ class VideoPlayer(ctk.CTkCanvas):
             )
             slider.set(0)
             self.on_seek(0)
-        
+
+    def extend_video(self, total_frames: int):
+        """
+        picks up the frames recorded since a live video was opened. a running decoder just
+        carries on into them, playback that stopped at the end waits here for more
+        """
+        if not self.cap or total_frames <= self.total_frames:
+            return
+        self.total_frames = total_frames
+        if self.slider: self.slider.extend_range(total_frames)
+        if self.live_waiting:
+            self.live_waiting = False
+            # the capture ran into the end of the file as it was then
+            self._reopen_capture()
+            self.play()
+
+    def _reopen_capture(self):
+        # a capture doesn't see anything written after it reached the end of the file, so a
+        # live video's is opened again to read on from there
+        self.cap.release()
+        self.cap = open_video(self.video_path)
+        self.cap_index = 0
+
+    def _load_seek_index(self, video_path):
+        index = SeekIndex.for_video(video_path)
+        if index is None:
+            log("Seeks will be throttled without a seek index")
+        # only keep it if the same video is still loaded
+        if index is not None and video_path == self.video_path:
+            self.seek_index = index
+
+    def _seek_capture(self, frame_index):
+        # positions the capture so the next read() returns frame_index
+        if self.cap_index == frame_index:
+            return
+        # a real seek always decodes forward from the keyframe before the target, so if the
+        # capture is already past that keyframe it's cheaper to just carry on decoding
+        if self.seek_index is not None and \
+            self.seek_index.keyframe_before(frame_index) <= self.cap_index < frame_index:
+            while self.cap_index < frame_index and self.cap.grab():
+                self.cap_index += 1
+            return
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        self.cap_index = frame_index
+
+    def _on_resize(self, event):
+        size = (max(1, event.width), max(1, event.height))
+        if size == self.view_size:
+            return
+        self.view_size = size
+        self._update_geometry()
+        # redraw the paused frame at the new size
+        if self.cap and not self.playing:
+            self._cancel_step()
+            self._stop_decoder()
+            self._show_frame()
+        # carry on playing from whichever proxy suits the new size best
+        elif self.playing and self._wanted_proxy() != self.proxy_height:
+            self.pause()
+            self._stop_decoder()
+            self.play()
+
+    def _update_geometry(self):
+        # works out where frames go and makes a PhotoImage of that size to paste them into,
+        # so none of this has to happen per frame
+        if not self.frame_size or min(self.frame_size) <= 0:
+            return
+        rect = fit_rect(self.frame_size, self.view_size)
+        if rect == self.display_rect and self.photo:
+            return
+        x, y, w, h = rect
+        if (w, h) != self.display_rect[2:] or not self.photo:
+            self.photo = ImageTk.PhotoImage("RGBA", (w, h))
+            self.itemconfig(self.image_id, image=self.photo)
+            # cached frames were scaled for the old size
+            self.frame_cache.clear()
+            if self.decoder: self.decoder.size = (w, h)
+        self.coords(self.image_id, x, y)
+        self.display_rect = rect
+
+    def _wanted_proxy(self):
+        if not self.proxy_manager or not self.frame_size or isinstance(self.cap, MultiFileSource):
+            return None
+        proxies = self.proxy_manager.proxies(self.video_path)
+        return pick_proxy(proxies, self.display_rect[3], self.frame_size[1])
+
+    def _playback_capture(self):
+        # the capture playback should decode from, switching proxies if a better one exists
+        height = self._wanted_proxy()
+        if height != self.proxy_height:
+            self._close_proxy()
+            if height is not None:
+                path = self.proxy_manager.proxies(self.video_path)[height]
+                self.proxy_cap = cv2.VideoCapture(str(path))
+                self.proxy_height = height
+                log(f"Playing from {height}p proxy")
+            else:
+                log("Playing from the original video")
+        return self.proxy_cap if self.proxy_height is not None else self.cap
+
+    def _close_proxy(self):
+        if self.proxy_cap: self.proxy_cap.release()
+        self.proxy_cap = None
+        self.proxy_height = None
+
+    def _start_decoder(self, direction = None, step = None):
+        direction = direction or self.direction
+        size = self.display_rect[2:]
+        if direction < 0:
+            # the reverse decoder continues from the frame before the one being shown, on a
+            # capture of its own
+            start = self.current_frame_index - 1
+            height = self._wanted_proxy()
+            if height is not None:
+                path = self.proxy_manager.proxies(self.video_path)[height]
+                # proxies are all-intra, any span is as cheap to start decoding as a GOP
+                keyframe_before = None
+            else:
+                path = self.video_path
+                keyframe_before = self.seek_index.keyframe_before if self.seek_index is not None else None
+            self.decoder = ReverseDecoder(
+                lambda: open_video(path), start, size, self.reverse_buffer_bytes, keyframe_before
+            )
+            self.decoder_from_proxy = height is not None
+        else:
+            # the decoder continues from the frame after the one being shown
+            start = self.current_frame_index + 1
+            cap = self._playback_capture()
+            if cap is self.cap:
+                self._seek_capture(start)
+            else:
+                # every proxy frame is a keyframe, so seeking straight to it is exact and cheap
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            self.decoder = FrameDecoder(cap, start, size, self.buffer_depth)
+            self.decoder_from_proxy = cap is not self.cap
+        self.decoder.step = step or self.frame_step
+        self.decoder.start()
+
+    def _stop_decoder(self):
+        if not self.decoder:
+            return
+        self.decoder.stop()
+        if self.decoder.cap is self.cap:
+            self.cap_index = self.decoder.position
+        self.decoder = None
+        self.shown_buffer = None
+
+    @property
+    def frame_step(self) -> int:
+        # how many frames to advance per frame shown, faster rates show every nth frame
+        # instead of showing frames faster than the screen could
+        return max(1, int(self.rate))
+
+    def _frame_due_time(self, frame_index):
+        # when frame_index should be on screen, according to the media clock started by play()
+        return self.clock_start + (frame_index - self.clock_frame) * self.direction / (self.fps * self.rate)
+
+    def _start_clock(self):
+        # the next frame is due right now
+        self.clock_start = time.perf_counter()
+        self.clock_frame = self.current_frame_index + self.direction
+
+    def set_rate(self, rate):
+        self.rate = max(RATES[0], min(rate, RATES[-1]))
+        if self.decoder: self.decoder.step = self.frame_step
+        # restart the clock from here so the new rate doesn't jump playback
+        if self.playing: self._start_clock()
+        log(f"Playback rate: {self.rate}x")
+        if self.on_rate_change: self.on_rate_change(self.rate * self.direction)
+
+    def change_rate(self, steps: int):
+        # moves up or down the list of rates
+        i = RATES.index(self.rate) if self.rate in RATES else RATES.index(1)
+        self.set_rate(RATES[max(0, min(i + steps, len(RATES) - 1))])
+
     def _schedule_next(self):
-        now = time.perf_counter()
-        self.next_frame_time += 1.0 / self.fps  # time of next frame
-        delay_ms = max(0, (self.next_frame_time - now) * 1000)
-        self.after(int(delay_ms), self._next_frame)
-        
-    def play_pause(self):
+        # wait for the next frame's due time rather than adding 1/fps to when this one was
+        # shown, so slow frames don't push the rest of playback back
+        next_index = self.current_frame_index + self.frame_step * self.direction
+        delay = self._frame_due_time(next_index) - time.perf_counter()
+        self.frame_job = self.after(max(0, int(delay * 1000)), self._next_frame)
+
+    def _set_fast(self, fast: bool):
+        # cheaper scaling while we're behind, back to INTER_AREA once caught up
+        if self.decoder and self.decoder.fast != fast:
+            self.decoder.fast = fast
+            log(f"Playback {'fell behind, using fast scaling' if fast else 'caught up, using full quality scaling'}")
+
+    def play_pause(self, direction: int = 1):
+        # pauses, or plays in direction. switching direction while playing carries on playing
+        if self.playing and self.direction == direction:
+            self.pause()
+            return
         if self.playing:
             self.pause()
-        else:
-            self.play()
-        
+        if self.direction != direction:
+            self.direction = direction
+            if self.on_rate_change: self.on_rate_change(self.rate * self.direction)
+        self.play()
+
     def play(self):
+        # there's nothing before the first frame to play backwards to
+        if self.direction < 0 and self.current_frame_index <= 0:
+            return
+        self._cancel_step()
         self.playing = True
         if self.play_button:
             self.play_button.configure(text="Pause")
-        if self.current_frame_index >= self.total_frames:
-            self.current_frame_index = 0
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        
-        self.next_frame_time = time.perf_counter()
+        if self.direction > 0 and self.current_frame_index >= self.total_frames - 1 and not self.live:
+            self._stop_decoder()
+            self.current_frame_index = -1
+        # the buffered frames are going the wrong way
+        if self.decoder and self.decoder.direction != self.direction:
+            self._stop_decoder()
+        if not self.decoder:
+            self._start_decoder()
+
+        self.frames_shown = 0
+        self.buffer_underruns = 0
+        self.frames_dropped = 0
+        self.frames_late = 0
+        self.on_time_streak = 0
+        self.decoder.skipped = 0
+        self._start_clock()
         self._next_frame()
-    
+
     def pause(self):
+        if self.playing and self.frames_shown:
+            log(f"Frame buffer was empty for {self.buffer_underruns} of {self.frames_shown} frames " \
+                f"({100 * self.buffer_underruns / self.frames_shown:.1f}%)")
+            log(f"Frame cache: {self.frame_cache.stats()}")
+            skipped = self.decoder.skipped if self.decoder else 0
+            log(f"Dropped {self.frames_dropped + skipped} frames " \
+                f"({skipped} skipped with grab), {self.frames_late} shown late")
+            self._set_fast(False)
+        # keep a copy of the paused frame so stepping back to it is free, proxy frames aren't
+        # kept as the paused frame gets redrawn from the original
+        if self.playing and self.shown_buffer is not None and not self.shown_from_proxy:
+            self.frame_cache.put(self.current_frame_index, self.display_rect[2:], copy_buffer(self.shown_buffer))
+        if self.playing and self.shown_from_proxy:
+            self.still_job = self.after(self.debounce_ms, self._show_still)
         self.playing = False
+        if self.frame_job is not None:
+            self.after_cancel(self.frame_job)
+            self.frame_job = None
         if self.play_button: self.play_button.configure(text="Play")
-    
+
     def on_seek(self, value):
         # slider callback gives float; convert to int
         idx = int(float(value))
         now = time.perf_counter() * 1000  # ms
 
+        # indexed videos seek fast enough to keep up with the slider, so no throttle
+        if self.seek_index is not None:
+            if self.seek_job is not None:
+                self.after_cancel(self.seek_job)
+                self.seek_job = None
+            self._perform_seek(idx)
+            return
+
         # throttle; if enough time has passed since last seek then seek immediately
         if now - self.last_seek >= self.min_seek_ms:
             self._perform_seek(idx)
@@ -92,62 +383,197 @@ class VideoPlayer(ctk.CTkCanvas):
         if self.seek_job is not None:
             self.after_cancel(self.seek_job)
 
-        self.seek_job = self.after(self.debounce_ms, 
+        self.seek_job = self.after(self.debounce_ms,
                                 lambda: self._perform_seek(idx))
-    
-    def _perform_seek(self, frame_index):
+
+    def seek(self, frame_index: int):
+        """
+        seeks straight to a frame, for jumps rather than dragging the timeline
+        """
+        if not self.cap:
+            return
+        if self.seek_job is not None:
+            self.after_cancel(self.seek_job)
+            self.seek_job = None
+        self._perform_seek(frame_index)
+
+    def _perform_seek(self, frame_index, buffer = None, cache_checked: bool = False):
+        # buffer is the frame if the caller already has it, cache_checked means it already
+        # looked in the cache and missed
+        self._cancel_step()
         # Pause playback during seek
         was_playing = self.playing
         self.pause()
+        # buffered frames are from the old position, so the decoder has to go
+        self._stop_decoder()
 
         # Seek in the video
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        frame_index = max(0, min(frame_index, self.total_frames - 1))
         self.current_frame_index = frame_index
         if self.slider: self.slider.set(frame_index)
-        self._show_frame()
+        self._show_frame(buffer, cache_checked)
 
         # Restore playback if it was playing
         if was_playing:
             self.play()
-    
+
     def _next_frame(self):
+        self.frame_job = None
         if not self.playing:
             return
-        ret, frame = self.cap.read()
-        self.current_frame_index += 1
-        if not ret:
-            self.playing = False
-            if self.play_button: self.play_button.configure(text="Play")
-            return  # end of video
-        if self.slider: self.slider.set(self.current_frame_index)
-        self._show_frame(frame)
+        now = time.perf_counter()
+        # the frame the media clock says should be on screen right now
+        due = self.clock_frame + int((now - self.clock_start) * self.fps * self.rate) * self.direction
+        while True:
+            try:
+                item = self.decoder.get()
+            except queue.Empty:
+                # decoder has fallen behind, check back shortly rather than blocking the UI
+                self.buffer_underruns += 1
+                self.frame_job = self.after(2, self._next_frame)
+                return
+            if item is None:
+                if self.live and self.direction > 0:
+                    # the end of what's been recorded so far, extend_video carries on from here
+                    self.live_waiting = True
+                # end of video, the frame count from the container can be off so trust the decoder
+                elif self.direction > 0:
+                    self.total_frames = self.current_frame_index + 1
+                self.pause()
+                self._stop_decoder()
+                return
+            index, buffer = item
+            if (index - due) * self.direction >= 0:
+                break
+            # this frame's time has already passed, drop it and make the decoder skip ahead
+            self.frames_dropped += 1
+            self.decoder.release(buffer)
+            if self.direction > 0:
+                self.decoder.skip_to = max(self.decoder.skip_to, due + 1)
+            else:
+                self.decoder.skip_to = min(self.decoder.skip_to, due - 1)
+            self._set_fast(True)
+            self.on_time_streak = 0
+
+        if now > self._frame_due_time(index) + self.late_slack / self.fps:
+            self.frames_late += 1
+            self.on_time_streak = 0
+        else:
+            self.on_time_streak += 1
+            # a second of on time frames means we've caught up
+            if self.on_time_streak >= self.fps:
+                self._set_fast(False)
+
+        self.frames_shown += 1
+        self._present(index, buffer)
         self._schedule_next()
-        # self.after(self.delay, self._next_frame)
-    
-    def _show_frame(self, frame=None):
-        # If frame not provided, re‐grab current frame
-        if frame is None:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame_index)
+
+    def _present(self, index, buffer):
+        # shows a frame from the decoder
+        self.current_frame_index = index
+        if self.slider: self.slider.set(self.current_frame_index)
+        self.shown_from_proxy = self.decoder_from_proxy
+        self._show_buffer(buffer)
+        # the previous buffer has been copied into the photo, so the decoder can reuse it
+        if self.shown_buffer is not None:
+            self.decoder.release(self.shown_buffer)
+        self.shown_buffer = buffer
+
+    def step_frame(self, delta: int):
+        """
+        pauses and moves delta frames. single steps take the next frame from a decoder going
+        that way rather than seeking, so once the reverse decoder has decoded a GOP every
+        step back through it is free. the decoder is polled from the Tk loop so the UI keeps
+        going while it decodes
+        """
+        if not self.cap:
+            return
+        if self.playing:
+            self.pause()
+        # steps pressed while one is waiting on the decoder carry on from where it's going
+        current = self.step_target if self.step_job is not None else self.current_frame_index
+        self._cancel_step()
+        target = current + delta
+        if target < 0:
+            return
+        buffer = self.frame_cache.get(target, self.display_rect[2:])
+        if abs(delta) == 1 and buffer is None:
+            if not self.decoder or self.decoder.direction != delta or self.decoder.step != 1:
+                self._stop_decoder()
+                self._start_decoder(direction=delta, step=1)
+            self.step_target = target
+            # forwards it's at most a frame away, backwards it may have to decode a GOP first
+            self.step_deadline = time.perf_counter() + (0.5 if delta > 0 else 2)
+            self._await_step()
+            return
+        self._perform_seek(target, buffer, cache_checked=True)
+
+    def _await_step(self):
+        # takes frames from the decoder until the one being stepped to turns up
+        self.step_job = None
+        target = self.step_target
+        direction = self.decoder.direction
+        while True:
+            try:
+                item = self.decoder.frames.get_nowait()
+            except queue.Empty:
+                if time.perf_counter() < self.step_deadline:
+                    self.step_job = self.after(2, self._await_step)
+                    return
+                item = None
+            if item is None:
+                break
+            index, buffer = item
+            if index == target:
+                self._present(index, buffer)
+                if self.shown_from_proxy:
+                    self.still_job = self.after(self.debounce_ms, self._show_still)
+                return
+            self.decoder.release(buffer)
+            # frames on the way to the target are skipped, past it the decoder's somewhere else
+            if (target - index) * direction < 0:
+                break
+        if target >= self.total_frames:
+            return
+        self._perform_seek(target, cache_checked=True)
+
+    def _cancel_step(self):
+        if self.step_job is not None:
+            self.after_cancel(self.step_job)
+            self.step_job = None
+
+    def _show_still(self):
+        # a paused frame from a proxy gets redrawn from the original at full quality,
+        # unless something else has been drawn since
+        self.still_job = None
+        if not self.playing and self.shown_from_proxy:
+            self._show_frame()
+
+    def _show_frame(self, buffer = None, cache_checked: bool = False):
+        # shows the current frame from the cache, or decodes it on the Tk thread if it's not
+        # there. only used when seeking, always from the original video
+        self.shown_from_proxy = False
+        size = self.display_rect[2:]
+        if buffer is None and not cache_checked:
+            buffer = self.frame_cache.get(self.current_frame_index, size)
+        if buffer is None:
+            self._seek_capture(self.current_frame_index)
             ret, frame = self.cap.read()
+            if not ret and self.live:
+                # the frame was recorded after the capture got to the end
+                self._reopen_capture()
+                self._seek_capture(self.current_frame_index)
+                ret, frame = self.cap.read()
+            self.cap_index = self.current_frame_index + 1
             if not ret:
                 return
-        
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        cw, ch = self.winfo_width(), self.winfo_height()
-        h, w = frame.shape[:2]
-        scale = min(cw/w, ch/h)
-        new_w, new_h = int(w*scale), int(h*scale)
-        nw, nh = int(w*scale), int(h*scale)
-        frame = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_AREA)
-        img = Image.fromarray(frame)
-        
-        # Center
-        x = (cw - new_w)//2
-        y = (ch - new_h)//2
-        
-        self.photo = ImageTk.PhotoImage(img)
-        self.itemconfig(self.image_id, image=self.photo)
-        self.coords(self.image_id, x, y)
-        
+            buffer = prepare_frame(frame, size)
+            self.frame_cache.put(self.current_frame_index, size, buffer)
+        self._show_buffer(buffer)
+
+    def _show_buffer(self, buffer):
+        # frames decoded before a resize are the wrong size, skip drawing them
+        if self.photo and buffer[1].size == (self.photo.width(), self.photo.height()):
+            self.photo.paste(buffer[1])
+
         if self.on_frame_update: self.on_frame_update(self.current_frame_index)
-        
\ No newline at end of file
@@ -0,0 +1,150 @@
+import re
+from collections import OrderedDict
+from pathlib import Path
+import cv2
+import numpy as np
+from util import log
+
+#################
+# Video sources #
+#################
+# Dolphin splits long frame dumps into framedump0.avi, framedump1.avi, ... this plays
+# the parts back to back as one video without joining them on disk. it looks just like a
+# cv2.VideoCapture to the rest of the player, with frame indices counted across all parts
+
+# the number before the extension is the part number, e.g. framedump0.avi
+PART_PATTERN = re.compile(r"^(.*?)(\d+)(\.[^.]+)$")
+
+def dump_parts(video_path) -> list[Path]:
+    """
+    every part of the split dump video_path belongs to, in order, starting from part 0.
+    just [video_path] if it isn't numbered or there aren't any other parts
+    """
+    video_path = Path(video_path)
+    match = PART_PATTERN.match(video_path.name)
+    if not match:
+        return [video_path]
+    prefix, number, suffix = match.groups()
+    parts = []
+    n = 0
+    while (video_path.with_name(f"{prefix}{n}{suffix}")).is_file():
+        parts.append(video_path.with_name(f"{prefix}{n}{suffix}"))
+        n += 1
+    # only a split dump if the chosen file is one of its parts
+    if video_path not in parts or len(parts) < 2:
+        return [video_path]
+    return parts
+
+def split_frames(total: int, parts: int) -> list[tuple[int, int]]:
+    """
+    [start, end) ranges splitting total frames into about equal parts, for handing out to
+    worker processes
+    """
+    parts = max(1, min(parts, total))
+    bounds = [total * i // parts for i in range(parts + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts)]
+
+def open_video(video_path):
+    """
+    opens a video, or all the parts of a split dump as one video
+    """
+    parts = dump_parts(video_path)
+    if len(parts) > 1:
+        return MultiFileSource(parts)
+    return cv2.VideoCapture(str(video_path))
+
+class MultiFileSource():
+    """
+    plays several videos back to back with a cv2.VideoCapture interface. each part's frame
+    count is read once up front, so finding the part a frame is in is a binary search.
+    parts are opened when they're first needed and only a few are kept open at a time
+    """
+    def __init__(self, paths, max_open: int = 2):
+        self.paths    = [Path(p) for p in paths]
+        self.max_open = max(1, max_open)
+        self.caps     = OrderedDict()   # part -> VideoCapture, least recently used first
+        self.part     = 0               # the part the next frame is read from
+        self.position = 0               # global index of the next frame
+
+        counts = []
+        for path in self.paths:
+            cap = cv2.VideoCapture(str(path))
+            if not cap.isOpened():
+                raise IOError(f"Unable to open video part: {path}")
+            if path == self.paths[0]:
+                self.fps    = cap.get(cv2.CAP_PROP_FPS)
+                self.width  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            counts.append(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            cap.release()
+        # offsets[i] is the global index of part i's first frame, the last is the total
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        log(f"Opened split video with {len(self.paths)} parts and {self.offsets[-1]} frames")
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def part_of(self, frame_index: int) -> int:
+        part = int(np.searchsorted(self.offsets, frame_index, side="right")) - 1
+        return max(0, min(part, len(self.paths) - 1))
+
+    def _cap(self, part: int):
+        cap = self.caps.get(part)
+        if cap is not None:
+            self.caps.move_to_end(part)
+            return cap
+        cap = cv2.VideoCapture(str(self.paths[part]))
+        self.caps[part] = cap
+        while len(self.caps) > self.max_open:
+            _, old = self.caps.popitem(last=False)
+            old.release()
+        return cap
+
+    def isOpened(self) -> bool:
+        return len(self.paths) > 0
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.offsets[-1])
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        return self._cap(self.part).get(prop)
+
+    def set(self, prop, value) -> bool:
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        frame_index = int(value)
+        self.part = self.part_of(frame_index)
+        self.position = frame_index
+        return self._cap(self.part).set(cv2.CAP_PROP_POS_FRAMES, frame_index - int(self.offsets[self.part]))
+
+    def grab(self) -> bool:
+        while True:
+            if self._cap(self.part).grab():
+                self.position += 1
+                return True
+            # end of this part, carry on from the start of the next one
+            if self.part + 1 >= len(self.paths):
+                return False
+            self.part += 1
+            self.position = int(self.offsets[self.part])
+            self._cap(self.part).set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def retrieve(self, image = None):
+        return self._cap(self.part).retrieve(image)
+
+    def read(self, image = None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def release(self):
+        for cap in self.caps.values():
+            cap.release()
+        self.caps.clear()